@@ -7,50 +7,108 @@ Script simple et efficace pour imprimante thermique 57mm
 - Optimisé pour vitesse (basse densité) par défaut
 - Option haute densité avec --hd
 - Ajout de texte sous l'image avec --text
+- Tramage au choix avec --dither (floyd, ordered, threshold)
+- Contrôle de flux (--flow-control), envoi par blocs (--chunk-size) et
+  détection de la vitesse la plus rapide acceptée (--probe-baudrate)
 - Vérification automatique du papier
+- Passe par l'application photobooth si elle tourne (imprimante déjà ouverte),
+  sinon imprime directement
 
 Usage:
   python3 script.py --image photo.jpg
   python3 script.py --image photo.jpg --hd
   python3 script.py --image photo.jpg --text "Mon texte en bas"
   python3 script.py --image logo.png --text "Entreprise XYZ" --hd
+  python3 script.py --image photo.jpg --direct
+  python3 script.py --image photo.jpg --direct --dither ordered
+  python3 script.py --image photo.jpg --direct --baudrate 115200 --flow-control rtscts
+  python3 script.py --image photo.jpg --probe-baudrate
 
-Installation: pip install python-escpos Pillow
+Installation: pip install python-escpos Pillow numpy
 """
 
 import warnings
 import logging
 import sys
 import argparse
+import json
 import os
-# Supprimer TOUS les avertissements et messages
-warnings.filterwarnings("ignore")
-logging.getLogger().setLevel(logging.CRITICAL)
+import urllib.error
+import urllib.request
 
-from escpos.printer import Serial
 from PIL import Image, ImageEnhance
 
+from raster_utils import DITHER_MODES, rasterize, raster_commands
+from serial_utils import FLOW_CONTROLS, PROBE_BAUDRATES, STATUS_REQUEST, SerialTransport, is_status_byte
+
 def parse_arguments():
     """Parser les arguments de ligne de commande"""
     parser = argparse.ArgumentParser(description='Impression thermique rapide')
     parser.add_argument('--hd', action='store_true', 
                        help='Haute densité (meilleure qualité, plus lent)')
-    parser.add_argument('--image', type=str, required=True,
-                       help='Chemin vers l\'image à imprimer (obligatoire)')
+    parser.add_argument('--image', type=str,
+                       help='Chemin vers l\'image à imprimer (obligatoire sauf avec --probe-baudrate)')
     parser.add_argument('--text', type=str,
                        help='Texte à ajouter sous l\'image')
     parser.add_argument('--port', type=str, default='/dev/ttyAMA0',
                        help='Port série de l\'imprimante (défaut: /dev/ttyAMA0)')
     parser.add_argument('--baudrate', type=int, default=9600,
                        help='Baudrate de l\'imprimante (défaut: 9600)')
-    return parser.parse_args()
+    parser.add_argument('--server', type=str, default='http://127.0.0.1:5000',
+                       help='Application photobooth à qui confier l\'impression (défaut: http://127.0.0.1:5000)')
+    parser.add_argument('--direct', action='store_true',
+                       help='Imprimer directement sur le port série, sans passer par l\'application')
+    parser.add_argument('--dither', type=str, choices=DITHER_MODES, default='floyd',
+                       help='Tramage en impression directe: floyd (diffusion d\'erreur), ordered (Bayer) ou threshold (défaut: floyd)')
+    parser.add_argument('--flow-control', type=str, choices=FLOW_CONTROLS, default='dsrdtr',
+                       help='Contrôle de flux du port série en impression directe (défaut: dsrdtr)')
+    parser.add_argument('--chunk-size', type=int, default=1024,
+                       help='Taille des blocs envoyés à l\'imprimante en octets (défaut: 1024)')
+    parser.add_argument('--probe-baudrate', action='store_true',
+                       help='Chercher la vitesse la plus rapide à laquelle l\'imprimante répond, puis quitter')
+    parser.add_argument('--dummy', action='store_true',
+                       help='Imprimante factice pour tester sans matériel (implique --direct)')
+    args = parser.parse_args()
+    if not args.image and not args.probe_baudrate:
+        parser.error('l\'argument --image est obligatoire')
+    return args
 
-def connect_printer(serial_port='/dev/ttyAMA0', baudrate=9600):
-    """Connexion à l'imprimante avec paramètres de vitesse"""
-    printer = Serial(devfile=serial_port, baudrate=baudrate, timeout=1)
+def connect_printer(serial_port='/dev/ttyAMA0', baudrate=9600, dummy=False, flow_control='dsrdtr'):
+    """Connexion à l'imprimante avec paramètres de vitesse et de contrôle de flux"""
+    # Import ici : le module reste importable (service d'impression de l'application) sans escpos
+    from escpos.printer import Dummy, Serial
+    if dummy:
+        return Dummy()
+    printer = Serial(devfile=serial_port, baudrate=baudrate, timeout=1,
+                     xonxoff=flow_control == 'xonxoff', dsrdtr=flow_control == 'dsrdtr')
+    if flow_control == 'rtscts':
+        # escpos ne propose pas RTS/CTS : réglé directement sur le port pyserial
+        printer.device.rtscts = True
      
     return printer
 
+def probe_baudrate(serial_port='/dev/ttyAMA0', flow_control='dsrdtr', candidates=PROBE_BAUDRATES):
+    """Trouver la vitesse la plus rapide à laquelle l'imprimante répond (None si aucune)"""
+    for baudrate in candidates:
+        printer = None
+        try:
+            printer = connect_printer(serial_port, baudrate, flow_control=flow_control)
+            printer.device.reset_input_buffer()
+            printer._raw(STATUS_REQUEST)
+            reply = printer._read()
+            if reply and is_status_byte(reply[-1]):
+                # Réinitialiser l'imprimante : oublier les octets reçus aux mauvaises vitesses
+                printer._raw(b'\x1b@')
+                return baudrate
+        except Exception:
+            pass
+        finally:
+            try:
+                printer.close()
+            except Exception:
+                pass
+    return None
+
 def check_paper_status(printer):
     """Vérifier le statut du papier selon les codes de votre imprimante"""
     try:
@@ -96,15 +154,14 @@ def optimize_image(img_path, high_density=False):
       
     return img
 
-def print_image(printer, img, filename, high_density=False):
-    """Imprimer avec densité configurable"""
-    printer.image(
-        img,
-        impl='bitImageRaster',
-        high_density_vertical=high_density,
-        high_density_horizontal=high_density,
-        fragment_height=1920
-    )
+def prepare_image(img_path, high_density=False, dither='floyd'):
+    """Préparer l'impression : image optimisée, tramée et convertie en commandes raster GS v 0"""
+    raster = rasterize(optimize_image(img_path, high_density), dither=dither)
+    return b''.join(raster_commands(raster, high_density=high_density, fragment_height=1920))
+
+def print_image(printer, raster, transport=None):
+    """Envoyer l'image préparée par prepare_image par blocs ; renvoie les statistiques d'envoi"""
+    return (transport or SerialTransport()).send(printer, raster)
 
 def print_text_bottom(printer, text):
     """Imprimer du texte en bas, pleine largeur"""
@@ -125,7 +182,7 @@ def print_text_bottom(printer, text):
     printer.set(align='left')
     printer.set(bold=False)
 
-def print_with_paper_check(printer, optimized_img, filename, high_density, bottom_text):
+def print_with_paper_check(printer, raster, bottom_text, transport=None):
     """Imprimer avec vérification préalable du papier"""
     
     # Vérifier le papier avant d'imprimer
@@ -142,16 +199,58 @@ def print_with_paper_check(printer, optimized_img, filename, high_density, botto
         print(f"✅ {paper_msg}")
     
     # Procéder à l'impression
-    print_image(printer, optimized_img, filename, high_density)
-    print_text_bottom(printer, bottom_text)
-    printer.text("\n\n\n\n")  # 4 retours pour plus d'espace
+    transfer = print_job(printer, raster, bottom_text, transport)
+    print(f"📈 {transfer['bytes']} octets en {transfer['seconds']}s ({transfer['bytes_per_second']} o/s"
+          + (f", attente imprimante {transfer['stall_seconds']}s)" if 'stall_seconds' in transfer else ")"))
     
     return True
 
+def print_job(printer, raster, bottom_text, transport=None):
+    """Imprimer l'image préparée, le texte et l'avance papier (sans vérification)"""
+    transfer = print_image(printer, raster, transport)
+    print_text_bottom(printer, bottom_text)
+    printer.text("\n\n\n\n")  # 4 retours pour plus d'espace
+    return transfer
+
+def print_via_server(server, image_file, bottom_text, high_density):
+    """Confier l'impression au service de l'application ; None si elle ne répond pas"""
+    payload = json.dumps({
+        'image': os.path.abspath(image_file),
+        'text': bottom_text,
+        'hd': high_density,
+    }).encode()
+    request = urllib.request.Request(server.rstrip('/') + '/api/print', data=payload,
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        # 4xx/5xx avec un résultat d'impression JSON, sinon route absente : impression directe
+        try:
+            result = json.loads(e.read())
+        except ValueError:
+            return None
+        return result if 'success' in result else None
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
 def main():
+    # Supprimer TOUS les avertissements et messages
+    warnings.filterwarnings("ignore")
+    logging.getLogger().setLevel(logging.CRITICAL)
+    
     # Parser les arguments
     args = parse_arguments()
     
+    # Détection de la vitesse (l'application ne doit pas tenir le port ouvert)
+    if args.probe_baudrate:
+        baudrate = probe_baudrate(args.port, args.flow_control)
+        if baudrate is None:
+            print(f"Erreur: aucune réponse de l'imprimante sur {args.port}")
+            sys.exit(1)
+        print(f"✅ L'imprimante répond à {baudrate} bauds")
+        sys.exit(0)
+    
     # Vérifier que l'image existe
     image_file = args.image
     if not os.path.exists(image_file):
@@ -166,17 +265,31 @@ def main():
     printer_port = args.port
     printer_baudrate = args.baudrate
     
+    # Client léger : l'application garde l'imprimante ouverte et déjà prête
+    if not (args.direct or args.dummy):
+        result = print_via_server(args.server, image_file, bottom_text, high_density)
+        if result is not None:
+            if result.get('success'):
+                print("✅ Impression terminée")
+                sys.exit(0)
+            if result.get('error_type') == 'no_paper':
+                print("❌ Impression annulée - Plus de papier")
+                sys.exit(2)
+            print(f"Erreur: {result.get('error')}")
+            sys.exit(1)
+    
     # Connexion et impression
+    printer = None
     try:
-        printer = connect_printer(printer_port, printer_baudrate)
+        printer = connect_printer(printer_port, printer_baudrate, dummy=args.dummy,
+                                  flow_control=args.flow_control)
         
         # Traitement de l'image
-        optimized_img = optimize_image(image_file, high_density)
+        raster = prepare_image(image_file, high_density, args.dither)
         
         # Impression avec vérification du papier
-        success = print_with_paper_check(printer, optimized_img, 
-                                       os.path.basename(image_file), 
-                                       high_density, bottom_text)
+        success = print_with_paper_check(printer, raster, bottom_text,
+                                         SerialTransport(chunk_size=args.chunk_size))
         
         if success:
             print("✅ Impression terminée")
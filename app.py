@@ -1,10 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, flash, Response, abort
+from flask import Flask, render_template, request, jsonify, send_from_directory, send_file, redirect, url_for, flash, Response, abort
 import os
 import time
-import subprocess
 import threading
 import asyncio
 import requests
@@ -18,12 +17,26 @@ from runware import Runware, IImageInference
 from config_utils import (
     PHOTOS_FOLDER,
     EFFECT_FOLDER,
+    CATALOG_FILE,
+    CONFIG_FILE,
+    RENDITION_FOLDER,
+    PRINT_RASTER_FOLDER,
+    ALLOWED_EXTENSIONS,
     load_config,
     save_config,
     ensure_directories,
 )
-from camera_utils import UsbCamera, detect_cameras
-from telegram_utils import send_to_telegram
+from camera_utils import UsbCamera, CameraInventory, camera_source_from_config
+from stream_utils import CameraHub, mjpeg_part, parse_rendition, STREAM_SEND_SECONDS
+from shm_utils import CameraClient, SharedMemorySource, DEFAULT_NAME as SHARED_CAMERA_NAME
+from governor_utils import CpuGovernor
+from catalog_utils import PhotoCatalog, SLIDESHOW_REQUESTS
+from rendition_utils import RenditionCache, RENDITION_SIZES
+from metrics_utils import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from storage_utils import PhotoWriter
+from print_utils import PrintService, PrintQueue, PrintRasterCache
+from serial_utils import FLOW_CONTROLS, SerialTransport
+from telegram_utils import submit_to_telegram
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'photobooth_secret_key_2024')
@@ -34,23 +47,16 @@ logger = logging.getLogger(__name__)
 # Initialiser les dossiers nécessaires
 ensure_directories()
 
+# Index des photos (SQLite) : la galerie ne rescanne plus les dossiers
+photo_catalog = PhotoCatalog(CATALOG_FILE, {'photo': PHOTOS_FOLDER, 'effet': EFFECT_FOLDER})
+photo_catalog.reconcile_async()
+ADMIN_PAGE_SIZE = 50
+# Durée max d'un long-poll du diaporama (secondes)
+SLIDESHOW_MAX_WAIT = 30
+
 def check_printer_status():
     """Vérifier l'état de l'imprimante thermique"""
     try:
-        # Vérifier si le module escpos est disponible
-        try:
-            from escpos.printer import Serial
-        except ImportError:
-            return {
-                'status': 'error',
-                'message': 'Module escpos manquant. Installez-le avec: pip install python-escpos',
-                'paper_status': 'unknown'
-            }
-        
-        # Récupérer la configuration de l'imprimante
-        printer_port = config.get('printer_port', '/dev/ttyAMA0')
-        printer_baudrate = config.get('printer_baudrate', 9600)
-        
         # Vérifier si l'imprimante est activée
         if not config.get('printer_enabled', True):
             return {
@@ -59,34 +65,9 @@ def check_printer_status():
                 'paper_status': 'unknown'
             }
         
-        # Tenter de se connecter à l'imprimante
-        try:
-            printer = Serial(printer_port, baudrate=printer_baudrate, timeout=1)
-            
-            # Vérifier l'état du papier (commande ESC/POS standard)
-            printer._raw(b'\x10\x04\x01')  # Commande de statut en temps réel
-            
-            # Lire la réponse (si disponible)
-            # Note: Cette partie peut varier selon le modèle d'imprimante
-            
-            printer.close()
-            
-            return {
-                'status': 'ok',
-                'message': 'Imprimante connectée',
-                'paper_status': 'ok',
-                'port': printer_port,
-                'baudrate': printer_baudrate
-            }
-            
-        except Exception as e:
-            return {
-                'status': 'error',
-                'message': f'Erreur de connexion: {str(e)}',
-                'paper_status': 'unknown',
-                'port': printer_port,
-                'baudrate': printer_baudrate
-            }
+        # Connexion gardée ouverte par le service d'impression (vérifiée maintenant si libre)
+        print_queue.start()
+        return print_queue.printer_status()
             
     except Exception as e:
         return {
@@ -139,24 +120,157 @@ def detect_serial_ports():
 
 # Variables globales
 config = load_config()
+config_mtime = os.stat(CONFIG_FILE).st_mtime_ns if os.path.exists(CONFIG_FILE) else None
+# Dernière photo prise par ce processus ; le navigateur renvoie le nom (plusieurs workers)
 current_photo = None
 camera_active = False
-camera_process = None
-usb_camera = None
+camera_hub = None
+camera_hub_lock = threading.Lock()
+camera_client = None
+camera_inventory = CameraInventory()
+
+# Gouverneur CPU : dégrader l'aperçu pendant l'impression et les effets IA
+governor = CpuGovernor(
+    profiles={
+        'reduced': (config.get('governor_reduced_fps', 10), config.get('governor_reduced_height', 480),
+                    config.get('governor_reduced_quality', 70)),
+        'minimal': (config.get('governor_minimal_fps', 5), config.get('governor_minimal_height', 360),
+                    config.get('governor_minimal_quality', 60)),
+    },
+    high_cpu=config.get('governor_high_cpu', 85),
+    enabled=config.get('governor_enabled', True),
+)
+
+def apply_preview_profile(max_fps, max_height, quality):
+    """Appliquer le profil du gouverneur au hub caméra en cours"""
+    hub = camera_hub
+    if hub:
+        hub.set_throttle(max_fps, max_height, quality)
+    if shared_camera_enabled():
+        # L'aperçu est encodé par le processus de capture : lui transmettre taille et qualité
+        try:
+            get_camera_client().set_throttle(max_fps, max_height, quality)
+        except Exception as e:
+            logger.info(f"[CAMERA] Processus de capture injoignable (throttle): {e}")
+
+governor.add_listener(apply_preview_profile)
+
+# Miniatures et versions écran, générées en arrière-plan après chaque photo
+rendition_cache = RenditionCache(RENDITION_FOLDER,
+                                 max_bytes=int(config.get('rendition_cache_mb', 256) * 1024 * 1024),
+                                 governor=governor)
+
+# Écriture des photos en arrière-plan : la capture ne dépend plus de la vitesse de la carte SD
+photo_writer = PhotoWriter(max_pending=config.get('storage_queue_size', 16),
+                           fsync=config.get('storage_fsync', 'always'))
+
+# Images d'impression préparées dès l'enregistrement des photos, avant l'appui sur Imprimer
+print_rasters = PrintRasterCache(PRINT_RASTER_FOLDER,
+                                 max_bytes=int(config.get('print_cache_mb', 32) * 1024 * 1024),
+                                 governor=governor)
+
+# Service d'impression : imprimante ouverte en permanence, plus de sous-processus par impression
+print_service = PrintService(config.get('printer_port', '/dev/ttyAMA0'), config.get('printer_baudrate', 9600),
+                             health_interval=config.get('printer_health_interval', 30),
+                             dither=config.get('print_dither', 'floyd'), rasters=print_rasters,
+                             flow_control=config.get('printer_flow_control', 'dsrdtr'),
+                             transport=SerialTransport(chunk_size=config.get('printer_chunk_size', 1024)))
+
+# File d'impression persistante (SQLite) : les routes rendent la main tout de suite
+print_queue = PrintQueue(CATALOG_FILE, print_service, governor=governor,
+                         on_finished=lambda job: photo_catalog.mark_printed(job['filename']))
+
+@app.before_request
+def start_print_queue():
+    """Démarrer l'impression avec la première requête, pas à l'import
+
+    Sous le rechargeur de Werkzeug (python3 app.py, debug), le processus parent
+    importe aussi ce module mais ne sert aucune requête : il ne doit ni ouvrir
+    l'imprimante ni prendre le verrou de la file.
+    """
+    if config.get('printer_enabled', True):
+        print_queue.start()
+
+def print_options():
+    """Texte de pied de page et haute densité selon la configuration"""
+    return {
+        'text': config.get('footer_text', ''),
+        'high_density': config.get('print_resolution', 384) > 384,
+    }
+
+def on_photo_saved(path):
+    """Après l'écriture d'une photo : index, miniatures, image d'impression et envoi Telegram"""
+    kind = 'effet' if os.path.dirname(path) == EFFECT_FOLDER else 'photo'
+    photo_catalog.add(kind, os.path.basename(path))
+    rendition_cache.submit(path)
+    if config.get('printer_enabled', True):
+        print_service.prepare(path, print_options()['high_density'])
+    
+    # Envoyer sur Telegram si activé
+    send_type = config.get('telegram_send_type', 'photos')
+    if send_type in ['photos' if kind == 'photo' else 'effet', 'both']:
+        submit_to_telegram(path, config, kind)
+
+@app.before_request
+def reload_config():
+    """Relire config.json s'il a changé : avec plusieurs workers, /admin/save n'en met à jour qu'un"""
+    global config, config_mtime
+    try:
+        mtime = os.stat(CONFIG_FILE).st_mtime_ns
+    except OSError:
+        return
+    if mtime != config_mtime:
+        config_mtime = mtime
+        config = load_config()
+
+def requested_photo():
+    """Photo visée par la page de révision : nom envoyé par le navigateur, sinon la dernière de ce processus"""
+    data = request.get_json(silent=True) or {}
+    filename = data.get('photo') or request.args.get('photo')
+    if not filename:
+        return current_photo
+    # Un simple nom de fichier, jamais un chemin
+    filename = os.path.basename(filename)
+    return filename if filename.rsplit('.', 1)[-1].lower() in ALLOWED_EXTENSIONS else None
+
+def find_photo(filename, timeout=2.0):
+    """Chemin de la photo (dossier photos, sinon effet), None si introuvable
+
+    La photo peut être encore en cours d'écriture, dans ce processus ou dans
+    le worker qui l'a prise : attendre qu'elle apparaisse.
+    """
+    photo_writer.wait_for(filename, timeout)
+    deadline = time.monotonic() + timeout
+    while True:
+        for folder in (PHOTOS_FOLDER, EFFECT_FOLDER):
+            path = os.path.join(folder, filename)
+            if os.path.isfile(path):
+                return path
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.05)
 
 @app.route('/')
 def index():
     """Page principale avec aperçu vidéo"""
     return render_template('index.html', timer=config['timer_seconds'])
 
-# Variable globale pour stocker la dernière frame MJPEG
-last_frame = None
-frame_lock = threading.Lock()
-
 @app.route('/capture', methods=['POST'])
 def capture_photo():
     """Capturer la frame MJPEG actuelle directement depuis le flux vidéo"""
-    global current_photo, last_frame
+    global current_photo
+    
+    # Instant exact du déclencheur : horodatage absolu ou âge relatif envoyé par le navigateur
+    received_at = time.time()
+    data = request.get_json(silent=True) or {}
+    target_timestamp = None
+    try:
+        if data.get('timestamp') is not None:
+            target_timestamp = float(data['timestamp'])
+        elif data.get('shutter_age_ms') is not None:
+            target_timestamp = received_at - float(data['shutter_age_ms']) / 1000
+    except (TypeError, ValueError):
+        target_timestamp = None
     
     try:
         # Générer un nom de fichier unique
@@ -164,25 +278,20 @@ def capture_photo():
         filename = f'photo_{timestamp}.jpg'
         filepath = os.path.join(PHOTOS_FOLDER, filename)
         
-        # Capturer la frame actuelle du flux MJPEG
-        with frame_lock:
-            if last_frame is not None:
-                # Sauvegarder la frame directement
-                with open(filepath, 'wb') as f:
-                    f.write(last_frame)
-                
-                current_photo = filename
-                logger.info(f"Frame MJPEG capturée avec succès: {filename}")
-                
-                # Envoyer sur Telegram si activé
-                send_type = config.get('telegram_send_type', 'photos')
-                if send_type in ['photos', 'both']:
-                    threading.Thread(target=send_to_telegram, args=(filepath, config, "photo")).start()
-                
-                return jsonify({'success': True, 'filename': filename})
-            else:
-                logger.info("Aucune frame disponible dans le flux")
-                return jsonify({'success': False, 'error': 'Aucune frame disponible'})
+        # Capturer une photo pleine résolution (ou la frame d'aperçu si le budget est dépassé)
+        budget = config.get('capture_budget_ms', 3000) / 1000
+        photo_data = capture_still(budget, target_timestamp)
+        if photo_data is not None:
+            # Sauvegarder la photo en arrière-plan (index, miniatures et Telegram une fois écrite)
+            photo_writer.submit(filepath, photo_data, on_saved=on_photo_saved)
+            
+            current_photo = filename
+            logger.info(f"Frame MJPEG capturée avec succès: {filename}")
+            
+            return jsonify({'success': True, 'filename': filename})
+        else:
+            logger.info("Aucune frame disponible dans le flux")
+            return jsonify({'success': False, 'error': 'Aucune frame disponible'})
             
     except Exception as e:
         logger.info(f"Erreur lors de la capture: {e}")
@@ -191,16 +300,16 @@ def capture_photo():
 @app.route('/review')
 def review_photo():
     """Page de révision de la photo"""
-    if not current_photo:
+    photo = requested_photo()
+    if not photo:
         return redirect(url_for('index'))
-    return render_template('review.html', photo=current_photo, config=config)
+    return render_template('review.html', photo=photo, config=config)
 
 @app.route('/print_photo', methods=['POST'])
 def print_photo():
     """Imprimer la photo actuelle"""
-    global current_photo
-    
-    if not current_photo:
+    photo = requested_photo()
+    if not photo:
         return jsonify({'success': False, 'error': 'Aucune photo à imprimer'})
     
     try:
@@ -208,52 +317,14 @@ def print_photo():
         if not config.get('printer_enabled', True):
             return jsonify({'success': False, 'error': 'Imprimante désactivée dans la configuration'})
         
-        # Chercher la photo dans le bon dossier
-        photo_path = None
-        if os.path.exists(os.path.join(PHOTOS_FOLDER, current_photo)):
-            photo_path = os.path.join(PHOTOS_FOLDER, current_photo)
-        elif os.path.exists(os.path.join(EFFECT_FOLDER, current_photo)):
-            photo_path = os.path.join(EFFECT_FOLDER, current_photo)
-        else:
+        # Chercher la photo dans le bon dossier (une fois son écriture terminée)
+        photo_path = find_photo(photo)
+        if photo_path is None:
             return jsonify({'success': False, 'error': 'Photo introuvable'})
         
-        # Vérifier l'existence du script d'impression
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ScriptPythonPOS.py')
-        if not os.path.exists(script_path):
-            return jsonify({'success': False, 'error': 'Script d\'impression introuvable (ScriptPythonPOS.py)'})
-        
-        # Construire la commande d'impression avec les nouveaux paramètres
-        cmd = ['python3', 'ScriptPythonPOS.py', '--image', photo_path]
-        
-        # Ajouter les paramètres de port et baudrate
-        printer_port = config.get('printer_port', '/dev/ttyAMA0')
-        printer_baudrate = config.get('printer_baudrate', 9600)
-        cmd.extend(['--port', printer_port, '--baudrate', str(printer_baudrate)])
-        
-        # Ajouter le texte de pied de page si configuré
-        footer_text = config.get('footer_text', '')
-        if footer_text:
-            cmd.extend(['--text', footer_text])
-        
-        # Ajouter l'option haute résolution selon la configuration
-        print_resolution = config.get('print_resolution', 384)
-        if print_resolution > 384:
-            cmd.append('--hd')
-        
-        # Exécuter l'impression
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
-        
-        if result.returncode == 0:
-            return jsonify({'success': True, 'message': 'Photo imprimée avec succès!'})
-        elif result.returncode == 2:
-            # Code d'erreur spécifique pour manque de papier
-            return jsonify({'success': False, 'error': 'Plus de papier dans l\'imprimante', 'error_type': 'no_paper'})
-        else:
-            error_msg = result.stderr.strip() if result.stderr else 'Erreur inconnue'
-            if 'ModuleNotFoundError' in error_msg and 'escpos' in error_msg:
-                return jsonify({'success': False, 'error': 'Module escpos manquant. Installez-le avec: pip install python-escpos'})
-            else:
-                return jsonify({'success': False, 'error': f'Erreur d\'impression: {error_msg}'})
+        # Ajouter à la file d'impression : la réponse n'attend pas l'imprimante
+        job = print_queue.submit(photo_path, **print_options())
+        return jsonify({'success': True, 'message': 'Photo ajoutée à la file d\'impression', 'job': job})
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -263,18 +334,19 @@ def delete_current_photo():
     """Supprimer la photo actuelle (depuis photos ou effet)"""
     global current_photo
     
-    if current_photo:
+    photo = requested_photo()
+    if photo:
         try:
-            # Chercher la photo dans le bon dossier
-            photo_path = None
-            if os.path.exists(os.path.join(PHOTOS_FOLDER, current_photo)):
-                photo_path = os.path.join(PHOTOS_FOLDER, current_photo)
-            elif os.path.exists(os.path.join(EFFECT_FOLDER, current_photo)):
-                photo_path = os.path.join(EFFECT_FOLDER, current_photo)
+            # Chercher la photo dans le bon dossier (une fois son écriture terminée)
+            photo_path = find_photo(photo)
             
             if photo_path and os.path.exists(photo_path):
+                print_rasters.discard(photo_path)
                 os.remove(photo_path)
-                current_photo = None
+                photo_catalog.remove(photo, 'photo' if photo_path.startswith(PHOTOS_FOLDER) else 'effet')
+                rendition_cache.discard(photo)
+                if current_photo == photo:
+                    current_photo = None
                 return jsonify({'success': True})
             else:
                 return jsonify({'success': False, 'error': 'Photo introuvable'})
@@ -286,9 +358,8 @@ def delete_current_photo():
 @app.route('/apply_effect', methods=['POST'])
 def apply_effect():
     """Appliquer un effet IA à la photo actuelle"""
-    global current_photo
-    
-    if not current_photo:
+    photo = requested_photo()
+    if not photo:
         return jsonify({'success': False, 'error': 'Aucune photo à traiter'})
     
     if not config.get('effect_enabled', False):
@@ -298,13 +369,13 @@ def apply_effect():
         return jsonify({'success': False, 'error': 'Clé API Runware manquante'})
     
     try:
-        # Chemin de la photo actuelle
-        photo_path = os.path.join(PHOTOS_FOLDER, current_photo)
+        # Chemin de la photo actuelle (les effets s'appliquent aux photos d'origine)
+        photo_path = find_photo(photo)
         
-        if not os.path.exists(photo_path):
+        if photo_path is None or os.path.dirname(photo_path) != PHOTOS_FOLDER:
             return jsonify({'success': False, 'error': 'Photo introuvable'})
         
-        # Exécuter la fonction asynchrone
+        # Exécuter la fonction asynchrone (l'aperçu n'est allégé que pendant le travail local)
         result = asyncio.run(apply_effect_async(photo_path))
         return result
             
@@ -329,9 +400,9 @@ async def apply_effect_async(photo_path):
         await runware.connect()
         logger.info("[DEBUG IA] Connexion établie avec succès")
         
-        # Lire et encoder l'image en base64
+        # Lire et encoder l'image en base64 (aperçu allégé)
         logger.info("[DEBUG IA] Lecture et encodage de l'image...")
-        with open(photo_path, 'rb') as img_file:
+        with governor.job('effect'), open(photo_path, 'rb') as img_file:
             img_data = img_file.read()
             img_base64 = base64.b64encode(img_data).decode('utf-8')
         logger.info(f"[DEBUG IA] Image encodée: {len(img_base64)} caractères base64")
@@ -366,7 +437,9 @@ async def apply_effect_async(photo_path):
             logger.info(f"[DEBUG IA] URL de l'image générée: {images[0].imageURL}")
             logger.info("[DEBUG IA] Téléchargement de l'image transformée...")
             import requests
-            response = requests.get(images[0].imageURL)
+            # Téléchargement et sauvegarde : aperçu allégé, pas pendant l'inférence distante
+            with governor.job('effect'):
+                response = requests.get(images[0].imageURL)
             logger.info(f"[DEBUG IA] Statut de téléchargement: {response.status_code}")
             
             if response.status_code == 200:
@@ -383,21 +456,18 @@ async def apply_effect_async(photo_path):
                 effect_path = os.path.join(EFFECT_FOLDER, effect_filename)
                 logger.info(f"[DEBUG IA] Sauvegarde vers: {effect_path}")
                 
-                # Sauvegarder l'image avec effet
-                with open(effect_path, 'wb') as f:
-                    f.write(response.content)
-                logger.info("[DEBUG IA] Image sauvegardée avec succès")
+                # Sauvegarder l'image avec effet (Telegram une fois écrite) ; la page de revue
+                # attend de toute façon le fichier, l'écriture reste donc dans le travail allégé
+                with governor.job('effect'):
+                    photo_writer.submit(effect_path, response.content, on_saved=on_photo_saved)
+                    photo_writer.wait_for(effect_filename)
+                logger.info("[DEBUG IA] Image écrite")
                 
                 # Mettre à jour la photo actuelle
                 current_photo = effect_filename
                 logger.info(f"[DEBUG IA] Photo actuelle mise à jour: {current_photo}")
                 logger.info("[DEBUG IA] Effet appliqué avec succès!")
                 
-                # Envoyer sur Telegram si activé
-                send_type = config.get('telegram_send_type', 'photos')
-                if send_type in ['effet', 'both']:
-                    threading.Thread(target=send_to_telegram, args=(effect_path, config, "effet")).start()
-                
                 return jsonify({
                     'success': True, 
                     'message': 'Effet appliqué avec succès!',
@@ -424,50 +494,25 @@ def admin():
     if not os.path.exists(EFFECT_FOLDER):
         os.makedirs(EFFECT_FOLDER)
     
-    # Récupérer la liste des photos avec leurs métadonnées
-    photos = []
-    
-    # Récupérer les photos du dossier PHOTOS_FOLDER
-    if os.path.exists(PHOTOS_FOLDER):
-        for filename in os.listdir(PHOTOS_FOLDER):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                file_path = os.path.join(PHOTOS_FOLDER, filename)
-                file_size_kb = os.path.getsize(file_path) / 1024  # Taille en KB
-                file_date = datetime.fromtimestamp(os.path.getmtime(file_path))
-                
-                photos.append({
-                    'filename': filename,
-                    'size_kb': file_size_kb,
-                    'date': file_date.strftime("%d/%m/%Y %H:%M"),
-                    'type': 'photo',
-                    'folder': PHOTOS_FOLDER
-                })
-    
-    # Récupérer les photos du dossier EFFECT_FOLDER
-    if os.path.exists(EFFECT_FOLDER):
-        for filename in os.listdir(EFFECT_FOLDER):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                file_path = os.path.join(EFFECT_FOLDER, filename)
-                file_size_kb = os.path.getsize(file_path) / 1024  # Taille en KB
-                file_date = datetime.fromtimestamp(os.path.getmtime(file_path))
-                
-                photos.append({
-                    'filename': filename,
-                    'size_kb': file_size_kb,
-                    'date': file_date.strftime("%d/%m/%Y %H:%M"),
-                    'type': 'effet',
-                    'folder': EFFECT_FOLDER
-                })
-    
-    # Trier les photos par date (plus récentes en premier)
-    photos.sort(key=lambda x: datetime.strptime(x['date'], "%d/%m/%Y %H:%M"), reverse=True)
+    # Une page de la galerie depuis l'index (temps constant quel que soit le nombre de photos)
+    page = max(request.args.get('page', 1, type=int), 1)
+    sort = request.args.get('sort', 'date')
+    photos = [{
+        'filename': entry['filename'],
+        'size_kb': entry['size'] / 1024,  # Taille en KB
+        'date': datetime.fromtimestamp(entry['mtime']).strftime("%d/%m/%Y %H:%M"),
+        'type': entry['kind'],
+        'folder': entry['folder'],
+    } for entry in photo_catalog.page(page, ADMIN_PAGE_SIZE, sort=sort, descending=sort != 'name')]
     
     # Compter les photos de chaque type
-    photo_count = sum(1 for p in photos if p['type'] == 'photo')
-    effect_count = sum(1 for p in photos if p['type'] == 'effet')
+    counts = photo_catalog.counts()
+    photo_count = counts['photo']
+    effect_count = counts['effet']
+    page_count = max((photo_count + effect_count + ADMIN_PAGE_SIZE - 1) // ADMIN_PAGE_SIZE, 1)
     
-    # Détecter les caméras USB disponibles
-    available_cameras = detect_cameras()
+    # Caméras USB depuis l'inventaire en cache (la caméra active n'est jamais sondée)
+    available_cameras = camera_inventory.get(busy_ids=active_usb_camera_ids())
     
     # Détecter les ports série disponibles
     available_serial_ports = detect_serial_ports()
@@ -480,7 +525,11 @@ def admin():
                            photos=photos,
                            photo_count=photo_count,
                            effect_count=effect_count,
+                           page=page,
+                           page_count=page_count,
+                           sort=sort,
                            available_cameras=available_cameras,
+                           camera_scan_in_progress=camera_inventory.scanning,
                            available_serial_ports=available_serial_ports,
                            show_toast=request.args.get('show_toast', False))
 
@@ -490,6 +539,9 @@ def save_admin_config():
     global config
     
     try:
+        camera_type_before = config.get('camera_type', 'picamera')
+        usb_camera_id_before = config.get('usb_camera_id', 0)
+        
         config['footer_text'] = request.form.get('footer_text', '')
         
         # Gestion sécurisée des champs numériques
@@ -536,6 +588,9 @@ def save_admin_config():
         except ValueError:
             config['printer_baudrate'] = 9600
         
+        printer_flow_control = request.form.get('printer_flow_control', 'dsrdtr')
+        config['printer_flow_control'] = printer_flow_control if printer_flow_control in FLOW_CONTROLS else 'dsrdtr'
+        
         print_resolution = request.form.get('print_resolution', '384').strip()
         try:
             config['print_resolution'] = int(print_resolution)
@@ -543,6 +598,18 @@ def save_admin_config():
             config['print_resolution'] = 384
         
         save_config(config)
+        
+        # Rouvrir l'imprimante si le port, la vitesse ou le contrôle de flux ont changé (même si un autre processus la détient)
+        print_queue.configure(config['printer_port'], config['printer_baudrate'], config['printer_flow_control'])
+        if config['printer_enabled']:
+            print_queue.start()
+        
+        # Redémarrer la caméra partagée si sa configuration a changé
+        if (camera_type_before, usb_camera_id_before) != (config['camera_type'], config['usb_camera_id']):
+            stop_camera_process()
+            if shared_camera_enabled():
+                forward_camera_command('restart')
+        
         flash('Configuration sauvegardée avec succès!', 'success')
         
     except Exception as e:
@@ -550,25 +617,29 @@ def save_admin_config():
     
     return redirect(url_for('admin'))
 
+@app.route('/admin/rescan_cameras', methods=['POST'])
+def rescan_cameras():
+    """Relancer la détection des caméras USB en arrière-plan"""
+    started = camera_inventory.rescan(busy_ids=active_usb_camera_ids())
+    return jsonify({'success': True, 'started': started})
+
 @app.route('/admin/delete_photos', methods=['POST'])
 def delete_all_photos():
     """Supprimer toutes les photos (normales et avec effet)"""
     try:
         deleted_count = 0
         
-        # Supprimer les photos normales
-        if os.path.exists(PHOTOS_FOLDER):
-            for filename in os.listdir(PHOTOS_FOLDER):
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    os.remove(os.path.join(PHOTOS_FOLDER, filename))
-                    deleted_count += 1
-        
-        # Supprimer les photos avec effet
-        if os.path.exists(EFFECT_FOLDER):
-            for filename in os.listdir(EFFECT_FOLDER):
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    os.remove(os.path.join(EFFECT_FOLDER, filename))
+        # Supprimer les photos indexées (normales et avec effet), sans rescanner les dossiers
+        for kind, folder in photo_catalog.folders.items():
+            for filename in photo_catalog.filenames(kind):
+                try:
+                    os.remove(os.path.join(folder, filename))
                     deleted_count += 1
+                except FileNotFoundError:
+                    pass
+        photo_catalog.clear()
+        rendition_cache.clear()
+        print_rasters.clear()
         
         flash(f'{deleted_count} photo(s) supprimée(s) avec succès!', 'success')
     except Exception as e:
@@ -581,6 +652,7 @@ def download_photo(filename):
     """Télécharger une photo spécifique"""
     try:
         # Chercher la photo dans les deux dossiers
+        photo_writer.wait_for(filename)
         if os.path.exists(os.path.join(PHOTOS_FOLDER, filename)):
             return send_from_directory(PHOTOS_FOLDER, filename, as_attachment=True)
         elif os.path.exists(os.path.join(EFFECT_FOLDER, filename)):
@@ -597,6 +669,7 @@ def reprint_photo(filename):
     """Réimprimer une photo spécifique"""
     try:
         # Chercher la photo dans les deux dossiers
+        photo_writer.wait_for(filename)
         photo_path = None
         if os.path.exists(os.path.join(PHOTOS_FOLDER, filename)):
             photo_path = os.path.join(PHOTOS_FOLDER, filename)
@@ -604,39 +677,8 @@ def reprint_photo(filename):
             photo_path = os.path.join(EFFECT_FOLDER, filename)
         
         if photo_path:
-            # Vérifier si le script d'impression existe
-            script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ScriptPythonPOS.py')
-            if not os.path.exists(script_path):
-                flash('Script d\'impression introuvable (ScriptPythonPOS.py)', 'error')
-                return redirect(url_for('admin'))
-            
-            # Utiliser le script d'impression existant
-            import subprocess
-            cmd = [
-                'python3', 'ScriptPythonPOS.py',
-                '--image', photo_path
-            ]
-            
-            # Ajouter le texte de pied de page si défini
-            footer_text = config.get('footer_text', '')
-            if footer_text:
-                cmd.extend(['--text', footer_text])
-            
-            # Ajouter l'option HD si la résolution est élevée
-            print_resolution = config.get('print_resolution', 384)
-            if print_resolution > 384:
-                cmd.append('--hd')
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
-            
-            if result.returncode == 0:
-                flash('Photo réimprimée avec succès!', 'success')
-            else:
-                error_msg = result.stderr.strip() if result.stderr else 'Erreur inconnue'
-                if 'ModuleNotFoundError' in error_msg and 'escpos' in error_msg:
-                    flash('Module escpos manquant. Installez-le avec: pip install python-escpos', 'error')
-                else:
-                    flash(f'Erreur d\'impression: {error_msg}', 'error')
+            job = print_queue.submit(photo_path, **print_options())
+            flash(f'Réimpression ajoutée à la file (position {job["position"]})', 'success')
         else:
             flash('Photo introuvable', 'error')
     except Exception as e:
@@ -644,27 +686,135 @@ def reprint_photo(filename):
     
     return redirect(url_for('admin'))
 
+def slideshow_params():
+    """Paramètres ?since= (curseur du catalogue) et ?wait= (secondes, long-poll)"""
+    since = request.args.get('since', type=int)
+    wait = request.args.get('wait', 0.0, type=float)
+    return since, min(max(wait, 0.0), SLIDESHOW_MAX_WAIT)
+
 @app.route('/api/slideshow')
 def get_slideshow_data():
-    """API pour récupérer les données du diaporama"""
-    photos = []
-    
-    # Déterminer le dossier source selon la configuration
-    source_folder = EFFECT_FOLDER if config.get('slideshow_source', 'photos') == 'effet' else PHOTOS_FOLDER
-    
-    if os.path.exists(source_folder):
-        for filename in os.listdir(source_folder):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                photos.append(filename)
-    
-    photos.sort(reverse=True)  # Plus récentes en premier
-    
-    return jsonify({
+    """API pour récupérer les données du diaporama
+
+    Sans paramètre : liste complète ('photos'). Avec ?since=<cursor> : seulement
+    les photos ajoutées ('added') et supprimées ('removed') depuis, ou la liste
+    complète si le curseur est trop ancien ('reset'). ?wait=<secondes> garde la
+    requête ouverte jusqu'à l'arrivée d'une nouvelle photo. L'ETag suit le
+    curseur et la configuration : un If-None-Match inchangé reçoit 304.
+    """
+    # Déterminer la source selon la configuration (plus récentes en premier)
+    source = config.get('slideshow_source', 'photos')
+    source_kind = 'effet' if source == 'effet' else 'photo'
+    since, wait = slideshow_params()
+    if wait and since is not None and since == photo_catalog.cursor():
+        photo_catalog.wait_for_change(since, wait)
+
+    cursor, added, removed, reset = photo_catalog.changes(source_kind, since)
+    data = {
         'enabled': config.get('slideshow_enabled', False),
         'delay': config.get('slideshow_delay', 60),
-        'source': config.get('slideshow_source', 'photos'),
-        'photos': photos
-    })
+        'source': source,
+        'cursor': cursor,
+    }
+    if reset:
+        data['photos'] = added
+        data['reset'] = since is not None
+    else:
+        data['added'] = added
+        data['removed'] = removed
+
+    response = jsonify(data)
+    response.set_etag(f"{cursor}-{data['enabled']:d}-{data['delay']}-{source}")
+    response.headers['Cache-Control'] = 'no-cache'
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        SLIDESHOW_REQUESTS.labels('not_modified').inc()
+    else:
+        SLIDESHOW_REQUESTS.labels('full' if reset else 'delta').inc()
+    return response
+
+@app.route('/api/camera_status')
+def get_camera_status():
+    """API pour consulter l'état de la caméra (mode de capture, CPU par frame, fps)"""
+    stats = camera_hub.get_stats() if camera_hub else {'running': False}
+    stats['governor'] = governor.get_stats()
+    return jsonify(stats)
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Métriques du pipeline vidéo au format texte Prometheus"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/print', methods=['POST'])
+def api_print():
+    """Imprimer une image via le service (utilisé par ScriptPythonPOS.py en client léger)"""
+    # Réservé à la machine locale : le chemin de l'image est lu sur le disque du serveur
+    if request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(403)
+    data = request.get_json(silent=True) or {}
+    image_path = data.get('image')
+    if not image_path or not os.path.isfile(image_path):
+        return jsonify({'success': False, 'error': f"Image '{image_path}' non trouvée"}), 404
+    if not config.get('printer_enabled', True):
+        return jsonify({'success': False, 'error': 'Imprimante désactivée dans la configuration'}), 503
+    
+    # Passer par la file (l'ordre des impressions est respecté) et attendre le résultat
+    job = print_queue.submit(image_path, text=data.get('text'), high_density=bool(data.get('hd')))
+    deadline = time.monotonic() + 300
+    while job['state'] in ('queued', 'printing') and not job['blocked'] and time.monotonic() < deadline:
+        job = print_queue.wait(job['id'], 1.0)
+    if job['blocked'] == 'no_paper':
+        # Comme en impression directe : pas de travail laissé en attente
+        print_queue.cancel(job['id'])
+        return jsonify({'success': False, 'error': 'Plus de papier dans l\'imprimante', 'error_type': 'no_paper'})
+    if job['state'] != 'done':
+        return jsonify({'success': False, 'error': job['error'] or f"Travail {job['id']}: {job['state']}",
+                        'error_type': job['error_type']})
+    return jsonify({'success': True})
+
+@app.route('/api/printer/probe_baudrate', methods=['POST'])
+def probe_printer_baudrate():
+    """Chercher la vitesse la plus rapide à laquelle l'imprimante répond"""
+    if not config.get('printer_enabled', True):
+        return jsonify({'success': False, 'error': 'Imprimante désactivée dans la configuration'}), 503
+    # Seul le processus qui détient l'imprimante peut libérer et rouvrir le port : la file lui transmet la demande
+    try:
+        baudrate = print_queue.probe_baudrate()
+    except TimeoutError as e:
+        return jsonify({'success': False, 'error': str(e)}), 504
+    if baudrate is None:
+        return jsonify({'success': False, 'error': f"Aucune réponse de l'imprimante sur {print_service.port}"})
+    return jsonify({'success': True, 'baudrate': baudrate})
+
+@app.route('/api/print_jobs')
+def list_print_jobs():
+    """File d'impression : travaux en cours et en attente (position, ETA), puis les derniers terminés"""
+    stats = print_queue.stats()
+    stats['rasters'] = print_rasters.get_stats()
+    return jsonify({'jobs': print_queue.jobs(), 'stats': stats})
+
+@app.route('/api/print_jobs/<int:job_id>')
+def get_print_job(job_id):
+    job = print_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Travail introuvable'}), 404
+    return jsonify(job)
+
+@app.route('/api/print_jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_print_job(job_id):
+    """Annuler un travail pas encore commencé"""
+    job = print_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Travail introuvable ou déjà commencé'}), 409
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/print_jobs/<int:job_id>/retry', methods=['POST'])
+def retry_print_job(job_id):
+    """Relancer un travail en échec ou annulé (nouveau travail en fin de file)"""
+    job = print_queue.retry(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Travail introuvable, en attente ou déjà imprimé'}), 409
+    return jsonify({'success': True, 'job': job})
 
 @app.route('/api/printer_status')
 def get_printer_status():
@@ -673,122 +823,124 @@ def get_printer_status():
 
 @app.route('/photos/<filename>')
 def serve_photo(filename):
-    """Servir les photos"""
-    # Vérifier d'abord dans le dossier photos
-    if os.path.exists(os.path.join(PHOTOS_FOLDER, filename)):
-        return send_from_directory(PHOTOS_FOLDER, filename)
-    # Sinon vérifier dans le dossier effet
-    elif os.path.exists(os.path.join(EFFECT_FOLDER, filename)):
-        return send_from_directory(EFFECT_FOLDER, filename)
-    else:
+    """Servir les photos
+    
+    ?size=thumb ou ?size=screen sert une version réduite depuis le cache
+    (générée à la volée si absente), avec un ETag fort.
+    """
+    size = request.args.get('size')
+    if size is not None and size not in RENDITION_SIZES:
+        abort(400)
+    # Vérifier d'abord dans le dossier photos, sinon dans le dossier effet
+    photo_path = find_photo(filename)
+    if photo_path is None:
         abort(404)
+    folder = os.path.dirname(photo_path)
+    if size is None:
+        return send_from_directory(folder, filename)
+    source_path = os.path.join(folder, os.path.basename(filename))
+    try:
+        rendition_path = rendition_cache.get(source_path, size)
+    except FileNotFoundError:
+        abort(404)
+    return send_file(rendition_path, mimetype='image/jpeg', conditional=True,
+                     etag=rendition_cache.etag(rendition_path, size), max_age=60)
 
 @app.route('/video_stream')
 def video_stream():
-    """Flux vidéo MJPEG en temps réel"""
-    return Response(generate_video_stream(),
+    """Flux vidéo MJPEG en temps réel
+    
+    Paramètres optionnels: ?fps= pour limiter le débit du client,
+    ?rendition= (full, 720p, 360p, q50, 360p-q40...) pour la taille/qualité.
+    """
+    max_fps = request.args.get('fps', type=float)
+    if max_fps is not None and max_fps <= 0:
+        max_fps = None
+    try:
+        rendition = parse_rendition(request.args.get('rendition'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return Response(generate_video_stream(request.remote_addr, max_fps, rendition),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
-def generate_video_stream():
-    """Générer le flux vidéo MJPEG selon le type de caméra configuré"""
-    global camera_process, usb_camera, last_frame
-    
-    # Déterminer le type de caméra à utiliser
-    camera_type = config.get('camera_type', 'picamera')
-    
+def create_camera_source():
+    """Créer la source caméra selon le type configuré"""
+    # Plusieurs workers : lire les frames du processus de capture en mémoire partagée
+    if shared_camera_enabled():
+        logger.info("[CAMERA] Lecture du processus de capture (mémoire partagée)...")
+        return SharedMemorySource(config.get('shared_camera_name', SHARED_CAMERA_NAME), get_camera_client(),
+                                  wanted=shared_camera_wanted)
+    return camera_source_from_config(config)
+
+def shared_camera_wanted():
+    """Ce worker a-t-il des spectateurs actifs ? Sinon le processus de capture peut cesser d'encoder"""
+    hub = camera_hub
+    return bool(hub and not hub.paused and hub.subscriber_count())
+
+def shared_camera_enabled():
+    """La caméra appartient-elle à un processus de capture dédié ? (gunicorn multi-workers)"""
+    return bool(config.get('shared_camera', False) or os.environ.get('SIMPLEBOOTH_SHARED_CAMERA'))
+
+def get_camera_client():
+    """Canal de commandes vers le processus de capture (photo, pause, redémarrage)"""
+    global camera_client
+    with camera_hub_lock:
+        if camera_client is None:
+            camera_client = CameraClient(config.get('shared_camera_socket', '/tmp/simplebooth_camera.sock'))
+        return camera_client
+
+def capture_still(budget, target_timestamp=None):
+    """Photo pleine résolution depuis le hub local, ou directement depuis le processus de capture"""
+    if camera_hub and camera_hub.is_running:
+        return camera_hub.capture_still(budget, target_timestamp)
+    if shared_camera_enabled():
+        # Ce worker n'affiche pas l'aperçu : demander la photo au processus de capture
+        return get_camera_client().capture_still(budget, target_timestamp)
+    return None
+
+def active_usb_camera_ids():
+    """IDs des caméras USB actuellement ouvertes par le hub (à ne pas sonder)"""
+    if shared_camera_enabled():
+        # Le processus de capture garde la caméra configurée ouverte
+        return (config.get('usb_camera_id', 0),) if config.get('camera_type') == 'usb' else ()
+    hub = camera_hub
+    if hub and hub.is_running and isinstance(hub.source, UsbCamera):
+        return (hub.source.camera_id,)
+    return ()
+
+def get_camera_hub():
+    """Retourner le hub caméra partagé (une seule source pour tous les spectateurs)"""
+    global camera_hub
+    with camera_hub_lock:
+        if camera_hub is None:
+            camera_hub = CameraHub(create_camera_source,
+                                   history_frames=config.get('frame_buffer_frames', 30),
+                                   history_bytes=int(config.get('frame_buffer_mb', 64) * 1024 * 1024))
+            camera_hub.set_throttle(*governor.profile)
+        return camera_hub
+
+def generate_video_stream(client_name=None, max_fps=None, rendition=None):
+    """Générer le flux vidéo MJPEG à partir du hub caméra partagé
+    
+    Chaque client ne reçoit que la frame la plus récente : un client lent
+    saute les frames intermédiaires au lieu de les accumuler.
+    """
+    subscriber = None
     try:
-        # Arrêter tout processus caméra existant
-        stop_camera_process()
-        
-        # Utiliser la caméra USB si configurée
-        if camera_type == 'usb':
-            logger.info("[CAMERA] Démarrage de la caméra USB...")
-            camera_id = config.get('usb_camera_id', 0)
-            usb_camera = UsbCamera(camera_id=camera_id)
-            if not usb_camera.start():
-                raise Exception(f"Impossible de démarrer la caméra USB avec ID {camera_id}")
-            
-            # Générateur de frames pour la caméra USB
-            while True:
-                frame = usb_camera.get_frame()
-                if frame:
-                    # Stocker la frame pour capture instantanée
-                    with frame_lock:
-                        last_frame = frame
-                    
-                    # Envoyer la frame au navigateur
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n'
-                           b'Content-Length: ' + str(len(frame)).encode() + b'\r\n\r\n' +
-                           frame + b'\r\n')
-                else:
-                    time.sleep(0.03)  # Attendre si pas de frame disponible
-        
-        # Utiliser la Pi Camera par défaut
-        else:
-            logger.info("[CAMERA] Démarrage de la Pi Camera...")
-            # Commande libcamera-vid pour flux MJPEG - résolution 16/9
-            cmd = [
-                'libcamera-vid',
-                '--codec', 'mjpeg',
-                '--width', '1280',   # Résolution native plus compatible
-                '--height', '720',   # Vrai 16/9 sans bandes noires
-                '--framerate', '15', # Framerate plus élevé pour cette résolution
-                '--timeout', '0',    # Durée infinie
-                '--output', '-',     # Sortie vers stdout
-                '--inline',          # Headers inline
-                '--flush',           # Flush immédiat
-                '--nopreview'        # Pas d'aperçu local
-            ]
-            
-            camera_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                bufsize=0
-            )
-            
-            # Buffer pour assembler les frames JPEG
-            buffer = b''
-            
-            while camera_process and camera_process.poll() is None:
-                try:
-                    # Lire les données par petits blocs
-                    chunk = camera_process.stdout.read(1024)
-                    if not chunk:
-                        break
-                        
-                    buffer += chunk
-                    
-                    # Chercher les marqueurs JPEG
-                    while True:
-                        # Chercher le début d'une frame JPEG (0xFFD8)
-                        start = buffer.find(b'\xff\xd8')
-                        if start == -1:
-                            break
-                            
-                        # Chercher la fin de la frame JPEG (0xFFD9)
-                        end = buffer.find(b'\xff\xd9', start + 2)
-                        if end == -1:
-                            break
-                            
-                        # Extraire la frame complète
-                        jpeg_frame = buffer[start:end + 2]
-                        buffer = buffer[end + 2:]
-                        
-                        # Stocker la frame pour capture instantanée
-                        with frame_lock:
-                            last_frame = jpeg_frame
-                        
-                        # Envoyer la frame au navigateur
-                        yield (b'--frame\r\n'
-                               b'Content-Type: image/jpeg\r\n'
-                               b'Content-Length: ' + str(len(jpeg_frame)).encode() + b'\r\n\r\n' +
-                               jpeg_frame + b'\r\n')
-                               
-                except Exception as e:
-                    logger.info(f"[CAMERA] Erreur lecture flux: {e}")
+        subscriber = get_camera_hub().subscribe(name=client_name, max_fps=max_fps, rendition=rendition)
+        
+        while True:
+            item = subscriber.next_frame(timeout=5.0)
+            if item is None:
+                if not subscriber.hub.is_running:
                     break
+                continue
+            
+            # Envoyer la frame au navigateur (la reprise du générateur mesure l'écriture réseau)
+            _, frame = item
+            sent_at = time.perf_counter()
+            yield mjpeg_part(frame)
+            STREAM_SEND_SECONDS.observe(time.perf_counter() - sent_at)
                 
     except Exception as e:
         logger.info(f"Erreur flux vidéo: {e}")
@@ -798,37 +950,38 @@ def generate_video_stream():
                b'Content-Type: text/plain\r\n\r\n' +
                error_msg.encode() + b'\r\n')
     finally:
-        stop_camera_process()
+        if subscriber:
+            subscriber.close()
 
 def stop_camera_process():
-    """Arrêter proprement le processus caméra (Pi Camera ou USB)"""
-    global camera_process, usb_camera
+    """Arrêter proprement la source caméra partagée (Pi Camera ou USB)"""
+    global camera_hub
     
-    # Arrêter la caméra USB si active
-    if usb_camera:
-        try:
-            usb_camera.stop()
-        except Exception as e:
-            logger.info(f"[CAMERA] Erreur lors de l'arrêt de la caméra USB: {e}")
-        usb_camera = None
+    with camera_hub_lock:
+        hub, camera_hub = camera_hub, None
     
-    # Arrêter le processus libcamera-vid si actif
-    if camera_process:
+    if hub:
         try:
-            camera_process.terminate()
-            camera_process.wait(timeout=2)
-        except:
-            try:
-                camera_process.kill()
-            except:
-                pass
-        camera_process = None
+            hub.stop()
+        except Exception as e:
+            logger.info(f"[CAMERA] Erreur lors de l'arrêt de la caméra: {e}")
+
+def forward_camera_command(command):
+    """Transmettre pause/reprise/redémarrage au processus de capture partagé"""
+    try:
+        get_camera_client().call(command)
+    except Exception as e:
+        logger.info(f"[CAMERA] Processus de capture injoignable ({command}): {e}")
 
 @app.route('/start_camera')
 def start_camera():
     """Démarrer l'aperçu caméra"""
     global camera_active
     camera_active = True
+    if camera_hub:
+        camera_hub.resume()
+    if shared_camera_enabled():
+        forward_camera_command('resume')
     return jsonify({'status': 'camera_started'})
 
 @app.route('/stop_camera')
@@ -836,21 +989,27 @@ def stop_camera():
     """Arrêter l'aperçu caméra"""
     global camera_active
     camera_active = False
-    stop_camera_process()
+    # Mettre l'aperçu en pause (plus aucun encodage) et couper la caméra si plus personne ne regarde
+    if camera_hub:
+        camera_hub.pause()
+        camera_hub.release()
+    if shared_camera_enabled():
+        forward_camera_command('pause')
     return jsonify({'status': 'camera_stopped'})
 
 # Nettoyer les processus à la fermeture
 @atexit.register
 def cleanup():
     logger.info("[APP] Arrêt de l'application, nettoyage des ressources...")
+    photo_writer.flush()
     stop_camera_process()
 
 def signal_handler(sig, frame):
     stop_camera_process()
     exit(0)
 
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
-
 if __name__ == '__main__':
+    # Sous uvicorn (asgi_app.py), le serveur gère lui-même les signaux
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
     app.run(host='0.0.0.0', port=5000, debug=True)
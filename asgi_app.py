@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Mode de service ASGI (production)
+
+Le flux /video_stream tourne sur la boucle asyncio : un spectateur n'occupe
+plus un thread pendant toute la durée de sa connexion, et tous partagent le
+hub caméra de app.py. L'attente des long-polls du diaporama (?wait=) se fait
+aussi sur la boucle. Toutes les autres routes Flask sont servies telles
+quelles via un adaptateur WSGI -> ASGI, chacune sur un thread d'un pool :
+une route lente (effet IA, impression) ne retarde pas /capture.
+
+Lancement :
+  uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+    un seul processus, qui possède la caméra
+  gunicorn -c gunicorn.conf.py asgi_app:app
+    plusieurs workers : un processus de capture dédié possède la caméra et
+    publie les frames en mémoire partagée (shm_utils.py), chaque worker les lit
+
+État propre à chaque worker : hub caméra et spectateurs, caches mémoire,
+dernière photo prise (le navigateur renvoie son nom à la page de révision)
+et copie de config.json, relue quand le fichier change. Les photos, le
+catalogue, la file d'impression et les caches sur disque sont partagés.
+"""
+
+import asyncio
+import io
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode
+
+try:
+    from asgiref.wsgi import WsgiToAsgiInstance
+except ImportError as e:
+    raise ImportError("Le mode ASGI nécessite asgiref et uvicorn: pip install asgiref uvicorn") from e
+
+import app as photobooth
+from stream_utils import mjpeg_part, parse_rendition, STREAM_SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = '/video_stream'
+SLIDESHOW_PATH = '/api/slideshow'
+# Délai max d'attente d'une frame avant de vérifier l'état du hub
+FRAME_TIMEOUT = 5.0
+# Intervalle de relecture du curseur du catalogue pendant un long-poll
+CATALOG_POLL_INTERVAL = 0.5
+# Requêtes Flask traitées en parallèle
+WSGI_THREADS = 16
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    """One request: asgiref's environ and start_response, run on our own executor."""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError("WSGI wrapper received a non-HTTP scope")
+        self.scope = scope
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] != 'http.request':
+                return
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        loop = asyncio.get_running_loop()
+        # Appelé depuis le thread de la requête : envoi sur la boucle, en attendant qu'il soit fait
+        self.sync_send = lambda event: asyncio.run_coroutine_threadsafe(send(event), loop).result()
+        await loop.run_in_executor(self.executor, self._run, io.BytesIO(b''.join(chunks)))
+
+    def _run(self, body):
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            self.sync_send({'type': 'http.response.start', 'status': 400,
+                            'headers': [(b'content-type', b'text/plain')]})
+            self.sync_send({'type': 'http.response.body', 'body': b'Bad Request'})
+            return
+        result = self.wsgi_application(environ, self.start_response)
+        try:
+            for output in result:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                if output:
+                    self.sync_send({'type': 'http.response.body', 'body': output, 'more_body': True})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({'type': 'http.response.body'})
+
+
+class ThreadPoolWsgi:
+    """WSGI -> ASGI adapter running each request on a thread pool.
+
+    asgiref's ``WsgiToAsgi`` runs every WSGI request on one shared thread,
+    so a slow route (Runware effect, print waiting on the queue, lazy
+    rendition) queued every other request behind it.
+    """
+
+    def __init__(self, wsgi_application, threads=WSGI_THREADS):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+flask_app = ThreadPoolWsgi(photobooth.app)
+
+
+class FrameNotifier:
+    """Wake an asyncio task each time the hub publishes, pauses or stops.
+
+    Registered as a hub listener, so it is called from the capture thread; the
+    wake-up is handed to the event loop with ``call_soon_threadsafe``.
+    """
+
+    def __init__(self, hub, loop):
+        self.hub = hub
+        self.loop = loop
+        self._future = loop.create_future()
+        hub.add_listener(self._notify)
+
+    def _notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # Boucle déjà fermée (arrêt du serveur)
+            pass
+
+    def _wake(self):
+        future, self._future = self._future, self.loop.create_future()
+        if not future.done():
+            future.set_result(None)
+
+    async def wait(self, timeout):
+        """Wait for the next hub event; returns False on timeout."""
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def close(self):
+        self.hub.remove_listener(self._notify)
+
+
+def _stream_options(scope):
+    """Paramètres ?fps= et ?rendition=, comme la route Flask"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    max_fps = None
+    try:
+        max_fps = float(query['fps'][0]) if 'fps' in query else None
+    except ValueError:
+        pass
+    if max_fps is not None and max_fps <= 0:
+        max_fps = None
+    rendition = parse_rendition(query['rendition'][0] if 'rendition' in query else None)
+    return max_fps, rendition
+
+
+async def _send_json_error(send, status, message):
+    body = json.dumps({'success': False, 'error': message}).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def video_stream(scope, receive, send):
+    """Flux vidéo MJPEG servi sur la boucle asyncio"""
+    try:
+        max_fps, rendition = _stream_options(scope)
+    except ValueError as e:
+        await _send_json_error(send, 400, str(e))
+        return
+
+    loop = asyncio.get_running_loop()
+    client = scope.get('client')
+    client_name = client[0] if client else None
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    watcher = loop.create_task(watch_disconnect())
+    subscriber = None
+    notifier = None
+    try:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+                                (b'cache-control', b'no-cache')]})
+        try:
+            # subscribe() peut ouvrir la caméra : hors de la boucle
+            hub = photobooth.get_camera_hub()
+            subscriber = await loop.run_in_executor(
+                None, lambda: hub.subscribe(name=client_name, max_fps=max_fps, rendition=rendition))
+            notifier = FrameNotifier(hub, loop)
+
+            while not disconnected.is_set():
+                delay = subscriber.delay()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                item = subscriber.claim_frame()
+                if item is None:
+                    if not hub.is_running:
+                        break
+                    await notifier.wait(FRAME_TIMEOUT)
+                    continue
+
+                # L'encodage JPEG (s'il n'est pas déjà en cache) ne bloque pas la boucle
+                _, frame = item
+                if subscriber.needs_encoding(frame):
+                    data = await loop.run_in_executor(None, subscriber.encode, frame)
+                else:
+                    data = subscriber.encode(frame)
+                sent_at = time.perf_counter()
+                await send({'type': 'http.response.body', 'body': mjpeg_part(data), 'more_body': True})
+                STREAM_SEND_SECONDS.observe(time.perf_counter() - sent_at)
+
+        except Exception as e:
+            if disconnected.is_set():
+                return
+            logger.info(f"Erreur flux vidéo: {e}")
+            error_msg = f"Erreur caméra: {str(e)}"
+            await send({'type': 'http.response.body', 'more_body': True,
+                        'body': (b'--frame\r\n'
+                                 b'Content-Type: text/plain\r\n\r\n' +
+                                 error_msg.encode() + b'\r\n')})
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        if notifier:
+            notifier.close()
+        if subscriber:
+            subscriber.close()
+
+
+async def slideshow_long_poll(scope, receive, send):
+    """Long-poll du diaporama : attente sur la boucle, puis réponse Flask habituelle
+
+    Une attente de 30 s dans la route occuperait un thread du pool par kiosque ;
+    ici seule la lecture du curseur (SQLite) passe brièvement par un thread.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    try:
+        since = int(query['since'][0])
+        wait = min(max(float(query['wait'][0]), 0.0), photobooth.SLIDESHOW_MAX_WAIT)
+    except (KeyError, ValueError):
+        await flask_app(scope, receive, send)
+        return
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline and await asyncio.to_thread(photobooth.photo_catalog.cursor) == since:
+        await asyncio.sleep(min(CATALOG_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+
+    query.pop('wait')
+    scope = dict(scope, query_string=urlencode(query, doseq=True).encode('latin-1'))
+    await flask_app(scope, receive, send)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            logger.info("[APP] Arrêt du serveur ASGI, nettoyage des ressources...")
+            await asyncio.get_running_loop().run_in_executor(None, photobooth.stop_camera_process)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """Application ASGI : flux vidéo natif, le reste via Flask"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        await video_stream(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == SLIDESHOW_PATH:
+        await slideshow_long_poll(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark du démultiplexeur MJPEG (flux libcamera-vid)
+
+Rejoue un fichier MJPEG enregistré et compare MjpegDemuxer à l'ancienne
+méthode (buffer += chunk, recherche depuis le début, découpage par slices).
+
+Enregistrer un flux sur le Raspberry Pi:
+  libcamera-vid --codec mjpeg --width 1280 --height 720 --framerate 15 -t 10000 -o capture.mjpeg
+
+Usage:
+  python3 benchmarks/bench_mjpeg_demux.py --file capture.mjpeg
+  python3 benchmarks/bench_mjpeg_demux.py --synthetic 300
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from camera_utils import MjpegDemuxer
+
+
+def legacy_demux(stream):
+    """Ancienne implémentation de generate_video_stream (référence)"""
+    buffer = b''
+    frames = 0
+    while True:
+        chunk = stream.read(1024)
+        if not chunk:
+            break
+        buffer += chunk
+        while True:
+            start = buffer.find(b'\xff\xd8')
+            if start == -1:
+                break
+            end = buffer.find(b'\xff\xd9', start + 2)
+            if end == -1:
+                break
+            jpeg_frame = buffer[start:end + 2]
+            buffer = buffer[end + 2:]
+            frames += 1
+    return frames
+
+
+def demuxer_demux(stream):
+    """Démultiplexeur linéaire (copie unique par frame, comme PiCamera)"""
+    demuxer = MjpegDemuxer(stream)
+    frames = 0
+    while True:
+        frame = demuxer.read_frame()
+        if frame is None:
+            break
+        bytes(frame)
+        frames += 1
+    return frames
+
+
+def synthetic_stream(frame_count, width=1280, height=720):
+    """Générer un flux MJPEG de test avec OpenCV"""
+    import cv2
+    import numpy as np
+
+    data = bytearray()
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    for i in range(frame_count):
+        frame = np.roll(base, i * 8, axis=1)
+        _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        data += jpeg.tobytes()
+    return bytes(data)
+
+
+def run(name, func, data, repeat):
+    best_wall = None
+    best_cpu = None
+    frames = 0
+    for _ in range(repeat):
+        stream = io.BufferedReader(io.BytesIO(data))
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        frames = func(stream)
+        cpu = time.process_time() - cpu
+        wall = time.perf_counter() - wall
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+    mb = len(data) / (1024 * 1024)
+    per_frame_us = best_cpu / frames * 1e6 if frames else 0
+    print(f"{name:<12} {frames:>6} frames  {mb / best_wall:>9.1f} MB/s  {per_frame_us:>9.1f} µs CPU/frame")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark du démultiplexeur MJPEG')
+    parser.add_argument('--file', type=str, help='Fichier MJPEG enregistré à rejouer')
+    parser.add_argument('--synthetic', type=int, default=150,
+                        help='Nombre de frames synthétiques si aucun fichier (défaut: 150)')
+    parser.add_argument('--repeat', type=int, default=3, help='Nombre de répétitions (défaut: 3)')
+    parser.add_argument('--skip-legacy', action='store_true', help='Ne pas mesurer l\'ancienne méthode')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'rb') as f:
+            data = f.read()
+    else:
+        data = synthetic_stream(args.synthetic)
+
+    print(f"Flux: {len(data) / (1024 * 1024):.1f} MB")
+    run('demuxer', demuxer_demux, data, args.repeat)
+    if not args.skip_legacy:
+        run('legacy', legacy_demux, data, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
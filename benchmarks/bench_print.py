@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark de l'impression : sous-processus par impression contre service permanent
+
+Mesure le délai jusqu'à la première ligne imprimée (premiers octets de l'image
+envoyés à l'imprimante) et la durée totale, avec l'ancienne méthode (un
+ScriptPythonPOS.py lancé par impression : démarrage de Python, imports,
+ouverture du port série) puis avec PrintService (module chargé et port ouvert
+une fois pour toutes).
+
+Sans --port, l'imprimante factice d'escpos (Dummy) est utilisée : seul le
+coût logiciel est mesuré. Nécessite python-escpos.
+
+Usage:
+  python3 benchmarks/bench_print.py --prints 5
+  python3 benchmarks/bench_print.py --port /dev/ttyAMA0 --image photos/photo.jpg --hd
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ScriptPythonPOS
+from print_utils import PrintService
+
+# Exécuté dans le sous-processus : mêmes étapes que main() en mode --direct,
+# avec l'instant de la première ligne relatif au lancement du processus
+SUBPROCESS_CODE = '''
+import sys, time
+import ScriptPythonPOS as pos
+started, image, port, baudrate, hd = float(sys.argv[1]), sys.argv[2], sys.argv[3], int(sys.argv[4]), sys.argv[5] == '1'
+printer = pos.connect_printer(port, baudrate, dummy=port == 'dummy')
+raster = pos.prepare_image(image, hd)
+pos.check_paper_status(printer)
+first_line = time.time() - started
+pos.print_job(printer, raster, 'Benchmark')
+printer.close()
+print(first_line, time.time() - started)
+'''
+
+
+def bench_subprocess(args, image):
+    first_lines, totals = [], []
+    for _ in range(args.prints):
+        started = time.time()
+        output = subprocess.run(
+            [sys.executable, '-c', SUBPROCESS_CODE, repr(started), image,
+             args.port or 'dummy', str(args.baudrate), '1' if args.hd else '0'],
+            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        first_line, total = (float(value) for value in output.split())
+        first_lines.append(first_line)
+        totals.append(total)
+    return first_lines, totals
+
+
+def bench_service(args, image):
+    marks = []
+    print_job = ScriptPythonPOS.print_job
+
+    def timed_print_job(*job_args):
+        marks.append(time.perf_counter())
+        return print_job(*job_args)
+
+    ScriptPythonPOS.print_job = timed_print_job
+    connect = None
+    if not args.port:
+        connect = lambda port, baudrate: ScriptPythonPOS.connect_printer(port, baudrate, dummy=True)
+    service = PrintService(args.port or 'dummy', args.baudrate, connect=connect)
+    try:
+        # Première impression : préchauffage (imports, ouverture du port), hors mesure
+        service.print_file(image, text='Benchmark', high_density=args.hd)
+        first_lines, totals = [], []
+        for _ in range(args.prints):
+            marks.clear()
+            started = time.perf_counter()
+            result = service.print_file(image, text='Benchmark', high_density=args.hd)
+            if not result['success']:
+                raise RuntimeError(result['error'])
+            first_lines.append(marks[0] - started)
+            totals.append(time.perf_counter() - started)
+    finally:
+        ScriptPythonPOS.print_job = print_job
+    return first_lines, totals
+
+
+def summary(values):
+    return {
+        'mean_ms': round(statistics.mean(values) * 1000, 1),
+        'max_ms': round(max(values) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark du service d\'impression')
+    parser.add_argument('--image', type=str, help='Image à imprimer (défaut: photo synthétique 1920x1080)')
+    parser.add_argument('--port', type=str, help='Port série d\'une vraie imprimante (défaut: imprimante factice)')
+    parser.add_argument('--baudrate', type=int, default=9600, help='Baudrate (défaut: 9600)')
+    parser.add_argument('--hd', action='store_true', help='Haute densité')
+    parser.add_argument('--prints', type=int, default=5, help='Impressions mesurées par méthode (défaut: 5)')
+    parser.add_argument('--json', action='store_true', help='Résultat en JSON (CI)')
+    args = parser.parse_args()
+
+    image = args.image
+    if not image:
+        from PIL import Image
+        image = os.path.join(tempfile.mkdtemp(), 'bench.jpg')
+        Image.effect_noise((1920, 1080), 64).convert('RGB').save(image, quality=90)
+
+    result = {}
+    for name, bench in (('subprocess', bench_subprocess), ('service', bench_service)):
+        first_lines, totals = bench(args, image)
+        result[name] = {'first_line': summary(first_lines), 'total': summary(totals)}
+    result['first_line_speedup'] = round(result['subprocess']['first_line']['mean_ms']
+                                         / max(result['service']['first_line']['mean_ms'], 0.1), 1)
+
+    if args.json:
+        print(json.dumps(result))
+        return
+    for name in ('subprocess', 'service'):
+        first_line, total = result[name]['first_line'], result[name]['total']
+        print(f"{name:<11} première ligne {first_line['mean_ms']:>8} ms (max {first_line['max_ms']}) "
+              f"total {total['mean_ms']:>8} ms (max {total['max_ms']})")
+    print(f"Gain sur la première ligne: x{result['first_line_speedup']}")
+
+
+if __name__ == '__main__':
+    main()
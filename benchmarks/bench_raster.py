@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark du tramage : chemin escpos (bitImageRaster) contre raster_utils
+
+Mesure le temps de conversion d'une image en gris (déjà à la largeur
+d'impression, comme après optimize_image) en commandes GS v 0, avec :
+- legacy : reproduction du chemin escpos (EscposImage : RGBA, collage sur
+  fond blanc, gris, inversion, 1 bit, puis découpage et nouveau tramage de
+  chaque fragment)
+- floyd / ordered / threshold : raster_utils
+
+Vérifie aussi les sorties de référence : mêmes octets qu'escpos en floyd,
+et empreintes SHA-256 fixes pour chaque mode (une modification du tramage
+doit mettre à jour GOLDEN consciemment). Code de sortie 1 si une
+vérification échoue.
+
+Usage:
+  python3 benchmarks/bench_raster.py
+  python3 benchmarks/bench_raster.py --image photos/photo.jpg --low-density
+  python3 benchmarks/bench_raster.py --check --json
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from raster_utils import DITHER_MODES, rasterize, raster_commands
+
+FRAGMENT_HEIGHT = 1920
+
+# Empreintes des commandes GS v 0 produites pour synthetic_image(384, 512), par mode et densité
+GOLDEN = {
+    ('floyd', True): '85f5bba3a77884db551a4870ab126ac5799066f3fcad01751c34ccde7e01ad11',
+    ('floyd', False): '68b59c05534209f84abd4f0afe18f0752fd4f7a38040ae38e31cf44de14ba185',
+    ('ordered', True): 'e91131518264ad48e3ff407c170917ccb36f04f3ece7d61f8edd6a95ecf9e095',
+    ('ordered', False): '015f7e9397ee5bcd3c2ff63ed18f6e46a4dc16f8ce9429fb58b77414a273999f',
+    ('threshold', True): 'ba0f1e3ea2ed8974d57da0613567bd50e6babb024543dadbb848e557f3da93de',
+    ('threshold', False): '5e61646d10842954822fdfb26dd19ff61fd42904179b1f2380c691b7814809b5',
+}
+
+
+def synthetic_image(width, height):
+    """Image de test déterministe : dégradés, cercle et bruit fixe (pas de PRNG de la plateforme)"""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float64)
+    gray = 255 * (x / max(width - 1, 1)) * 0.6 + 255 * (y / max(height - 1, 1)) * 0.4
+    circle = (x - width / 2) ** 2 + (y - height / 3) ** 2 < (width / 4) ** 2
+    gray[circle] = 255 - gray[circle]
+    gray += ((x * 7 + y * 13) % 17 - 8) * 2
+    return Image.fromarray(np.clip(gray, 0, 255).astype(np.uint8), 'L')
+
+
+def legacy_commands(img, high_density):
+    """Chemin escpos 3.x : Printer.image(impl='bitImageRaster', fragment_height=1920)"""
+    def escpos_image(source):
+        rgba = source.convert('RGBA')
+        im = Image.new('RGB', rgba.size, (255, 255, 255))
+        im.paste(rgba, mask=rgba.split()[3])
+        return ImageOps.invert(im.convert('L')).convert('1')
+
+    im = escpos_image(img)
+    width, height = im.size
+    if height > FRAGMENT_HEIGHT:
+        # escpos convertit l'image entière puis retrame chaque fragment
+        commands = []
+        for n in range(math.ceil(height / FRAGMENT_HEIGHT)):
+            box = (0, n * FRAGMENT_HEIGHT, width, min((n + 1) * FRAGMENT_HEIGHT, height))
+            commands += legacy_commands(img.crop(box), high_density)
+        return commands
+    density = 0 if high_density else 3
+    header = b'\x1dv0' + bytes((density,)) + ((width + 7) >> 3).to_bytes(2, 'little') + height.to_bytes(2, 'little')
+    return [header + im.tobytes()]
+
+
+def new_commands(img, high_density, dither):
+    return raster_commands(rasterize(img, dither=dither), high_density=high_density,
+                           fragment_height=FRAGMENT_HEIGHT)
+
+
+def digest(commands):
+    return hashlib.sha256(b''.join(commands)).hexdigest()
+
+
+def check():
+    """Vérifications de référence ; renvoie la liste des échecs"""
+    failures = []
+    image = synthetic_image(384, 512)
+    for high_density in (True, False):
+        if digest(new_commands(image, high_density, 'floyd')) != digest(legacy_commands(image, high_density)):
+            failures.append(f"floyd hd={high_density}: différent d'escpos")
+    # Transparence : même fond blanc qu'escpos
+    rgba = image.convert('RGBA')
+    rgba.putalpha(synthetic_image(384, 512).transpose(Image.FLIP_LEFT_RIGHT))
+    if digest(new_commands(rgba, True, 'floyd')) != digest(legacy_commands(rgba, True)):
+        failures.append("floyd RGBA: différent d'escpos")
+    for (dither, high_density), expected in GOLDEN.items():
+        actual = digest(new_commands(image, high_density, dither))
+        if actual != expected:
+            failures.append(f"{dither} hd={high_density}: {actual} au lieu de {expected}")
+    return failures
+
+
+def bench(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return {
+        'mean_ms': round(statistics.mean(durations) * 1000, 2),
+        'min_ms': round(min(durations) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark du tramage et des commandes raster')
+    parser.add_argument('--image', type=str, help='Image à tramer (défaut: image synthétique)')
+    parser.add_argument('--height', type=int, default=2400,
+                        help='Hauteur de l\'image synthétique en points (défaut: 2400, deux fragments)')
+    parser.add_argument('--low-density', action='store_true', help='Basse densité (192 points de large)')
+    parser.add_argument('--repeat', type=int, default=20, help='Répétitions par méthode (défaut: 20)')
+    parser.add_argument('--check', action='store_true', help='Vérifications de référence seulement')
+    parser.add_argument('--json', action='store_true', help='Résultat en JSON (CI)')
+    args = parser.parse_args()
+
+    failures = check()
+    result = {'check': 'ok' if not failures else failures}
+    if not args.check:
+        high_density = not args.low_density
+        width = 384 if high_density else 192
+        if args.image:
+            import ScriptPythonPOS
+            image = ScriptPythonPOS.optimize_image(args.image, high_density)
+        else:
+            image = synthetic_image(width, args.height)
+        result['image'] = list(image.size)
+        result['legacy'] = bench(lambda: legacy_commands(image, high_density), args.repeat)
+        for dither in DITHER_MODES:
+            result[dither] = bench(lambda: new_commands(image, high_density, dither), args.repeat)
+        result['speedup'] = {dither: round(result['legacy']['mean_ms'] / max(result[dither]['mean_ms'], 0.01), 1)
+                             for dither in DITHER_MODES}
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for failure in failures:
+            print(f"ÉCHEC {failure}")
+        if not failures:
+            print("Vérifications de référence: ok")
+        if not args.check:
+            print(f"Image {result['image'][0]}x{result['image'][1]}")
+            for name in ('legacy',) + DITHER_MODES:
+                timing = result[name]
+                speedup = f" (x{result['speedup'][name]})" if name in DITHER_MODES else ''
+                print(f"{name:<10} {timing['mean_ms']:>8} ms (min {timing['min_ms']}){speedup}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
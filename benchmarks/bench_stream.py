@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark du pipeline d'aperçu sans matériel (hub caméra + spectateurs)
+
+Alimente le CameraHub avec une caméra synthétique ou un fichier rejoué, simule
+N spectateurs et mesure le débit livré, les frames sautées, la latence entre
+la capture et la livraison, puis la latence des photos (capture_still).
+
+Usage:
+  python3 benchmarks/bench_stream.py --viewers 8 --duration 10
+  python3 benchmarks/bench_stream.py --fps 0 --jpeg-kb 200 --viewers 20
+  python3 benchmarks/bench_stream.py --raw --rendition 360p
+  python3 benchmarks/bench_stream.py --file capture.mjpeg --json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from camera_utils import FileReplayCamera, SyntheticCamera
+from stream_utils import CameraHub, parse_rendition
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def viewer(hub, rendition, max_fps, stop, results):
+    """Un spectateur synchrone, comme generate_video_stream"""
+    latencies = []
+    received = 0
+    with hub.subscribe(name='bench', max_fps=max_fps, rendition=rendition) as subscriber:
+        while not stop.is_set():
+            delay = subscriber.delay()
+            if delay > 0:
+                time.sleep(delay)
+            with hub.condition:
+                hub.condition.wait_for(lambda: stop.is_set() or hub.seq > subscriber.last_seq, timeout=1.0)
+            item = subscriber.claim_frame()
+            if item is None:
+                continue
+            _, frame = item
+            data = subscriber.encode(frame)
+            latencies.append(time.time() - frame.timestamp)
+            received += len(data)
+        results.append({
+            'frames': subscriber.frames_sent,
+            'dropped': subscriber.frames_dropped,
+            'skipped': subscriber.frames_skipped,
+            'bytes': received,
+            'latencies': latencies,
+        })
+
+
+def run(args):
+    if args.file:
+        factory = lambda: FileReplayCamera(args.file, fps=args.fps, loop=True)
+    else:
+        factory = lambda: SyntheticCamera(width=args.width, height=args.height,
+                                          fps=30 if args.fps is None else args.fps,
+                                          jpeg_size=args.jpeg_kb * 1024 if args.jpeg_kb else None,
+                                          encoded=not args.raw)
+    hub = CameraHub(factory)
+    rendition = parse_rendition(args.rendition)
+    stop = threading.Event()
+    results = []
+    threads = [threading.Thread(target=viewer, args=(hub, rendition, args.max_fps, stop, results))
+               for _ in range(args.viewers)]
+    # Démarrer la source (génération des images synthétiques) hors mesure
+    with hub.subscribe(name='warmup') as warmup:
+        warmup.next_frame(timeout=10.0)
+        first_seq = hub.seq
+        cpu = time.process_time()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu
+        captured = hub.seq - first_seq
+    source_stats = hub.get_stats().get('source', {})
+
+    # Photos : latence de capture_still, à l'instant présent puis dans le passé (tampon)
+    still_latencies = []
+    with hub.subscribe(name='still'):
+        for i in range(args.captures):
+            target = time.time() - 0.1 if i % 2 else None
+            began = time.perf_counter()
+            hub.capture_still(budget=3.0, timestamp=target)
+            still_latencies.append(time.perf_counter() - began)
+    hub.stop()
+
+    latencies = [latency for result in results for latency in result['latencies']]
+    frames = sum(result['frames'] for result in results)
+    return {
+        'source': source_stats.get('source'),
+        'viewers': args.viewers,
+        'duration_s': round(elapsed, 2),
+        'capture_fps': round(captured / elapsed, 1),
+        'delivered_fps_per_viewer': round(frames / elapsed / max(args.viewers, 1), 1),
+        'dropped_frames': sum(result['dropped'] for result in results),
+        'skipped_frames': sum(result['skipped'] for result in results),
+        'throughput_mb_s': round(sum(result['bytes'] for result in results) / elapsed / (1024 * 1024), 1),
+        'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'still_mean_ms': round(statistics.mean(still_latencies) * 1000, 2) if still_latencies else None,
+        'cpu_percent': round(cpu / elapsed * 100, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark du hub caméra sans matériel')
+    parser.add_argument('--file', type=str, help='Fichier MJPEG ou vidéo à rejouer (défaut: caméra synthétique)')
+    parser.add_argument('--width', type=int, default=1280, help='Largeur synthétique (défaut: 1280)')
+    parser.add_argument('--height', type=int, default=720, help='Hauteur synthétique (défaut: 720)')
+    parser.add_argument('--fps', type=float, help='Cadence de la source, 0 = maximum (défaut: 30, ou celle du fichier)')
+    parser.add_argument('--jpeg-kb', type=int, help='Taille des JPEG synthétiques en Ko')
+    parser.add_argument('--raw', action='store_true', help='Images brutes : encodage JPEG à la demande')
+    parser.add_argument('--viewers', type=int, default=4, help='Nombre de spectateurs (défaut: 4)')
+    parser.add_argument('--max-fps', type=float, help='Limite de débit par spectateur')
+    parser.add_argument('--rendition', type=str, help='Rendition demandée (720p, 360p-q50...)')
+    parser.add_argument('--duration', type=float, default=5.0, help='Durée en secondes (défaut: 5)')
+    parser.add_argument('--captures', type=int, default=10, help='Nombre de photos mesurées (défaut: 10)')
+    parser.add_argument('--json', action='store_true', help='Résultat en JSON (CI)')
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result))
+        return
+    for key, value in result.items():
+        print(f"{key:<26} {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class DiskLru:
+    """Size and last-access index of the files in on-disk cache folders.
+
+    The folders are shared by every server process, and each process keeps
+    its own index. The running total is updated on each insert, so lookups
+    and inserts never list the folders. Since other processes add and evict
+    files too, the total is only an estimate. Once it crosses ``max_bytes``,
+    or at the first insert after ``rescan_interval`` seconds, the folders are
+    rescanned (outside the lock). If the real total is over the limit, the
+    least recently used files of every process are evicted down to 90 %.
+    """
+
+    def __init__(self, folders, max_bytes, suffix, gauge=None, evictions=None, rescan_interval=30.0):
+        self.folders = list(folders)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.rescan_interval = rescan_interval
+        self.gauge = gauge
+        self.evictions = evictions
+        self.lock = threading.Lock()
+        self.files = {}
+        self.total = 0
+        self._scanned = 0.0
+        self.rescan()
+
+    def __contains__(self, path):
+        with self.lock:
+            return path in self.files
+
+    def _publish(self):
+        # Appelé avec self.lock
+        if self.gauge is not None:
+            self.gauge.set(self.total)
+
+    def rescan(self):
+        """Re-read the folders, keeping the access times this process knows."""
+        listed = {}
+        scanned = time.monotonic()
+        for folder in self.folders:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith(self.suffix):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        listed[entry.path] = (stat.st_size, stat.st_mtime)
+        with self.lock:
+            for path, (nbytes, mtime) in listed.items():
+                known = self.files.get(path)
+                if known is not None:
+                    listed[path] = (nbytes, max(known[1], mtime))
+            self.files = listed
+            self.total = sum(nbytes for nbytes, _ in listed.values())
+            self._scanned = scanned
+            self._publish()
+
+    def touch(self, path):
+        """Mark an indexed file as used now; False if ``path`` is not indexed."""
+        with self.lock:
+            entry = self.files.get(path)
+            if entry is None:
+                return False
+            self.files[path] = (entry[0], time.time())
+            return True
+
+    def adopt(self, path):
+        """Index ``path`` if it is on disk (possibly written by another process); tells whether it is."""
+        try:
+            nbytes = os.path.getsize(path)
+        except FileNotFoundError:
+            # Évincé par un autre processus
+            self.forget(path)
+            return False
+        self.add(path, nbytes)
+        return True
+
+    def add(self, path, nbytes):
+        """Record a file written to the cache, evicting the oldest ones beyond ``max_bytes``."""
+        with self.lock:
+            previous = self.files.get(path)
+            self.total += nbytes - (previous[0] if previous else 0)
+            self.files[path] = (nbytes, time.time())
+            # Les autres processus écrivent aussi : recompter de temps en temps même sous la limite
+            recount = self.total > self.max_bytes or time.monotonic() - self._scanned >= self.rescan_interval
+            self._publish()
+        if recount:
+            self._evict(keep=path)
+
+    def _evict(self, keep):
+        # Compter d'abord les fichiers de tous les processus, puis éviction LRU jusqu'à 90 % de la limite
+        self.rescan()
+        victims = []
+        with self.lock:
+            if self.total <= self.max_bytes:
+                return
+            for victim, (victim_size, _) in sorted(self.files.items(), key=lambda item: item[1][1]):
+                if self.total <= self.max_bytes * 0.9:
+                    break
+                if victim == keep:
+                    continue
+                victims.append(victim)
+                self.total -= victim_size
+                del self.files[victim]
+            self._publish()
+        remove_files(victims)
+        if self.evictions is not None:
+            self.evictions.inc(len(victims))
+
+    def forget(self, path):
+        with self.lock:
+            entry = self.files.pop(path, None)
+            if entry is not None:
+                self.total -= entry[0]
+                self._publish()
+
+    def discard(self, match):
+        """Delete every cached file whose path satisfies ``match``, whichever process wrote it."""
+        self.rescan()
+        with self.lock:
+            victims = [path for path in self.files if match(path)]
+            for path in victims:
+                self.total -= self.files.pop(path)[0]
+            self._publish()
+        remove_files(victims)
+
+    def clear(self):
+        self.discard(lambda path: True)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'files': len(self.files),
+                'bytes': self.total,
+                'max_bytes': self.max_bytes,
+            }
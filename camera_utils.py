@@ -1,101 +1,580 @@
+import abc
 import cv2
+import numpy as np
+import glob
+import os
+import subprocess
 import threading
 import time
 import logging
+from config_utils import load_camera_format, save_camera_format
+from metrics_utils import Counter, Gauge, Histogram
 
 logger = logging.getLogger(__name__)
 
+CAMERA_FRAMES = Counter('photobooth_camera_frames_total', 'Frames captured by the camera source', ['source'])
+CAMERA_FPS = Gauge('photobooth_camera_fps', 'Effective capture frame rate', ['source'])
+CAMERA_READ_SECONDS = Histogram('photobooth_camera_read_seconds', 'Time spent waiting for the next frame from the device', ['source'])
+CAMERA_RECONNECTS = Counter('photobooth_camera_reconnects_total', 'USB camera reconnection attempts')
+FRAME_ENCODE_SECONDS = Histogram('photobooth_frame_encode_seconds', 'JPEG encode time per frame', ['kind'])
 
-def detect_cameras():
-    """Detect available USB cameras."""
-    available_cameras = []
-    logger.info("[CAMERA] Début de la détection des caméras USB...")
 
-    for i in range(10):
-        try:
-            logger.info(f"[CAMERA] Test de la caméra ID {i}...")
-            backends = [cv2.CAP_ANY, cv2.CAP_DSHOW, cv2.CAP_V4L2, cv2.CAP_GSTREAMER]
-            cap = None
-            for backend in backends:
-                try:
-                    cap = cv2.VideoCapture(i, backend)
-                    if cap.isOpened():
-                        resolutions_to_test = [
-                            (1920, 1080),
-                            (1280, 720),
-                            (640, 480)
-                        ]
-                        best_resolution = None
-                        best_fps = 0
-                        for test_width, test_height in resolutions_to_test:
-                            cap.set(cv2.CAP_PROP_FRAME_WIDTH, test_width)
-                            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, test_height)
-                            cap.set(cv2.CAP_PROP_FPS, 30)
-                            actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                            actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                            actual_fps = cap.get(cv2.CAP_PROP_FPS)
-                            ret, frame = cap.read()
-                            if ret and frame is not None and frame.shape[1] >= test_width * 0.9 and frame.shape[0] >= test_height * 0.9:
-                                best_resolution = (actual_width, actual_height)
-                                best_fps = actual_fps
-                                logger.info(f"[CAMERA] Résolution {actual_width}x{actual_height} supportée pour la caméra {i}")
-                                break
-                            else:
-                                logger.info(f"[CAMERA] Résolution {test_width}x{test_height} non supportée pour la caméra {i}")
-                        if best_resolution:
-                            width, height = best_resolution
-                            fps = best_fps
-                            backend_name = {
-                                cv2.CAP_ANY: "Auto",
-                                cv2.CAP_DSHOW: "DirectShow",
-                                cv2.CAP_V4L2: "V4L2",
-                                cv2.CAP_GSTREAMER: "GStreamer",
-                            }.get(backend, "Inconnu")
-                            name = f"Caméra {i} ({backend_name}) - {width}x{height}@{fps:.1f}fps"
-                            available_cameras.append((i, name))
-                            logger.info(f"[CAMERA] ✓ Caméra fonctionnelle détectée: {name}")
+BACKEND_NAMES = {
+    cv2.CAP_ANY: "Auto",
+    cv2.CAP_DSHOW: "DirectShow",
+    cv2.CAP_V4L2: "V4L2",
+    cv2.CAP_GSTREAMER: "GStreamer",
+}
+
+
+def _probe_camera(i):
+    """Open camera ``i`` and return ``(i, name)`` if it delivers frames, else ``None``."""
+    try:
+        logger.info(f"[CAMERA] Test de la caméra ID {i}...")
+        backends = [cv2.CAP_ANY, cv2.CAP_DSHOW, cv2.CAP_V4L2, cv2.CAP_GSTREAMER]
+        cap = None
+        for backend in backends:
+            backend_name = BACKEND_NAMES.get(backend, "Inconnu")
+            try:
+                cap = cv2.VideoCapture(i, backend)
+                if cap.isOpened():
+                    resolutions_to_test = [
+                        (1920, 1080),
+                        (1280, 720),
+                        (640, 480)
+                    ]
+                    best_resolution = None
+                    best_fps = 0
+                    for test_width, test_height in resolutions_to_test:
+                        cap.set(cv2.CAP_PROP_FRAME_WIDTH, test_width)
+                        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, test_height)
+                        cap.set(cv2.CAP_PROP_FPS, 30)
+                        actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                        actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                        actual_fps = cap.get(cv2.CAP_PROP_FPS)
+                        ret, frame = cap.read()
+                        if ret and frame is not None and frame.shape[1] >= test_width * 0.9 and frame.shape[0] >= test_height * 0.9:
+                            best_resolution = (actual_width, actual_height)
+                            best_fps = actual_fps
+                            logger.info(f"[CAMERA] Résolution {actual_width}x{actual_height} supportée pour la caméra {i}")
                             break
                         else:
-                            logger.info(f"[CAMERA] Caméra {i} ouverte mais ne peut pas lire de frame avec backend {backend_name}")
-                    cap.release()
-                except Exception as e:
-                    if cap:
+                            logger.info(f"[CAMERA] Résolution {test_width}x{test_height} non supportée pour la caméra {i}")
+                    if best_resolution:
+                        width, height = best_resolution
+                        name = f"Caméra {i} ({backend_name}) - {width}x{height}@{best_fps:.1f}fps"
                         cap.release()
-                    logger.info(f"[CAMERA] Backend {backend} échoué pour caméra {i}: {e}")
-                    continue
-            if not available_cameras or available_cameras[-1][0] != i:
-                logger.info(f"[CAMERA] ✗ Caméra {i} non disponible ou non fonctionnelle")
-        except Exception as e:
-            logger.info(f"[CAMERA] Erreur générale lors de la détection de la caméra {i}: {e}")
+                        logger.info(f"[CAMERA] ✓ Caméra fonctionnelle détectée: {name}")
+                        return i, name
+                    else:
+                        logger.info(f"[CAMERA] Caméra {i} ouverte mais ne peut pas lire de frame avec backend {backend_name}")
+                cap.release()
+            except Exception as e:
+                if cap:
+                    cap.release()
+                logger.info(f"[CAMERA] Backend {backend_name} échoué pour caméra {i}: {e}")
+                continue
+        logger.info(f"[CAMERA] ✗ Caméra {i} non disponible ou non fonctionnelle")
+    except Exception as e:
+        logger.info(f"[CAMERA] Erreur générale lors de la détection de la caméra {i}: {e}")
+    return None
+
+
+def _video_device_ids():
+    """IDs of the /dev/video* nodes, or ``None`` when the platform has no such nodes."""
+    paths = glob.glob('/dev/video*')
+    if not paths and not os.path.isdir('/dev'):
+        return None
+    ids = []
+    for path in paths:
+        suffix = path[len('/dev/video'):]
+        if suffix.isdigit():
+            ids.append(int(suffix))
+    return sorted(ids)
+
+
+def detect_cameras(camera_ids=None, timeout=8.0, skip_ids=()):
+    """Detect available USB cameras, probing every device concurrently.
+
+    Each probe runs in its own daemon thread; probes still running after
+    ``timeout`` seconds are reported as unavailable. ``skip_ids`` are never
+    opened (e.g. the camera currently streaming).
+    """
+    logger.info("[CAMERA] Début de la détection des caméras USB...")
+    if camera_ids is None:
+        camera_ids = _video_device_ids()
+        if camera_ids is None:
+            camera_ids = range(10)
+    results = {}
+    threads = []
+    for i in camera_ids:
+        if i in skip_ids:
+            continue
+        thread = threading.Thread(target=lambda i=i: results.__setitem__(i, _probe_camera(i)))
+        thread.daemon = True
+        thread.start()
+        threads.append((i, thread))
+    deadline = time.monotonic() + timeout
+    for i, thread in threads:
+        thread.join(max(deadline - time.monotonic(), 0))
+        if thread.is_alive():
+            logger.info(f"[CAMERA] Délai dépassé pour la caméra {i}")
+    available_cameras = [results[i] for i, _ in threads if results.get(i)]
     logger.info(f"[CAMERA] Détection terminée. {len(available_cameras)} caméra(s) fonctionnelle(s) trouvée(s)")
     return available_cameras
 
 
+class CameraInventory:
+    """Cached list of USB cameras, refreshed in the background.
+
+    The cache is only re-probed when the set of ``/dev/video*`` nodes changes
+    or when ``rescan()`` is called, so reading it never waits on the hardware.
+    """
+
+    def __init__(self, timeout=8.0):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.cameras = []
+        self.names = {}
+        self.scanning = False
+        self.last_scan = None
+        self._signature = None
+        self._busy_ids = ()
+
+    def get(self, busy_ids=()):
+        """Return the cached ``(id, name)`` list; cameras in ``busy_ids`` are listed but not probed."""
+        signature = _video_device_ids()
+        with self.lock:
+            stale = self.last_scan is None or (signature is not None and signature != self._signature)
+        if stale:
+            self.rescan(busy_ids)
+        with self.lock:
+            cameras = list(self.cameras)
+            names = dict(self.names)
+        listed = {camera_id for camera_id, _ in cameras}
+        for camera_id in busy_ids:
+            if camera_id not in listed:
+                cameras.append((camera_id, names.get(camera_id, f"Caméra {camera_id}") + " (en cours d'utilisation)"))
+        return sorted(cameras)
+
+    def rescan(self, busy_ids=()):
+        """Start a background probe unless one is already running."""
+        with self.lock:
+            if self.scanning:
+                return False
+            self.scanning = True
+            self._busy_ids = tuple(busy_ids)
+        thread = threading.Thread(target=self._scan)
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def _scan(self):
+        signature = _video_device_ids()
+        try:
+            cameras = detect_cameras(signature, timeout=self.timeout, skip_ids=self._busy_ids)
+        finally:
+            with self.lock:
+                self.scanning = False
+        with self.lock:
+            # Garder les caméras occupées connues lors d'un scan précédent
+            cameras += [(i, name) for i, name in self.cameras if i in self._busy_ids]
+            self.cameras = sorted(cameras)
+            self.names.update(dict(cameras))
+            self.last_scan = time.time()
+            self._signature = signature
+
+
+class Frame:
+    """A captured frame, JPEG-encoded lazily and at most once.
+
+    Sources that already produce JPEG (libcamera-vid, MJPG passthrough) pass
+    ``jpeg``; the others pass the raw BGR ``image`` and the encoding only
+    happens when a consumer actually asks for the bytes.
+    """
+
+    def __init__(self, image=None, jpeg=None, quality=85, preview_size=None, still_quality=95):
+        self.image = image
+        self.quality = quality
+        self.preview_size = preview_size
+        self.still_quality = still_quality
+        self.timestamp = time.time()
+        self._jpeg = jpeg
+        self._renditions = {}
+        self._lock = threading.Lock()
+        self._rendition_lock = threading.Lock()
+        # Appelé avec (frame, octets) à chaque encodage, tant que la frame est dans le tampon du hub
+        self.on_grow = None
+        # Instant de publication par le hub (horloge monotone)
+        self.published = None
+
+    def jpeg(self):
+        """Preview JPEG, downscaled to fit within ``preview_size`` when the raw image is larger."""
+        if self._jpeg is None:
+            with self._lock:
+                if self._jpeg is None:
+                    started = time.perf_counter()
+                    image = self.image
+                    size = _fit_within(image, self.preview_size)
+                    if size:
+                        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+                    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                    self._jpeg = buffer.tobytes()
+                    FRAME_ENCODE_SECONDS.labels('preview').observe(time.perf_counter() - started)
+                    self._grew(len(self._jpeg))
+        return self._jpeg
+
+    def still_jpeg(self):
+        """Full-resolution JPEG for the saved photo."""
+        if self.image is None:
+            return self.jpeg()
+        started = time.perf_counter()
+        _, buffer = cv2.imencode('.jpg', self.image, [cv2.IMWRITE_JPEG_QUALITY, self.still_quality])
+        FRAME_ENCODE_SECONDS.labels('still').observe(time.perf_counter() - started)
+        return buffer.tobytes()
+
+    def rendition(self, max_height=None, quality=None):
+        """JPEG limited to ``max_height`` pixels (``None``: full resolution) at ``quality``.
+
+        Each rendition is encoded at most once per frame and shared by every
+        consumer asking for it.
+        """
+        key = (max_height, quality)
+        data = self._renditions.get(key)
+        if data is None:
+            with self._rendition_lock:
+                data = self._renditions.get(key)
+                if data is None:
+                    started = time.perf_counter()
+                    data = self._encode_rendition(max_height, quality)
+                    FRAME_ENCODE_SECONDS.labels('rendition').observe(time.perf_counter() - started)
+                    self._renditions[key] = data
+                    if data is not self._jpeg:
+                        self._grew(len(data))
+        return data
+
+    def _grew(self, nbytes):
+        callback = self.on_grow
+        if callback is not None:
+            callback(self, nbytes)
+
+    def _encode_rendition(self, max_height, quality):
+        image = self.image
+        if image is None:
+            source = self.jpeg()
+            if quality is None and max_height is None:
+                return source
+            # Décodage JPEG à échelle réduite (DCT) quand la rendition est plus petite
+            flags = cv2.IMREAD_COLOR
+            if max_height:
+                height = _jpeg_height(source)
+                for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                                        (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                        (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                    if height and height // factor >= max_height:
+                        flags = reduced
+                        break
+            image = cv2.imdecode(np.frombuffer(source, np.uint8), flags)
+            if image is None:
+                return source
+        height, width = image.shape[:2]
+        if max_height and height > max_height:
+            size = (int(width * max_height / height), max_height)
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality or self.quality])
+        return buffer.tobytes()
+
+    def has_rendition(self, max_height=None, quality=None):
+        return (max_height, quality) in self._renditions
+
+    @property
+    def encoded(self):
+        return self._jpeg is not None
+
+    @property
+    def nbytes(self):
+        """Memory held by the frame (raw image, JPEG and encoded renditions)."""
+        size = self.image.nbytes if self.image is not None else 0
+        if self._jpeg is not None:
+            size += len(self._jpeg)
+        for data in list(self._renditions.values()):
+            if data is not self._jpeg:
+                size += len(data)
+        return size
+
+
+def _fit_within(image, box):
+    """Largest size within ``box`` keeping the aspect ratio of ``image``, or None if it already fits."""
+    if not box:
+        return None
+    height, width = image.shape[:2]
+    # Le côté le plus contraint fixe l'échelle
+    scale = min(box[0] / width, box[1] / height)
+    if scale >= 1:
+        return None
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _jpeg_height(data):
+    """Read the image height from the SOF marker of a JPEG, or 0 if not found."""
+    index = 2
+    length = len(data)
+    while index + 9 < length:
+        if data[index] != 0xFF:
+            return 0
+        marker = data[index + 1]
+        if marker in (0xC0, 0xC1, 0xC2):
+            return (data[index + 5] << 8) | data[index + 6]
+        index += 2 + ((data[index + 2] << 8) | data[index + 3])
+    return 0
+
+
+class FrameSlot:
+    """Latest-frame slot with a monotonically increasing sequence number.
+
+    Producers call ``publish``; consumers block in ``wait`` until a frame newer
+    than the one they already have exists, instead of polling with sleeps.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.closed = False
+
+    def publish(self, frame):
+        with self.condition:
+            self.frame = frame
+            self.seq += 1
+            self.condition.notify_all()
+
+    def get(self):
+        with self.condition:
+            return self.frame
+
+    def wait(self, after_seq=0, timeout=None):
+        """Return ``(seq, frame)`` once ``seq > after_seq``, or ``None`` on timeout/close."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > after_seq or self.closed, timeout)
+            if self.seq <= after_seq:
+                return None
+            return self.seq, self.frame
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class MjpegDemuxer:
+    """Split a raw MJPEG byte stream (e.g. libcamera-vid stdout) into JPEG frames.
+
+    Data is read with ``readinto`` into a preallocated ``bytearray`` and the
+    marker search resumes where it previously stopped, so every byte is scanned
+    once. Frames are returned as ``memoryview`` slices of the internal buffer:
+    they stay valid only until the next call to ``read_frame``.
+    """
+
+    SOI = b'\xff\xd8'
+    EOI = b'\xff\xd9'
+
+    def __init__(self, stream, buffer_size=1024 * 1024, read_size=64 * 1024):
+        self.stream = stream
+        self.read_size = read_size
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0          # début des données non consommées
+        self.end = 0            # fin des données valides
+        self.scan = 0           # position de reprise de la recherche de marqueurs
+        self.frame_start = -1   # position du SOI de la frame en cours, -1 si aucune
+        self.bytes_read = 0
+        self.frames = 0
+
+    def read_frame(self):
+        """Return the next complete JPEG frame as a memoryview, or ``None`` at end of stream."""
+        while True:
+            frame = self._next_frame()
+            if frame is not None:
+                return frame
+            if not self._fill():
+                return None
+
+    def _next_frame(self):
+        if self.frame_start < 0:
+            index = self.buffer.find(self.SOI, self.scan, self.end)
+            if index == -1:
+                # Rien à garder sauf un éventuel 0xFF coupé en fin de lecture
+                self.start = self.scan = max(self.start, self.end - 1)
+                return None
+            self.frame_start = self.start = index
+            self.scan = index + 2
+        index = self.buffer.find(self.EOI, self.scan, self.end)
+        if index == -1:
+            self.scan = max(self.scan, self.end - 1)
+            return None
+        frame = self.view[self.frame_start:index + 2]
+        self.start = self.scan = index + 2
+        self.frame_start = -1
+        self.frames += 1
+        return frame
+
+    def _fill(self):
+        if self.end + self.read_size > len(self.buffer):
+            self._compact()
+        count = self.stream.readinto(self.view[self.end:self.end + self.read_size])
+        if not count:
+            return False
+        self.end += count
+        self.bytes_read += count
+        return True
+
+    def _compact(self):
+        pending = self.end - self.start
+        if pending + self.read_size > len(self.buffer):
+            # Frame plus grande que le buffer : l'agrandir une fois pour toutes
+            buffer = bytearray(max(len(self.buffer) * 2, pending + self.read_size))
+            buffer[:pending] = self.view[self.start:self.end]
+            self.buffer = buffer
+            self.view = memoryview(self.buffer)
+        else:
+            # Copie du reste (moins d'une frame) : les zones peuvent se chevaucher
+            self.buffer[:pending] = bytes(self.view[self.start:self.end])
+        if self.frame_start >= 0:
+            self.frame_start -= self.start
+        self.scan -= self.start
+        self.end = pending
+        self.start = 0
+
+
+class CaptureStats:
+    """Rolling per-frame CPU time and effective frame rate of a capture thread."""
+
+    def __init__(self, source='usb', window=2.0):
+        self.source = source
+        self.window = window
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.cpu_ms = 0.0
+        self.fps = 0.0
+        self._window_start = time.monotonic()
+        self._window_frames = 0
+
+    def frame(self, cpu_seconds):
+        now = time.monotonic()
+        with self.lock:
+            self.frames += 1
+            # Moyenne glissante pour lisser les pics ponctuels
+            self.cpu_ms += (cpu_seconds * 1000 - self.cpu_ms) * 0.1
+            self._window_frames += 1
+            elapsed = now - self._window_start
+            if elapsed >= self.window:
+                self.fps = self._window_frames / elapsed
+                self._window_start = now
+                self._window_frames = 0
+                CAMERA_FPS.labels(self.source).set(round(self.fps, 2))
+        CAMERA_FRAMES.labels(self.source).inc()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'frames': self.frames,
+                'cpu_ms_per_frame': round(self.cpu_ms, 3),
+                'fps': round(self.fps, 2),
+            }
+
+
+def _is_jpeg_buffer(frame):
+    """Tell whether a cv2 read() result is a raw MJPEG buffer rather than decoded pixels."""
+    if frame is None or frame.dtype != 'uint8' or frame.size < 4:
+        return False
+    if frame.ndim == 2 and frame.shape[0] != 1:
+        return False
+    if frame.ndim > 2:
+        return False
+    data = frame.reshape(-1)
+    return data[0] == 0xFF and data[1] == 0xD8
+
+
 class UsbCamera:
-    def __init__(self, camera_id=0):
+    MODE_PASSTHROUGH = 'passthrough'
+    MODE_TRANSCODE = 'transcode'
+
+    def __init__(self, camera_id=0, passthrough=True, preview_size=(1280, 720), still_quality=95):
         self.camera_id = camera_id
+        self.passthrough = passthrough
+        self.preview_size = preview_size
+        self.still_quality = still_quality
         self.camera = None
         self.is_running = False
         self.thread = None
-        self.frame = None
-        self.lock = threading.Lock()
+        self.slot = FrameSlot()
         self.error = None
+        self.mode = None
+        self.resolution = None
+        self.stats = CaptureStats('usb')
 
     def start(self):
         if self.is_running:
             return True
-        return self._initialize_camera()
+        if not self._initialize_camera():
+            return False
+        self.is_running = True
+        self.thread = threading.Thread(target=self._capture_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
 
     def _initialize_camera(self):
+        """Open the camera, trying the format remembered for this ID before a full probe."""
+        remembered = load_camera_format(self.camera_id)
+        if remembered and self._open_remembered(remembered):
+            return True
+        return self._probe_formats()
+
+    def _open_remembered(self, fmt):
+        """Reopen with a previously negotiated format: one open, one read."""
+        backend_name = BACKEND_NAMES.get(fmt.get('backend'), "Inconnu")
+        try:
+            self.camera = cv2.VideoCapture(self.camera_id, fmt['backend'])
+            if not self.camera.isOpened():
+                self.camera.release()
+                logger.info(f"[USB CAMERA] Format mémorisé inutilisable (backend {backend_name}), détection complète...")
+                return False
+            self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, fmt['width'])
+            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, fmt['height'])
+            self.camera.set(cv2.CAP_PROP_FPS, fmt.get('fps') or 25)
+            passthrough = self.passthrough and fmt.get('mode') == self.MODE_PASSTHROUGH
+            if passthrough:
+                self.camera.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+            ret, frame = self.camera.read()
+            if passthrough:
+                ok = ret and _is_jpeg_buffer(frame)
+            else:
+                ok = ret and frame is not None and frame.ndim == 3 and \
+                    frame.shape[1] >= fmt['width'] * 0.9 and frame.shape[0] >= fmt['height'] * 0.9
+            if not ok:
+                self.camera.release()
+                logger.info(f"[USB CAMERA] Format mémorisé {fmt['width']}x{fmt['height']} refusé, détection complète...")
+                return False
+        except Exception as e:
+            logger.info(f"[USB CAMERA] Erreur avec le format mémorisé: {e}")
+            if self.camera:
+                self.camera.release()
+            return False
+        self.resolution = (fmt['width'], fmt['height'])
+        self.mode = self.MODE_PASSTHROUGH if passthrough else self.MODE_TRANSCODE
+        logger.info(
+            f"[USB CAMERA] Caméra {self.camera_id} ouverte avec le format mémorisé "
+            f"({backend_name}, {fmt['width']}x{fmt['height']}, {self.mode})"
+        )
+        return True
+
+    def _probe_formats(self):
         backends = [cv2.CAP_DSHOW, cv2.CAP_ANY, cv2.CAP_V4L2, cv2.CAP_GSTREAMER]
         for backend in backends:
             try:
-                backend_name = {
-                    cv2.CAP_ANY: "Auto",
-                    cv2.CAP_DSHOW: "DirectShow",
-                    cv2.CAP_V4L2: "V4L2",
-                    cv2.CAP_GSTREAMER: "GStreamer",
-                }.get(backend, "Inconnu")
+                backend_name = BACKEND_NAMES.get(backend, "Inconnu")
                 logger.info(f"[USB CAMERA] Tentative d'ouverture de la caméra {self.camera_id} avec backend {backend_name}...")
                 self.camera = cv2.VideoCapture(self.camera_id, backend)
                 if not self.camera.isOpened():
@@ -103,6 +582,8 @@ class UsbCamera:
                     if self.camera:
                         self.camera.release()
                     continue
+                # Demander le MJPEG natif avant la résolution (ignoré si non supporté)
+                self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
                 resolutions_to_test = [
                     (1920, 1080, "Full HD"),
                     (1280, 720, "HD"),
@@ -136,10 +617,16 @@ class UsbCamera:
                     )
                     self.camera.release()
                     continue
-                self.is_running = True
-                self.thread = threading.Thread(target=self._capture_loop)
-                self.thread.daemon = True
-                self.thread.start()
+                self.resolution = best_resolution[:2]
+                self.mode = self._negotiate_mode()
+                logger.info(f"[USB CAMERA] Mode de capture: {self.mode}")
+                save_camera_format(self.camera_id, {
+                    'backend': backend,
+                    'width': best_resolution[0],
+                    'height': best_resolution[1],
+                    'fps': best_resolution[2],
+                    'mode': self.mode,
+                })
                 logger.info(f"[USB CAMERA] Caméra {self.camera_id} démarrée avec succès via backend {backend_name}")
                 return True
             except Exception as e:
@@ -151,8 +638,34 @@ class UsbCamera:
         logger.info(f"[USB CAMERA] Erreur: {self.error}")
         return False
 
+    def _negotiate_mode(self):
+        """Use the driver's compressed MJPEG buffer when possible, else decode + re-encode."""
+        if not self.passthrough:
+            return self.MODE_TRANSCODE
+        fourcc = int(self.camera.get(cv2.CAP_PROP_FOURCC))
+        if fourcc != cv2.VideoWriter_fourcc(*'MJPG'):
+            logger.info("[USB CAMERA] La caméra ne fournit pas de MJPEG natif")
+            return self.MODE_TRANSCODE
+        if self.camera.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+            ret, frame = self.camera.read()
+            if ret and _is_jpeg_buffer(frame):
+                return self.MODE_PASSTHROUGH
+            self.camera.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+        logger.info("[USB CAMERA] Le backend ne permet pas de récupérer le MJPEG brut")
+        return self.MODE_TRANSCODE
+
+    def _preview_size(self, image):
+        """Preview size keeping the capture aspect ratio, or None to keep full resolution."""
+        return _fit_within(image, self.preview_size)
+
+    def capture_still(self, frame=None, timeout=3.0):
+        """Full-resolution JPEG of ``frame`` (or of the latest frame)."""
+        frame = frame or self.get_frame()
+        return frame.still_jpeg() if frame else None
+
     def _reconnect(self):
         logger.info(f"[USB CAMERA] Tentative de reconnexion de la caméra {self.camera_id}...")
+        CAMERA_RECONNECTS.inc()
         if self.camera:
             self.camera.release()
         self.camera = None
@@ -169,11 +682,21 @@ class UsbCamera:
                     self._reconnect()
                     time.sleep(1)
                     continue
+                # read() bloque jusqu'à la frame suivante : pas de sleep nécessaire.
+                # Le temps CPU du thread inclut le décodage fait par OpenCV dans read().
+                cpu_start = time.thread_time()
+                read_start = time.perf_counter()
                 ret, frame = self.camera.read()
-                if ret:
-                    _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                    with self.lock:
-                        self.frame = jpeg.tobytes()
+                CAMERA_READ_SECONDS.labels('usb').observe(time.perf_counter() - read_start)
+                if ret and self.mode == self.MODE_PASSTHROUGH:
+                    self.slot.publish(Frame(jpeg=frame.tobytes()))
+                    self.stats.frame(time.thread_time() - cpu_start)
+                    consecutive_errors = 0
+                elif ret:
+                    # Garder l'image brute : l'encodage JPEG se fait à la demande
+                    self.slot.publish(Frame(image=frame, quality=85, preview_size=self._preview_size(frame),
+                                            still_quality=self.still_quality))
+                    self.stats.frame(time.thread_time() - cpu_start)
                     consecutive_errors = 0
                 else:
                     consecutive_errors += 1
@@ -182,7 +705,6 @@ class UsbCamera:
                         logger.info(f"[USB CAMERA] Trop d'erreurs consécutives, tentative de reconnexion...")
                         self._reconnect()
                         consecutive_errors = 0
-                time.sleep(0.03)
             except Exception as e:
                 consecutive_errors += 1
                 logger.info(f"[USB CAMERA] Erreur de capture: {e} (tentative {consecutive_errors}/{max_errors})")
@@ -193,14 +715,495 @@ class UsbCamera:
                 time.sleep(0.1)
 
     def get_frame(self):
-        with self.lock:
-            return self.frame
+        return self.slot.get()
+
+    def wait_frame(self, after_seq=0, timeout=None):
+        return self.slot.wait(after_seq, timeout)
+
+    def get_stats(self):
+        stats = self.stats.snapshot()
+        stats.update({
+            'source': 'usb',
+            'camera_id': self.camera_id,
+            'mode': self.mode,
+            'resolution': self.resolution,
+        })
+        return stats
 
     def stop(self):
         self.is_running = False
+        self.slot.close()
         if self.thread:
             self.thread.join(timeout=1.0)
         if self.camera:
             self.camera.release()
         logger.info(f"[USB CAMERA] Caméra {self.camera_id} arrêtée")
 
+
+
+def _terminate_process(process):
+    try:
+        process.terminate()
+        process.wait(timeout=2)
+    except Exception:
+        try:
+            process.kill()
+        except Exception:
+            pass
+
+
+class PiCamera:
+    """Capture an MJPEG stream from the Raspberry Pi camera through libcamera-vid.
+
+    The stream runs at the (low) preview resolution; ``capture_still`` briefly
+    hands the sensor to libcamera-still for a full-resolution photo.
+    """
+
+    def __init__(self, width=1280, height=720, framerate=15, still_capture=True, still_quality=95):
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.still_capture = still_capture
+        self.still_quality = still_quality
+        self.process = None
+        self.is_running = False
+        self.thread = None
+        self.slot = FrameSlot()
+        self.error = None
+        self.stats = CaptureStats('picamera')
+        self._still_lock = threading.Lock()
+        self._process_ready = threading.Event()
+
+    def start(self):
+        if self.is_running:
+            return True
+        if not self._spawn_preview():
+            return False
+        self.is_running = True
+        self.thread = threading.Thread(target=self._capture_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def _spawn_preview(self):
+        # Commande libcamera-vid pour flux MJPEG - résolution 16/9
+        cmd = [
+            'libcamera-vid',
+            '--codec', 'mjpeg',
+            '--width', str(self.width),
+            '--height', str(self.height),
+            '--framerate', str(self.framerate),
+            '--timeout', '0',    # Durée infinie
+            '--output', '-',     # Sortie vers stdout
+            '--inline',          # Headers inline
+            '--flush',           # Flush immédiat
+            '--nopreview'        # Pas d'aperçu local
+        ]
+        try:
+            self.process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                bufsize=0
+            )
+        except Exception as e:
+            self.error = f"Impossible de lancer libcamera-vid: {e}"
+            logger.info(f"[PI CAMERA] Erreur: {self.error}")
+            return False
+        self._process_ready.set()
+        logger.info(f"[PI CAMERA] libcamera-vid démarré ({self.width}x{self.height}@{self.framerate}fps)")
+        return True
+
+    def _capture_loop(self):
+        while self.is_running:
+            process = self.process
+            if process is None:
+                # Photo haute résolution en cours : attendre le retour de l'aperçu
+                self._process_ready.wait(1.0)
+                continue
+            self._read_process(process)
+            if self.is_running and process is not self.process:
+                continue
+            break
+        if self.is_running:
+            self.error = "Le flux libcamera-vid s'est interrompu"
+            logger.info(f"[PI CAMERA] {self.error}")
+        self.is_running = False
+        self.slot.close()
+
+    def _read_process(self, process):
+        demuxer = MjpegDemuxer(process.stdout)
+        while self.is_running and process.poll() is None:
+            try:
+                cpu_start = time.thread_time()
+                read_start = time.perf_counter()
+                frame = demuxer.read_frame()
+                if frame is None:
+                    break
+                CAMERA_READ_SECONDS.labels('picamera').observe(time.perf_counter() - read_start)
+                # Une seule copie par frame : elle doit survivre au buffer du démultiplexeur
+                self.slot.publish(Frame(jpeg=bytes(frame)))
+                self.stats.frame(time.thread_time() - cpu_start)
+            except Exception as e:
+                logger.info(f"[PI CAMERA] Erreur lecture flux: {e}")
+                break
+
+    def capture_still(self, frame=None, timeout=3.0):
+        """Take a full-sensor-resolution JPEG with libcamera-still.
+
+        The preview is interrupted for the duration of the shot. Returns
+        ``None`` if the still could not be produced within ``timeout`` seconds.
+        """
+        if not self.still_capture:
+            return None
+        deadline = time.monotonic() + timeout
+        with self._still_lock:
+            if not self.is_running:
+                return None
+            process, self.process = self.process, None
+            self._process_ready.clear()
+            if process:
+                _terminate_process(process)
+            cmd = [
+                'libcamera-still',
+                '--immediate',
+                '--nopreview',
+                '--timeout', '1',
+                '--encoding', 'jpg',
+                '--quality', str(self.still_quality),
+                '--output', '-',
+            ]
+            data = None
+            try:
+                remaining = max(deadline - time.monotonic(), 0.1)
+                result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=remaining)
+                if result.returncode == 0 and result.stdout.startswith(b'\xff\xd8'):
+                    data = result.stdout
+                else:
+                    logger.info(f"[PI CAMERA] libcamera-still a échoué (code {result.returncode})")
+            except subprocess.TimeoutExpired:
+                logger.info(f"[PI CAMERA] Photo haute résolution abandonnée (budget de {timeout:.1f}s dépassé)")
+            except Exception as e:
+                logger.info(f"[PI CAMERA] Erreur libcamera-still: {e}")
+            finally:
+                if self.is_running:
+                    self._spawn_preview()
+            return data
+
+    def get_frame(self):
+        return self.slot.get()
+
+    def wait_frame(self, after_seq=0, timeout=None):
+        return self.slot.wait(after_seq, timeout)
+
+    def get_stats(self):
+        stats = self.stats.snapshot()
+        stats.update({
+            'source': 'picamera',
+            'mode': 'libcamera-mjpeg',
+            'resolution': (self.width, self.height),
+        })
+        return stats
+
+    def stop(self):
+        self.is_running = False
+        self.slot.close()
+        self._process_ready.set()
+        with self._still_lock:
+            process, self.process = self.process, None
+        if process:
+            _terminate_process(process)
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        logger.info("[PI CAMERA] libcamera-vid arrêté")
+
+
+def _jpeg_padded(jpeg, size):
+    """Pad a JPEG to exactly ``size`` bytes with COM segments (still a valid image)."""
+    missing = size - len(jpeg)
+    if missing < 4:
+        return jpeg
+    padding = bytearray()
+    while missing >= 4:
+        chunk = min(missing - 4, 65533)
+        padding += b'\xff\xfe' + (chunk + 2).to_bytes(2, 'big') + bytes(chunk)
+        missing -= chunk + 4
+    # Les segments COM se placent juste après le marqueur SOI
+    return jpeg[:2] + bytes(padding) + jpeg[2:]
+
+
+class _PacedSource(abc.ABC):
+    """Base of the hardware-free sources: one thread publishing frames at ``fps``.
+
+    ``fps=0`` publishes as fast as possible (throughput benchmarks).
+    """
+
+    name = 'paced'
+
+    def __init__(self, fps=15):
+        self.fps = fps
+        self.is_running = False
+        self.thread = None
+        self.slot = FrameSlot()
+        self.error = None
+        self.stats = CaptureStats(self.name)
+
+    def start(self):
+        if self.is_running:
+            return True
+        if not self._open():
+            return False
+        self.is_running = True
+        self.thread = threading.Thread(target=self._capture_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def _capture_loop(self):
+        interval = 1.0 / self.fps if self.fps else 0.0
+        next_due = time.monotonic()
+        while self.is_running:
+            if interval:
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                # Rattraper le retard sans rafale si le consommateur a pris du retard
+                next_due = max(next_due + interval, time.monotonic())
+            try:
+                cpu_start = time.thread_time()
+                frame = self._next_frame()
+                if frame is None:
+                    self.error = self.error or "Fin du flux"
+                    break
+                self.slot.publish(frame)
+                self.stats.frame(time.thread_time() - cpu_start)
+            except Exception as e:
+                self.error = str(e)
+                logger.info(f"[{self.name.upper()} CAMERA] Erreur de capture: {e}")
+                break
+        self.is_running = False
+        self.slot.close()
+
+    def _open(self):
+        return True
+
+    @abc.abstractmethod
+    def _next_frame(self):
+        """Next Frame to publish, or None at the end of the stream."""
+
+    def get_frame(self):
+        return self.slot.get()
+
+    def wait_frame(self, after_seq=0, timeout=None):
+        return self.slot.wait(after_seq, timeout)
+
+    def capture_still(self, frame=None, timeout=3.0):
+        """Full-resolution JPEG of ``frame`` (or of the latest frame)."""
+        frame = frame or self.get_frame()
+        return frame.still_jpeg() if frame else None
+
+    def get_stats(self):
+        stats = self.stats.snapshot()
+        stats['source'] = self.name
+        return stats
+
+    def stop(self):
+        self.is_running = False
+        self.slot.close()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+
+
+class SyntheticCamera(_PacedSource):
+    """Generated frames at a chosen resolution, rate and JPEG size.
+
+    With ``encoded=True`` the frames are pre-encoded JPEGs, like a camera in
+    MJPG passthrough; with ``encoded=False`` raw images are published and
+    every consumer pays the JPEG encode, like the transcode path.
+    """
+
+    name = 'synthetic'
+
+    def __init__(self, width=1280, height=720, fps=15, jpeg_size=None, encoded=True,
+                 preview_size=None, still_quality=95, variants=30):
+        super().__init__(fps)
+        self.width = width
+        self.height = height
+        self.jpeg_size = jpeg_size
+        self.encoded = encoded
+        self.preview_size = preview_size
+        self.still_quality = still_quality
+        self.variants = variants
+        self._images = []
+        self._jpegs = []
+        self._index = 0
+
+    def _open(self):
+        # Bruit + dégradé qui défile : des images différentes, chères à compresser
+        rng = np.random.default_rng(0)
+        noise = rng.integers(0, 64, (self.height, self.width, 3), dtype=np.uint8)
+        ramp = np.linspace(0, 191, self.width, dtype=np.uint8)[None, :, None]
+        for i in range(self.variants):
+            image = noise + np.roll(ramp, i * self.width // self.variants, axis=1)
+            self._images.append(image)
+            if self.encoded:
+                self._jpegs.append(self._encode(image))
+        logger.info(f"[SYNTHETIC CAMERA] {self.width}x{self.height} à {self.fps or 'max'} fps"
+                    f"{f', {len(self._jpegs[0])} octets/frame' if self._jpegs else ''}")
+        return True
+
+    def _encode(self, image):
+        quality = 85
+        while True:
+            _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            jpeg = buffer.tobytes()
+            if not self.jpeg_size or len(jpeg) <= self.jpeg_size or quality <= 10:
+                break
+            quality -= 10
+        return _jpeg_padded(jpeg, self.jpeg_size) if self.jpeg_size else jpeg
+
+    def _next_frame(self):
+        index = self._index
+        self._index = (index + 1) % self.variants
+        if self.encoded:
+            frame = Frame(jpeg=self._jpegs[index], still_quality=self.still_quality)
+            frame.image = self._images[index]
+            return frame
+        return Frame(image=self._images[index], preview_size=self.preview_size,
+                     still_quality=self.still_quality)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({
+            'mode': 'jpeg' if self.encoded else 'raw',
+            'resolution': (self.width, self.height),
+            'jpeg_size': len(self._jpegs[0]) if self._jpegs else None,
+        })
+        return stats
+
+
+class FileReplayCamera(_PacedSource):
+    """Replay a recorded MJPEG stream (.mjpeg/.mjpg) or any video file OpenCV can read.
+
+    MJPEG files are demuxed without decoding, like the libcamera-vid pipe;
+    other videos are decoded and published as raw images.
+    """
+
+    name = 'replay'
+    MJPEG_EXTENSIONS = ('.mjpeg', '.mjpg')
+
+    def __init__(self, path, fps=None, loop=True, preview_size=None, still_quality=95):
+        super().__init__(fps or 0)
+        self.path = path
+        self.loop = loop
+        self.preview_size = preview_size
+        self.still_quality = still_quality
+        self.is_mjpeg = path.lower().endswith(self.MJPEG_EXTENSIONS)
+        self.frames_replayed = 0
+        self._file = None
+        self._demuxer = None
+        self._capture = None
+        self._requested_fps = fps
+
+    def _open(self):
+        if not os.path.exists(self.path):
+            self.error = f"Fichier introuvable: {self.path}"
+            logger.info(f"[REPLAY CAMERA] {self.error}")
+            return False
+        if self.is_mjpeg:
+            self._file = open(self.path, 'rb')
+            self._demuxer = MjpegDemuxer(self._file)
+            # Un flux MJPEG brut n'a pas d'horodatage : cadence de libcamera-vid par défaut
+            self.fps = 15 if self._requested_fps is None else self._requested_fps
+        else:
+            self._capture = cv2.VideoCapture(self.path)
+            if not self._capture.isOpened():
+                self.error = f"Impossible de lire la vidéo: {self.path}"
+                logger.info(f"[REPLAY CAMERA] {self.error}")
+                return False
+            if self._requested_fps is None:
+                self.fps = self._capture.get(cv2.CAP_PROP_FPS) or 15
+        logger.info(f"[REPLAY CAMERA] Lecture de {self.path} à {self.fps or 'max'} fps")
+        return True
+
+    def _rewind(self):
+        if self.is_mjpeg:
+            self._file.seek(0)
+            self._demuxer = MjpegDemuxer(self._file)
+        else:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def _read(self):
+        if self.is_mjpeg:
+            data = self._demuxer.read_frame()
+            return None if data is None else Frame(jpeg=bytes(data), still_quality=self.still_quality)
+        ret, image = self._capture.read()
+        if not ret:
+            return None
+        return Frame(image=image, preview_size=self.preview_size, still_quality=self.still_quality)
+
+    def _next_frame(self):
+        frame = self._read()
+        if frame is None and self.loop and self.frames_replayed:
+            self._rewind()
+            frame = self._read()
+        if frame is not None:
+            self.frames_replayed += 1
+        return frame
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({
+            'mode': 'mjpeg' if self.is_mjpeg else 'video',
+            'path': self.path,
+            'frames_replayed': self.frames_replayed,
+        })
+        return stats
+
+    def stop(self):
+        super().stop()
+        if self._capture:
+            self._capture.release()
+        if self._file:
+            self._file.close()
+        logger.info(f"[REPLAY CAMERA] Lecture de {self.path} arrêtée")
+
+
+def camera_source_from_config(config):
+    """Build the camera source selected by ``camera_type`` in the configuration."""
+    camera_type = config.get('camera_type', 'picamera')
+    # Aperçu basse résolution, la photo est prise en pleine résolution
+    preview_size = (config.get('preview_width', 1280), config.get('preview_height', 720))
+
+    # Utiliser la caméra USB si configurée
+    if camera_type == 'usb':
+        logger.info("[CAMERA] Démarrage de la caméra USB...")
+        return UsbCamera(camera_id=config.get('usb_camera_id', 0),
+                         passthrough=config.get('usb_mjpeg_passthrough', True),
+                         preview_size=preview_size,
+                         still_quality=config.get('still_quality', 95))
+
+    # Sources sans matériel, pour les benchmarks et la CI
+    if camera_type == 'synthetic':
+        logger.info("[CAMERA] Démarrage de la caméra synthétique...")
+        jpeg_kb = config.get('synthetic_jpeg_kb')
+        return SyntheticCamera(width=config.get('synthetic_width', 1280),
+                               height=config.get('synthetic_height', 720),
+                               fps=config.get('synthetic_fps', 15),
+                               jpeg_size=int(jpeg_kb * 1024) if jpeg_kb else None,
+                               encoded=config.get('synthetic_encoded', True),
+                               preview_size=preview_size,
+                               still_quality=config.get('still_quality', 95))
+    if camera_type == 'replay':
+        logger.info("[CAMERA] Démarrage de la relecture de fichier...")
+        return FileReplayCamera(config.get('replay_file', 'capture.mjpeg'),
+                                fps=config.get('replay_fps'),
+                                loop=config.get('replay_loop', True),
+                                preview_size=preview_size,
+                                still_quality=config.get('still_quality', 95))
+
+    # Utiliser la Pi Camera par défaut
+    logger.info("[CAMERA] Démarrage de la Pi Camera...")
+    return PiCamera(width=preview_size[0], height=preview_size[1], framerate=15,
+                    still_capture=config.get('pi_still_capture', True),
+                    still_quality=config.get('still_quality', 95))
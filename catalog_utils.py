@@ -0,0 +1,243 @@
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+from metrics_utils import Counter
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+SLIDESHOW_REQUESTS = Counter('photobooth_slideshow_requests_total', 'Slideshow feed responses by type', ['result'])
+
+# Nombre d'événements gardés dans le journal des changements ; un curseur plus
+# ancien reçoit la liste complète
+MAX_CHANGES = 1000
+
+# Colonnes de tri autorisées (jamais de SQL construit depuis la requête)
+SORT_COLUMNS = {
+    'date': 'mtime',
+    'name': 'filename',
+    'size': 'size',
+}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS photos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    print_count INTEGER NOT NULL DEFAULT 0,
+    last_printed REAL,
+    UNIQUE (kind, filename)
+);
+CREATE INDEX IF NOT EXISTS photos_mtime ON photos (mtime DESC);
+CREATE INDEX IF NOT EXISTS photos_kind_mtime ON photos (kind, mtime DESC);
+CREATE INDEX IF NOT EXISTS photos_kind_filename ON photos (kind, filename);
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT,
+    filename TEXT,
+    action TEXT NOT NULL
+);
+'''
+
+
+class PhotoCatalog:
+    """SQLite index of the photos on disk, one row per file.
+
+    The app updates it on capture, effect, delete and print, so listing the
+    gallery is an indexed, paginated query instead of a directory scan.
+    ``reconcile()`` brings it back in line with the folders (files copied or
+    deleted by hand) and runs once in the background at startup.
+
+    Every add and remove is also appended to a change log, so the slideshow
+    can poll ``changes(since)`` for a delta instead of the full list, and
+    ``wait_for_change()`` can hold a long-poll until something new arrives.
+    """
+
+    def __init__(self, path, folders):
+        self.path = path
+        # Type de photo -> dossier ('photo': photos/, 'effet': effet/)
+        self.folders = dict(folders)
+        self.lock = threading.Lock()
+        self.reconciling = False
+        self.last_reconcile = None
+        self.changed = threading.Condition()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._connection.row_factory = sqlite3.Row
+        with self.lock, self._connection:
+            # WAL : plusieurs workers peuvent lire pendant qu'un autre écrit
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript(_SCHEMA)
+
+    def _execute(self, sql, params=()):
+        with self.lock, self._connection:
+            return self._connection.execute(sql, params).fetchall()
+
+    def _write(self, sql, params, changes):
+        """Run one write and log its ``(kind, filename, action)`` changes in the same transaction."""
+        with self.lock, self._connection:
+            if isinstance(params, list):
+                self._connection.executemany(sql, params)
+            else:
+                self._connection.execute(sql, params)
+            if changes:
+                self._connection.executemany('INSERT INTO changes (kind, filename, action) VALUES (?, ?, ?)', changes)
+                self._connection.execute('DELETE FROM changes WHERE id <= (SELECT MAX(id) FROM changes) - ?',
+                                         (MAX_CHANGES,))
+        if changes:
+            with self.changed:
+                self.changed.notify_all()
+
+    def add(self, kind, filename):
+        """Index (or refresh) a file that was just written."""
+        path = os.path.join(self.folders[kind], filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        self._write(
+            'INSERT INTO photos (kind, filename, size, mtime) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (kind, filename) DO UPDATE SET size = excluded.size, mtime = excluded.mtime',
+            (kind, filename, stat.st_size, stat.st_mtime), [(kind, filename, 'add')])
+
+    def remove(self, filename, kind=None):
+        kinds = [kind] if kind else list(self.folders)
+        self._write('DELETE FROM photos WHERE kind = ? AND filename = ?', [(k, filename) for k in kinds],
+                    [(k, filename, 'remove') for k in kinds])
+
+    def clear(self, kind=None):
+        if kind is None:
+            self._write('DELETE FROM photos', (), [(None, None, 'clear')])
+        else:
+            self._write('DELETE FROM photos WHERE kind = ?', (kind,), [(kind, None, 'clear')])
+
+    def mark_printed(self, filename):
+        self._execute('UPDATE photos SET print_count = print_count + 1, last_printed = ? WHERE filename = ?',
+                      (time.time(), filename))
+
+    def find(self, filename):
+        """``(kind, path)`` of a file, originals first, or None."""
+        rows = self._execute('SELECT kind FROM photos WHERE filename = ? ORDER BY kind = ?',
+                             (filename, 'effet'))
+        for row in rows:
+            return row['kind'], os.path.join(self.folders[row['kind']], filename)
+        return None
+
+    def counts(self):
+        counts = dict.fromkeys(self.folders, 0)
+        for row in self._execute('SELECT kind, COUNT(*) AS total FROM photos GROUP BY kind'):
+            counts[row['kind']] = row['total']
+        return counts
+
+    def page(self, page=1, per_page=50, kind=None, sort='date', descending=True):
+        """One page of photos as dicts (filename, kind, folder, size, mtime, print_count)."""
+        column = SORT_COLUMNS.get(sort, 'mtime')
+        direction = 'DESC' if descending else 'ASC'
+        where, params = ('WHERE kind = ?', [kind]) if kind else ('', [])
+        rows = self._execute(
+            f'SELECT kind, filename, size, mtime, print_count FROM photos {where} '
+            f'ORDER BY {column} {direction}, id {direction} LIMIT ? OFFSET ?',
+            params + [per_page, (max(page, 1) - 1) * per_page])
+        return [dict(row, folder=self.folders[row['kind']]) for row in rows]
+
+    def filenames(self, kind, descending=True):
+        direction = 'DESC' if descending else 'ASC'
+        rows = self._execute(f'SELECT filename FROM photos WHERE kind = ? ORDER BY filename {direction}', (kind,))
+        return [row['filename'] for row in rows]
+
+    def cursor(self):
+        """Id of the latest change, the ``since`` value for the next ``changes()`` call."""
+        return self._execute('SELECT COALESCE(MAX(id), 0) AS last FROM changes')[0]['last']
+
+    def changes(self, kind, since=None):
+        """Photos of ``kind`` added or removed after the ``since`` cursor.
+
+        Returns ``(cursor, added, removed, reset)``. When ``since`` is missing,
+        older than the kept log or ahead of it (catalog recreated), or a clear
+        happened in between, ``reset`` is True and ``added`` is the full list,
+        newest first.
+        """
+        with self.lock, self._connection:
+            last, first = self._connection.execute(
+                'SELECT COALESCE(MAX(id), 0), COALESCE(MIN(id), 1) FROM changes').fetchone()
+            rows = []
+            reset = since is None or since > last or since < first - 1
+            if not reset:
+                rows = self._connection.execute(
+                    'SELECT filename, action FROM changes WHERE id > ? AND (kind = ? OR kind IS NULL) ORDER BY id',
+                    (since, kind)).fetchall()
+                reset = any(row['action'] == 'clear' for row in rows)
+        if reset:
+            return last, self.filenames(kind), [], True
+        added, removed = [], []
+        for row in rows:
+            if row['action'] == 'add':
+                if row['filename'] in removed:
+                    removed.remove(row['filename'])
+                if row['filename'] not in added:
+                    added.append(row['filename'])
+            elif row['filename'] in added:
+                added.remove(row['filename'])
+            elif row['filename'] not in removed:
+                removed.append(row['filename'])
+        added.sort(reverse=True)
+        return last, added, removed, False
+
+    def wait_for_change(self, since, timeout):
+        """Block until the cursor moves past ``since`` or ``timeout`` expires; True if it moved."""
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.cursor() != since:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # Réveil immédiat pour les écritures de ce processus, relecture
+            # périodique pour celles des autres workers
+            with self.changed:
+                self.changed.wait(min(remaining, 1.0))
+
+    def reconcile(self):
+        """Sync the index with the folders: add new or changed files, drop missing ones."""
+        self.reconciling = True
+        started = time.monotonic()
+        added = removed = 0
+        try:
+            for kind, folder in self.folders.items():
+                on_disk = {}
+                if os.path.isdir(folder):
+                    with os.scandir(folder) as entries:
+                        for entry in entries:
+                            if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                                stat = entry.stat()
+                                on_disk[entry.name] = (stat.st_size, stat.st_mtime)
+                indexed = {row['filename']: (row['size'], row['mtime']) for row in
+                           self._execute('SELECT filename, size, mtime FROM photos WHERE kind = ?', (kind,))}
+                changed = [(kind, name, size, mtime) for name, (size, mtime) in on_disk.items()
+                           if indexed.get(name) != (size, mtime)]
+                missing = [(kind, name) for name in indexed if name not in on_disk]
+                self._write(
+                    'INSERT INTO photos (kind, filename, size, mtime) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (kind, filename) DO UPDATE SET size = excluded.size, mtime = excluded.mtime',
+                    changed, [(kind, name, 'add') for _, name, _, _ in changed])
+                self._write('DELETE FROM photos WHERE kind = ? AND filename = ?', missing,
+                            [(kind, name, 'remove') for _, name in missing])
+                added += len(changed)
+                removed += len(missing)
+            self.last_reconcile = time.time()
+            logger.info(f"[CATALOG] Index synchronisé avec le disque: {added} ajout(s)/mise(s) à jour, "
+                        f"{removed} suppression(s) en {time.monotonic() - started:.2f}s")
+        finally:
+            self.reconciling = False
+        return added, removed
+
+    def reconcile_async(self):
+        thread = threading.Thread(target=self.reconcile, name='catalog-reconcile')
+        thread.daemon = True
+        thread.start()
+        return thread
@@ -5,6 +5,10 @@ import logging
 PHOTOS_FOLDER = 'photos'
 EFFECT_FOLDER = 'effet'
 CONFIG_FILE = 'config.json'
+CAMERA_FORMATS_FILE = 'camera_formats.json'
+CATALOG_FILE = 'photos.db'
+RENDITION_FOLDER = 'renditions'
+PRINT_RASTER_FOLDER = os.path.join(RENDITION_FOLDER, 'print')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
 DEFAULT_CONFIG = {
@@ -24,10 +28,47 @@ DEFAULT_CONFIG = {
     'telegram_send_type': 'photos',
     'camera_type': 'picamera',
     'usb_camera_id': 0,
+    'usb_mjpeg_passthrough': True,
+    'preview_width': 1280,
+    'preview_height': 720,
+    'still_quality': 95,
+    'pi_still_capture': True,
+    'capture_budget_ms': 3000,
+    'frame_buffer_frames': 30,
+    'frame_buffer_mb': 64,
+    'shared_camera': False,
+    'shared_camera_name': 'simplebooth_frames',
+    'shared_camera_socket': '/tmp/simplebooth_camera.sock',
+    'shared_camera_slots': 4,
+    'shared_camera_slot_mb': 2,
+    'synthetic_width': 1280,
+    'synthetic_height': 720,
+    'synthetic_fps': 15,
+    'synthetic_jpeg_kb': None,
+    'synthetic_encoded': True,
+    'replay_file': 'capture.mjpeg',
+    'replay_fps': None,
+    'replay_loop': True,
+    'rendition_cache_mb': 256,
+    'storage_fsync': 'always',
+    'storage_queue_size': 16,
+    'governor_enabled': True,
+    'governor_high_cpu': 85,
+    'governor_reduced_fps': 10,
+    'governor_reduced_height': 480,
+    'governor_reduced_quality': 70,
+    'governor_minimal_fps': 5,
+    'governor_minimal_height': 360,
+    'governor_minimal_quality': 60,
     'printer_enabled': True,
+    'printer_health_interval': 30,
     'printer_port': '/dev/ttyAMA0',
     'printer_baudrate': 9600,
-    'print_resolution': 384
+    'printer_flow_control': 'dsrdtr',
+    'printer_chunk_size': 1024,
+    'print_resolution': 384,
+    'print_dither': 'floyd',
+    'print_cache_mb': 32
 }
 
 logger = logging.getLogger(__name__)
@@ -56,3 +97,29 @@ def save_config(config_data):
     """Save configuration to JSON"""
     with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
         json.dump(config_data, f, indent=2, ensure_ascii=False)
+
+def load_camera_format(camera_id):
+    """Load the format last negotiated for a USB camera ID"""
+    if os.path.exists(CAMERA_FORMATS_FILE):
+        try:
+            with open(CAMERA_FORMATS_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f).get(str(camera_id))
+        except Exception:
+            pass
+    return None
+
+def save_camera_format(camera_id, camera_format):
+    """Remember the format that worked for a USB camera ID"""
+    formats = {}
+    if os.path.exists(CAMERA_FORMATS_FILE):
+        try:
+            with open(CAMERA_FORMATS_FILE, 'r', encoding='utf-8') as f:
+                formats = json.load(f)
+        except Exception:
+            formats = {}
+    formats[str(camera_id)] = camera_format
+    try:
+        with open(CAMERA_FORMATS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(formats, f, indent=2)
+    except Exception as e:
+        logger.info(f"[CAMERA] Impossible d'enregistrer le format de la caméra {camera_id}: {e}")
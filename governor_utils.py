@@ -0,0 +1,176 @@
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+from metrics_utils import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+GOVERNOR_LEVEL = Gauge('photobooth_governor_level', 'Preview degradation level (0 normal, 1 reduced, 2 minimal)')
+GOVERNOR_JOBS = Gauge('photobooth_governor_active_jobs', 'Heavy jobs currently running', ['kind'])
+GOVERNOR_CPU = Gauge('photobooth_cpu_percent', 'System CPU utilisation sampled by the governor')
+GOVERNOR_TRANSITIONS = Counter('photobooth_governor_transitions_total', 'Preview degradation level changes', ['level'])
+
+LEVELS = ('normal', 'reduced', 'minimal')
+
+# Profil d'aperçu par niveau : (fps max, hauteur max, qualité JPEG) ; None = inchangé
+DEFAULT_PROFILES = {
+    'normal': (None, None, None),
+    'reduced': (10, 480, 70),
+    'minimal': (5, 360, 60),
+}
+
+
+def _read_cpu_times():
+    """(busy, total) jiffies from /proc/stat, or None when unavailable."""
+    try:
+        with open('/proc/stat', 'r') as f:
+            fields = [int(value) for value in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+    total = sum(fields[:8])
+    return total - idle, total
+
+
+class CpuGovernor:
+    """Degrade the live preview while heavy jobs (print, effect, thumbnails) run.
+
+    Jobs register with ``job(kind)``. While at least one is active the preview
+    drops to the ``reduced`` profile, and to ``minimal`` if the CPU stays above
+    ``high_cpu`` percent. The normal profile comes back ``restore_delay``
+    seconds after the last job ends, so back-to-back prints do not flap.
+    Listeners receive the new ``(max_fps, max_height, quality)`` profile.
+    """
+
+    def __init__(self, profiles=None, high_cpu=85.0, restore_delay=2.0, interval=1.0, enabled=True):
+        self.profiles = dict(DEFAULT_PROFILES, **(profiles or {}))
+        self.high_cpu = high_cpu
+        self.restore_delay = restore_delay
+        self.interval = interval
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.level = 'normal'
+        self.cpu_percent = None
+        self.listeners = []
+        self.thread = None
+        self._last_job_end = 0.0
+        self._cpu_sample = _read_cpu_times()
+        self._wake = threading.Event()
+
+    @property
+    def profile(self):
+        return self.profiles[self.level]
+
+    def add_listener(self, callback):
+        with self.lock:
+            self.listeners = self.listeners + [callback]
+
+    @contextmanager
+    def job(self, kind):
+        """Mark a heavy job as running for the duration of the ``with`` block."""
+        self.begin(kind)
+        try:
+            yield
+        finally:
+            self.end(kind)
+
+    def begin(self, kind):
+        with self.lock:
+            self.jobs[kind] = self.jobs.get(kind, 0) + 1
+            GOVERNOR_JOBS.labels(kind).set(self.jobs[kind])
+        self._ensure_thread()
+        self._evaluate()
+
+    def end(self, kind):
+        with self.lock:
+            self.jobs[kind] = max(self.jobs.get(kind, 0) - 1, 0)
+            GOVERNOR_JOBS.labels(kind).set(self.jobs[kind])
+            self._last_job_end = time.monotonic()
+        self._wake.set()
+
+    def active_jobs(self):
+        with self.lock:
+            return sum(self.jobs.values())
+
+    def _ensure_thread(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._sample_loop, name='cpu-governor')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _sample_loop(self):
+        # Échantillonner tant qu'un travail tourne ou que l'aperçu n'est pas revenu à la normale
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self._sample_cpu()
+            self._evaluate()
+            with self.lock:
+                if not any(self.jobs.values()) and self.level == 'normal':
+                    self.thread = None
+                    return
+
+    def _sample_cpu(self):
+        sample = _read_cpu_times()
+        previous, self._cpu_sample = self._cpu_sample, sample
+        if sample is None or previous is None or sample[1] <= previous[1]:
+            return
+        self.cpu_percent = round(100.0 * (sample[0] - previous[0]) / (sample[1] - previous[1]), 1)
+        GOVERNOR_CPU.set(self.cpu_percent)
+
+    def _target_level(self):
+        if not self.enabled:
+            return 'normal'
+        with self.lock:
+            jobs = sum(self.jobs.values())
+            last_job_end = self._last_job_end
+        if not jobs:
+            if time.monotonic() - last_job_end < self.restore_delay:
+                return self.level
+            return 'normal'
+        cpu = self.cpu_percent
+        if cpu is not None:
+            if cpu >= self.high_cpu:
+                return 'minimal'
+            # Hystérésis : ne quitter le niveau minimal que nettement sous le seuil
+            if self.level == 'minimal' and cpu >= self.high_cpu - 15:
+                return 'minimal'
+        return 'reduced'
+
+    def _evaluate(self):
+        level = self._target_level()
+        with self.lock:
+            if level == self.level:
+                return
+            previous, self.level = self.level, level
+            listeners = self.listeners
+            jobs = {kind: count for kind, count in self.jobs.items() if count}
+        GOVERNOR_LEVEL.set(LEVELS.index(level))
+        GOVERNOR_TRANSITIONS.labels(level).inc()
+        cpu = 'n/a' if self.cpu_percent is None else f"{self.cpu_percent}%"
+        logger.info(f"[GOVERNOR] Aperçu {previous} -> {level} (travaux: {jobs or 'aucun'}, CPU: {cpu})")
+        profile = self.profiles[level]
+        for callback in listeners:
+            try:
+                callback(*profile)
+            except Exception as e:
+                logger.info(f"[GOVERNOR] Erreur dans un écouteur: {e}")
+
+    def get_stats(self):
+        with self.lock:
+            jobs = {kind: count for kind, count in self.jobs.items() if count}
+        max_fps, max_height, quality = self.profile
+        return {
+            'enabled': self.enabled,
+            'level': self.level,
+            'jobs': jobs,
+            'cpu_percent': self.cpu_percent,
+            'max_fps': max_fps,
+            'max_height': max_height,
+            'quality': quality,
+        }
@@ -0,0 +1,34 @@
+# Configuration gunicorn : plusieurs workers, une seule caméra
+#
+# Le processus maître lance le processus de capture avant de créer les workers ;
+# chaque worker lit les frames en mémoire partagée (shm_utils.py).
+#
+#   gunicorn -c gunicorn.conf.py asgi_app:app
+
+import os
+import secrets
+
+from config_utils import load_config
+from shm_utils import start_capture_process
+
+bind = '0.0.0.0:5000'
+workers = 4
+# Flux vidéo servi par asyncio (voir asgi_app.py)
+worker_class = 'uvicorn.workers.UvicornWorker'
+graceful_timeout = 5
+
+capture_process = None
+
+
+def on_starting(server):
+    global capture_process
+    # Hérités par les workers : mode partagé et clé du canal de commandes
+    os.environ['SIMPLEBOOTH_SHARED_CAMERA'] = '1'
+    os.environ.setdefault('SIMPLEBOOTH_CAMERA_KEY', secrets.token_hex(16))
+    capture_process = start_capture_process(load_config())
+
+
+def on_exit(server):
+    if capture_process and capture_process.is_alive():
+        capture_process.terminate()
+        capture_process.join(timeout=5)
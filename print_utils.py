@@ -0,0 +1,731 @@
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows : un seul processus serveur
+    fcntl = None
+
+from cache_utils import DiskLru
+from metrics_utils import Counter, Gauge, Histogram
+from serial_utils import SerialTransport
+
+logger = logging.getLogger(__name__)
+
+PRINT_SECONDS = Histogram('photobooth_print_seconds', 'Time to print one photo, from request to last paper feed',
+                          buckets=(1, 2, 5, 10, 20, 30, 60, 120))
+PRINT_FIRST_LINE_SECONDS = Histogram('photobooth_print_first_line_seconds',
+                                     'Time from print request to the first image bytes sent to the printer')
+PRINTS = Counter('photobooth_prints_total', 'Print attempts by result', ['result'])
+PRINTER_CONNECTS = Counter('photobooth_printer_connects_total', 'Serial connections opened to the printer', ['result'])
+
+ESCPOS_MISSING = 'Module escpos manquant. Installez-le avec: pip install python-escpos'
+
+
+def _pos():
+    # Import tardif : PIL et escpos ne sont chargés qu'au premier usage (ou au préchauffage)
+    import ScriptPythonPOS
+    return ScriptPythonPOS
+
+
+def _error_message(error):
+    if isinstance(error, ImportError) and 'escpos' in str(error):
+        return ESCPOS_MISSING
+    return str(error)
+
+
+def _describe_transfer(transfer):
+    text = f"{transfer['bytes']} octets envoyés en {transfer['seconds']:.2f}s ({transfer['bytes_per_second']} o/s"
+    if 'stall_seconds' in transfer:
+        text += f", ligne {transfer['line_seconds']:.2f}s, attente imprimante {transfer['stall_seconds']:.2f}s"
+    return text + ')'
+
+
+class PrintService:
+    """Long-lived thermal printer connection shared by every print.
+
+    Replaces one ``ScriptPythonPOS.py`` subprocess per print: the module is
+    imported once, the serial port stays open between prints, and a
+    background thread warms it up at start then checks it (paper status)
+    every ``health_interval`` seconds while idle, reopening it if it failed.
+    The image is prepared before taking the port lock, so a print waiting
+    behind another is ready to send as soon as the port frees up; with a
+    ``rasters`` cache it is usually prepared already, right after the photo
+    was saved (see ``prepare()``).
+    """
+
+    def __init__(self, port='/dev/ttyAMA0', baudrate=9600, health_interval=30.0, connect=None, dither='floyd',
+                 rasters=None, flow_control='dsrdtr', transport=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.flow_control = flow_control
+        self.dither = dither
+        self.rasters = rasters
+        self.transport = transport or SerialTransport()
+        self.health_interval = health_interval
+        self.connect = connect
+        self.lock = threading.Lock()
+        self.printer = None
+        self.thread = None
+        self.paper_ok = None
+        self.paper_message = None
+        self.last_error = None
+        self.last_check = None
+        self._wake = threading.Event()
+
+    def start(self):
+        """Warm up (imports, serial port) and keep checking the printer in the background."""
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._health_loop, name='print-service')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def configure(self, port, baudrate, flow_control=None):
+        """Switch to another port, baudrate or flow control; the next print or check reconnects."""
+        flow_control = flow_control or self.flow_control
+        if (port, baudrate, flow_control) == (self.port, self.baudrate, self.flow_control):
+            return
+        with self.lock:
+            self._close()
+            self.port, self.baudrate, self.flow_control = port, baudrate, flow_control
+        self._wake.set()
+
+    def probe_baudrate(self):
+        """Fastest baudrate the printer answers at on the current port, or None."""
+        with self.lock:
+            # Le port est relâché pendant la détection, puis rouvert à la vitesse configurée
+            self._close()
+            try:
+                return _pos().probe_baudrate(self.port, self.flow_control)
+            finally:
+                self._wake.set()
+
+    def _health_loop(self):
+        try:
+            _pos()
+        except Exception as e:
+            self.last_error = _error_message(e)
+        while True:
+            # Pas de vérification pendant une impression : le port est déjà occupé
+            if self.lock.acquire(blocking=False):
+                try:
+                    self._check()
+                finally:
+                    self.lock.release()
+            self._wake.wait(self.health_interval)
+            self._wake.clear()
+
+    def _ensure_connected(self):
+        if self.printer is not None:
+            return
+        try:
+            if self.connect:
+                self.printer = self.connect(self.port, self.baudrate)
+            else:
+                self.printer = _pos().connect_printer(self.port, self.baudrate, flow_control=self.flow_control)
+        except Exception:
+            PRINTER_CONNECTS.labels('error').inc()
+            raise
+        PRINTER_CONNECTS.labels('ok').inc()
+        logger.info(f"[PRINT] Imprimante ouverte sur {self.port} ({self.baudrate} bauds, "
+                    f"contrôle de flux {self.flow_control})")
+
+    def _close(self):
+        printer, self.printer = self.printer, None
+        if printer is not None:
+            try:
+                printer.close()
+            except Exception:
+                pass
+
+    def _check(self):
+        """Open the port if needed and read the paper status; the caller holds the lock."""
+        self.last_check = time.time()
+        try:
+            self._ensure_connected()
+            self.paper_ok, self.paper_message = _pos().check_paper_status(self.printer)
+            self.last_error = None
+        except Exception as e:
+            self._close()
+            self.paper_ok, self.paper_message = None, None
+            if self.last_error != _error_message(e):
+                logger.info(f"[PRINT] Imprimante indisponible: {e}")
+            self.last_error = _error_message(e)
+
+    def prepare(self, image_path, high_density=False):
+        """Rasterize a photo in the background so a later print only sends bytes."""
+        if self.rasters is not None:
+            self.rasters.submit(image_path, high_density, self.dither)
+
+    def print_file(self, image_path, text=None, high_density=False):
+        """Print an image; returns ``{'success': ...}`` with ``error``/``error_type`` on failure."""
+        started = time.perf_counter()
+        try:
+            pos = _pos()
+            if self.rasters is not None:
+                raster = self.rasters.get(image_path, high_density, self.dither)
+            else:
+                raster = pos.prepare_image(image_path, high_density, self.dither)
+        except Exception as e:
+            PRINTS.labels('error').inc()
+            return {'success': False, 'error': _error_message(e)}
+
+        with self.lock:
+            # Une reconnexion si la connexion gardée ouverte est devenue invalide,
+            # jamais une fois l'envoi de l'image commencé (double impression)
+            for attempt in range(2):
+                sending = False
+                try:
+                    self._ensure_connected()
+                    self.paper_ok, self.paper_message = pos.check_paper_status(self.printer)
+                    if self.paper_ok is None and self.paper_message.startswith('Erreur') and not attempt:
+                        # Lecture du statut impossible : port probablement fermé côté imprimante
+                        self._close()
+                        continue
+                    if self.paper_ok is False:
+                        PRINTS.labels('no_paper').inc()
+                        return {'success': False, 'error': 'Plus de papier dans l\'imprimante', 'error_type': 'no_paper'}
+                    sending = True
+                    PRINT_FIRST_LINE_SECONDS.observe(time.perf_counter() - started)
+                    transfer = pos.print_job(self.printer, raster, text, self.transport)
+                    break
+                except Exception as e:
+                    self._close()
+                    self.last_error = _error_message(e)
+                    if sending or attempt:
+                        PRINTS.labels('error').inc()
+                        logger.info(f"[PRINT] Erreur d'impression de {image_path}: {e}")
+                        return {'success': False, 'error': self.last_error}
+            self.last_error = None
+
+        transfer['total_seconds'] = round(time.perf_counter() - started, 3)
+        PRINT_SECONDS.observe(transfer['total_seconds'])
+        PRINTS.labels('ok').inc()
+        return {'success': True, 'transfer': transfer}
+
+    def get_status(self, refresh=False):
+        """Printer state for /api/printer_status (checked now if ``refresh`` and idle)."""
+        busy = True
+        if refresh and self.lock.acquire(blocking=False):
+            busy = False
+            try:
+                self._check()
+            finally:
+                self.lock.release()
+        status = {
+            'port': self.port,
+            'baudrate': self.baudrate,
+            'paper_status': {True: 'ok', False: 'empty'}.get(self.paper_ok, 'unknown'),
+            'last_check': self.last_check,
+        }
+        if self.last_error:
+            status.update(status='error', message=f'Erreur de connexion: {self.last_error}'
+                          if self.last_error != ESCPOS_MISSING else ESCPOS_MISSING)
+        elif self.paper_ok is False:
+            status.update(status='error', message=self.paper_message)
+        elif self.printer is None:
+            status.update(status='error', message='Imprimante non connectée')
+        else:
+            status.update(status='ok', message='Impression en cours' if refresh and busy else 'Imprimante connectée')
+        return status
+
+
+PRINT_RASTER_REQUESTS = Counter('photobooth_print_raster_requests_total', 'Print raster lookups by cache result', ['result'])
+PRINT_RASTER_SECONDS = Histogram('photobooth_print_raster_build_seconds', 'Time to decode, resize and dither one photo for printing')
+PRINT_RASTER_CACHE_BYTES = Gauge('photobooth_print_raster_cache_bytes', 'Size of the on-disk print raster cache')
+PRINT_RASTER_EVICTIONS = Counter('photobooth_print_raster_evictions_total', 'Print rasters evicted to stay under the cache limit')
+
+
+class PrintRasterCache:
+    """On-disk cache of ready-to-send print rasters (GS v 0 commands).
+
+    A background worker rasterizes each photo for the current print settings
+    as soon as it is saved, while the guest is still looking at it, so
+    printing only reads the cached bytes and streams them to the printer.
+    Files are keyed by a hash of the photo's content plus the density and
+    dither, so every server process finds them and a settings change never
+    prints a stale raster. A raster another process wrote is picked up from
+    disk instead of being rebuilt. The least recently used files are evicted
+    beyond ``max_bytes``, counted over every process's files (see ``DiskLru``).
+    """
+
+    def __init__(self, folder, max_bytes=32 * 1024 * 1024, governor=None):
+        self.folder = os.path.abspath(folder)
+        self.max_bytes = max_bytes
+        self.governor = governor
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = None
+        self._pending = set()
+        self._build_locks = {}
+        self._digests = OrderedDict()
+        os.makedirs(self.folder, exist_ok=True)
+        self.index = DiskLru([self.folder], max_bytes, '.bin',
+                             gauge=PRINT_RASTER_CACHE_BYTES, evictions=PRINT_RASTER_EVICTIONS)
+
+    def _digest(self, source_path):
+        # Empreinte du contenu, mémorisée tant que la taille et la date du fichier ne changent pas
+        stat = os.stat(source_path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            known = self._digests.get(source_path)
+        if known and known[0] == signature:
+            return known[1]
+        with open(source_path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        with self.lock:
+            self._digests[source_path] = (signature, digest)
+            self._digests.move_to_end(source_path)
+            while len(self._digests) > 256:
+                self._digests.popitem(last=False)
+        return digest
+
+    def path_for(self, source_path, high_density, dither):
+        density = 'hd' if high_density else 'sd'
+        return os.path.join(self.folder, f"{self._digest(source_path)}-{density}-{dither}.bin")
+
+    def get(self, source_path, high_density=False, dither='floyd'):
+        """Raster bytes of ``source_path`` for these settings, built now if missing."""
+        path = self.path_for(source_path, high_density, dither)
+        if self.index.touch(path) or self.index.adopt(path):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                PRINT_RASTER_REQUESTS.labels('hit').inc()
+                return data
+            except FileNotFoundError:
+                # Évincé par un autre processus
+                self.index.forget(path)
+        PRINT_RASTER_REQUESTS.labels('miss').inc()
+        return self._build(source_path, path, high_density, dither)
+
+    def submit(self, source_path, high_density=False, dither='floyd'):
+        """Rasterize a freshly saved photo in the background, ahead of a possible print."""
+        key = (source_path, high_density, dither)
+        with self.lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            if not self.thread or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._worker_loop, name='print-rasters')
+                self.thread.daemon = True
+                self.thread.start()
+        self.queue.put(key)
+
+    def _worker_loop(self):
+        while True:
+            key = self.queue.get()
+            source_path, high_density, dither = key
+            try:
+                with self.governor.job('print_raster') if self.governor else nullcontext():
+                    path = self.path_for(source_path, high_density, dither)
+                    if path not in self.index and not self.index.adopt(path):
+                        self._build(source_path, path, high_density, dither)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.info(f"[PRINT] Erreur de préparation de {source_path}: {_error_message(e)}")
+            finally:
+                with self.lock:
+                    self._pending.discard(key)
+                self.queue.task_done()
+
+    def _build(self, source_path, path, high_density, dither):
+        with self.lock:
+            build_lock = self._build_locks.setdefault(path, threading.Lock())
+        # Une seule préparation par raster, même si le worker et une impression arrivent ensemble
+        with build_lock:
+            try:
+                if self.index.adopt(path):
+                    try:
+                        with open(path, 'rb') as f:
+                            return f.read()
+                    except FileNotFoundError:
+                        self.index.forget(path)
+                started = time.perf_counter()
+                data = _pos().prepare_image(source_path, high_density, dither)
+                temp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+                PRINT_RASTER_SECONDS.observe(time.perf_counter() - started)
+                self.index.add(path, len(data))
+                return data
+            finally:
+                with self.lock:
+                    self._build_locks.pop(path, None)
+
+    def discard(self, source_path):
+        """Drop the rasters of a photo about to be deleted."""
+        try:
+            prefix = os.path.join(self.folder, self._digest(source_path) + '-')
+        except FileNotFoundError:
+            return
+        self.index.discard(lambda path: path.startswith(prefix))
+
+    def clear(self):
+        self.index.clear()
+        with self.lock:
+            self._digests.clear()
+
+    def get_stats(self):
+        stats = self.index.get_stats()
+        with self.lock:
+            stats['pending'] = len(self._pending)
+        return stats
+
+
+PRINT_QUEUE_WAIT_SECONDS = Histogram('photobooth_print_queue_wait_seconds', 'Time a print job waited in the queue',
+                                     buckets=(0.5, 1, 5, 10, 30, 60, 120, 300, 600))
+PRINT_QUEUE_DEPTH = Gauge('photobooth_print_queue_depth', 'Print jobs waiting in the queue')
+PRINT_JOBS = Counter('photobooth_print_jobs_total', 'Print jobs by final state', ['state'])
+
+_QUEUE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS print_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    text TEXT,
+    high_density INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    error TEXT,
+    error_type TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    wait_seconds REAL,
+    print_seconds REAL,
+    transfer TEXT
+);
+CREATE INDEX IF NOT EXISTS print_jobs_state ON print_jobs (state, id);
+CREATE TABLE IF NOT EXISTS print_queue_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+ACTIVE_STATES = ('queued', 'printing')
+
+
+class PrintQueue:
+    """Persistent, ordered print queue feeding a PrintService.
+
+    Jobs live in SQLite, so ``submit()`` returns at once and queued jobs
+    survive a restart; a job caught mid-print by a restart is marked failed
+    rather than printed twice. With several server processes, one of them
+    holds a lock file and runs the jobs (and owns the printer); the others
+    only queue and read, and pass new printer settings and baudrate probes
+    through the database (``configure()``, ``probe_baudrate()``). When the paper runs out, the job keeps its place and
+    the queue waits until the printer reports paper again.
+    """
+
+    def __init__(self, path, service, governor=None, on_finished=None, default_duration=20.0,
+                 poll_interval=1.0, paper_check_interval=5.0):
+        self.path = path
+        self.service = service
+        self.governor = governor
+        self.on_finished = on_finished
+        self.default_duration = default_duration
+        self.poll_interval = poll_interval
+        self.paper_check_interval = paper_check_interval
+        self.lock = threading.Lock()
+        self.changed = threading.Condition()
+        self.thread = None
+        self.is_runner = False
+        self._lock_file = None
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._connection.row_factory = sqlite3.Row
+        with self.lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript(_QUEUE_SCHEMA)
+            columns = {row['name'] for row in self._connection.execute('PRAGMA table_info(print_jobs)')}
+            if 'transfer' not in columns:
+                # File créée avant les statistiques d'envoi
+                self._connection.execute('ALTER TABLE print_jobs ADD COLUMN transfer TEXT')
+
+    def _execute(self, sql, params=()):
+        with self.lock, self._connection:
+            return self._connection.execute(sql, params).fetchall()
+
+    def _notify(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    def _get_state(self, key):
+        rows = self._execute('SELECT value FROM print_queue_state WHERE key = ?', (key,))
+        return json.loads(rows[0]['value']) if rows else None
+
+    def _set_state(self, key, value):
+        self._execute('INSERT INTO print_queue_state (key, value) VALUES (?, ?) '
+                      'ON CONFLICT (key) DO UPDATE SET value = excluded.value', (key, json.dumps(value)))
+
+    def start(self):
+        """Run jobs in the background, in this process if it wins the runner lock."""
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name='print-queue')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def configure(self, port, baudrate, flow_control=None):
+        """Change the printer port, baudrate or flow control, in whichever process runs the jobs."""
+        self.service.configure(port, baudrate, flow_control)
+        # Le processus qui détient l'imprimante applique les réglages au prochain tour de sa boucle
+        self._set_state('printer_config', [port, baudrate, flow_control])
+        self._notify()
+
+    def probe_baudrate(self, timeout=30.0):
+        """Fastest baudrate the printer answers at, probed by the runner process; None if none."""
+        if self.is_runner:
+            return self.service.probe_baudrate()
+        request_id = f"{os.getpid()}-{time.time()}"
+        self._set_state('probe_request', request_id)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            result = self._get_state('probe_result')
+            if result and result['id'] == request_id:
+                return result['baudrate']
+            time.sleep(0.2)
+        raise TimeoutError("Le processus qui détient l'imprimante n'a pas répondu")
+
+    def _answer_probe(self):
+        request_id = self._get_state('probe_request')
+        if request_id is None:
+            return
+        self._set_state('probe_request', None)
+        logger.info("[PRINT] Détection de la vitesse demandée par un autre processus")
+        self._set_state('probe_result', {'id': request_id, 'baudrate': self.service.probe_baudrate()})
+
+    def _apply_config(self, applied):
+        settings = self._get_state('printer_config')
+        if settings is not None and settings != applied:
+            self.service.configure(*settings)
+        return settings
+
+    def _acquire_runner(self):
+        if fcntl is None:
+            return True
+        lock_file = open(f"{self.path}.print-lock", 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    # Soumission et consultation (tous les processus)
+
+    def submit(self, path, text=None, high_density=False):
+        """Queue a print; returns the job (with its position and ETA)."""
+        with self.lock, self._connection:
+            cursor = self._connection.execute(
+                'INSERT INTO print_jobs (filename, path, text, high_density, state, created) VALUES (?, ?, ?, ?, ?, ?)',
+                (os.path.basename(path), path, text, int(bool(high_density)), 'queued', time.time()))
+            job_id = cursor.lastrowid
+        self._notify()
+        job = self.get(job_id)
+        logger.info(f"[PRINT] Travail {job_id} en file ({job['filename']}, position {job['position']})")
+        return job
+
+    def _estimates(self):
+        """(durée moyenne d'une impression, temps restant du travail en cours)"""
+        rows = self._execute("SELECT print_seconds FROM print_jobs WHERE state = 'done' "
+                             "AND print_seconds IS NOT NULL ORDER BY id DESC LIMIT 20")
+        average = sum(row['print_seconds'] for row in rows) / len(rows) if rows else self.default_duration
+        printing = self._execute("SELECT started FROM print_jobs WHERE state = 'printing' LIMIT 1")
+        remaining = max(average - (time.time() - printing[0]['started']), 0.0) if printing else 0.0
+        return average, remaining
+
+    def _describe(self, rows):
+        queued = [row['id'] for row in self._execute("SELECT id FROM print_jobs WHERE state = 'queued' ORDER BY id")]
+        positions = {job_id: index + 1 for index, job_id in enumerate(queued)}
+        average, remaining = self._estimates()
+        blocked = self._get_state('blocked')
+        jobs = []
+        for row in rows:
+            job = {key: row[key] for key in row.keys() if key != 'path'}
+            job['high_density'] = bool(job['high_density'])
+            job['transfer'] = json.loads(job['transfer']) if job['transfer'] else None
+            job['position'] = positions.get(row['id'], 0 if row['state'] == 'printing' else None)
+            if row['state'] == 'printing':
+                job['eta_seconds'] = round(remaining, 1)
+            elif row['state'] == 'queued' and not blocked:
+                job['eta_seconds'] = round(remaining + job['position'] * average, 1)
+            else:
+                job['eta_seconds'] = None
+            job['blocked'] = blocked if row['state'] in ACTIVE_STATES else None
+            jobs.append(job)
+        return jobs
+
+    def get(self, job_id):
+        rows = self._execute('SELECT * FROM print_jobs WHERE id = ?', (job_id,))
+        return self._describe(rows)[0] if rows else None
+
+    def jobs(self, recent=20):
+        """Active jobs in print order, then the ``recent`` last finished ones."""
+        active = self._execute("SELECT * FROM print_jobs WHERE state IN ('printing', 'queued') "
+                               "ORDER BY state = 'queued', id")
+        finished = self._execute("SELECT * FROM print_jobs WHERE state NOT IN ('printing', 'queued') "
+                                 "ORDER BY id DESC LIMIT ?", (recent,))
+        return self._describe(active + finished)
+
+    def cancel(self, job_id):
+        """Cancel a job that has not started printing; returns it, or None."""
+        with self.lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE print_jobs SET state = 'cancelled', finished = ? WHERE id = ? AND state = 'queued'",
+                (time.time(), job_id))
+        if not cursor.rowcount:
+            return None
+        PRINT_JOBS.labels('cancelled').inc()
+        self._notify()
+        return self.get(job_id)
+
+    def retry(self, job_id):
+        """Queue a failed or cancelled job again, as a new job at the end of the queue."""
+        rows = self._execute("SELECT * FROM print_jobs WHERE id = ? AND state IN ('failed', 'cancelled')", (job_id,))
+        if not rows:
+            return None
+        return self.submit(rows[0]['path'], rows[0]['text'], bool(rows[0]['high_density']))
+
+    def wait(self, job_id, timeout):
+        """Block until the job is finished (done, failed, cancelled) or ``timeout`` expires."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['state'] not in ACTIVE_STATES or remaining <= 0:
+                return job
+            with self.changed:
+                self.changed.wait(min(remaining, self.poll_interval))
+
+    def stats(self):
+        counts = dict.fromkeys(ACTIVE_STATES, 0)
+        for row in self._execute("SELECT state, COUNT(*) AS total FROM print_jobs "
+                                 "WHERE state IN ('printing', 'queued') GROUP BY state"):
+            counts[row['state']] = row['total']
+        done_last_hour = self._execute("SELECT COUNT(*) AS total FROM print_jobs WHERE state = 'done' AND finished > ?",
+                                       (time.time() - 3600,))[0]['total']
+        average, _ = self._estimates()
+        return {
+            'queued': counts['queued'],
+            'printing': counts['printing'],
+            'blocked': self._get_state('blocked'),
+            'average_print_seconds': round(average, 1),
+            'prints_last_hour': done_last_hour,
+            'runner': self.is_runner,
+        }
+
+    def printer_status(self):
+        """Printer state: checked now by the runner process, last one it saved otherwise."""
+        if self.is_runner:
+            return self.service.get_status(refresh=True)
+        status = self._get_state('printer')
+        if status is None:
+            return {'status': 'error', 'message': 'Service d\'impression non démarré', 'paper_status': 'unknown'}
+        return status
+
+    # Exécution des travaux (processus détenteur du verrou)
+
+    def _run(self):
+        while not self._acquire_runner():
+            # Un autre processus imprime ; prendre le relais s'il s'arrête
+            time.sleep(10.0)
+        self.is_runner = True
+        self.service.start()
+        with self.lock, self._connection:
+            interrupted = self._connection.execute(
+                "UPDATE print_jobs SET state = 'failed', error = ?, finished = ? WHERE state = 'printing'",
+                ('Impression interrompue par un redémarrage', time.time())).rowcount
+        queued = self._execute("SELECT COUNT(*) AS total FROM print_jobs WHERE state = 'queued'")[0]['total']
+        logger.info(f"[PRINT] File d'impression démarrée: {queued} travail(aux) en attente, "
+                    f"{interrupted} interrompu(s)")
+
+        # Réglages déjà lus dans config.json au démarrage ; seuls les changements suivants comptent
+        applied = self._get_state('printer_config')
+        last_status = 0.0
+        while True:
+            applied = self._apply_config(applied)
+            self._answer_probe()
+            if time.monotonic() - last_status >= self.paper_check_interval:
+                last_status = time.monotonic()
+                self._refresh_blocked()
+            job = None if self._get_state('blocked') else self._claim()
+            PRINT_QUEUE_DEPTH.set(self.stats()['queued'])
+            if job is None:
+                with self.changed:
+                    self.changed.wait(self.poll_interval)
+                continue
+            self._print(job)
+
+    def _refresh_blocked(self):
+        status = self.service.get_status(refresh=self._get_state('blocked') is not None)
+        # État partagé avec les autres processus, réécrit seulement s'il change
+        saved = self._get_state('printer') or {}
+        if {**saved, 'last_check': None} != {**status, 'last_check': None}:
+            self._set_state('printer', status)
+        if self._get_state('blocked') and status['paper_status'] != 'empty' and status['status'] == 'ok':
+            logger.info("[PRINT] Papier rechargé, reprise de la file d'impression")
+            self._set_state('blocked', None)
+
+    def _claim(self):
+        with self.lock, self._connection:
+            row = self._connection.execute(
+                "SELECT * FROM print_jobs WHERE state = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            wait_seconds = row['wait_seconds'] if row['wait_seconds'] is not None else now - row['created']
+            self._connection.execute(
+                "UPDATE print_jobs SET state = 'printing', started = ?, attempts = attempts + 1, wait_seconds = ?, "
+                "error = NULL, error_type = NULL WHERE id = ?", (now, wait_seconds, row['id']))
+        if row['wait_seconds'] is None:
+            PRINT_QUEUE_WAIT_SECONDS.observe(wait_seconds)
+        self._notify()
+        return dict(row, started=now, wait_seconds=wait_seconds)
+
+    def _print(self, job):
+        started = time.perf_counter()
+        try:
+            with self.governor.job('print') if self.governor else nullcontext():
+                result = self.service.print_file(job['path'], text=job['text'], high_density=bool(job['high_density']))
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        elapsed = time.perf_counter() - started
+        now = time.time()
+
+        if result['success']:
+            transfer = result.get('transfer')
+            self._execute("UPDATE print_jobs SET state = 'done', finished = ?, print_seconds = ?, transfer = ? "
+                          "WHERE id = ?", (now, elapsed, json.dumps(transfer) if transfer else None, job['id']))
+            PRINT_JOBS.labels('done').inc()
+            logger.info(f"[PRINT] Travail {job['id']} imprimé en {elapsed:.1f}s (attente {job['wait_seconds']:.1f}s)"
+                        + (f", {_describe_transfer(transfer)}" if transfer else ''))
+            if self.on_finished:
+                try:
+                    self.on_finished(self.get(job['id']))
+                except Exception as e:
+                    logger.info(f"[PRINT] Erreur après le travail {job['id']}: {e}")
+        elif result.get('error_type') == 'no_paper':
+            # Le travail garde sa place ; la file attend que le papier soit rechargé
+            self._execute("UPDATE print_jobs SET state = 'queued', started = NULL, error = ?, error_type = ? "
+                          "WHERE id = ?", (result['error'], 'no_paper', job['id']))
+            self._set_state('blocked', 'no_paper')
+            logger.info(f"[PRINT] Plus de papier : file en pause (travail {job['id']} en attente)")
+        else:
+            self._execute("UPDATE print_jobs SET state = 'failed', finished = ?, error = ?, error_type = ? "
+                          "WHERE id = ?", (now, result['error'], result.get('error_type'), job['id']))
+            PRINT_JOBS.labels('failed').inc()
+            logger.info(f"[PRINT] Travail {job['id']} en échec: {result['error']}")
+        self._notify()
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+import logging
+from contextlib import nullcontext
+
+from PIL import Image, ImageOps
+
+from cache_utils import DiskLru
+from metrics_utils import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+RENDITION_REQUESTS = Counter('photobooth_rendition_requests_total', 'Rendition lookups by size and cache result', ['size', 'result'])
+RENDITION_SECONDS = Histogram('photobooth_rendition_build_seconds', 'Time to build one photo rendition', ['size'])
+RENDITION_EVICTIONS = Counter('photobooth_rendition_evictions_total', 'Renditions evicted to stay under the cache limit')
+RENDITION_CACHE_BYTES = Gauge('photobooth_rendition_cache_bytes', 'Size of the on-disk rendition cache')
+
+# Tailles servies par /photos/<fichier>?size= : (plus grand côté en pixels, qualité JPEG)
+RENDITION_SIZES = {
+    'thumb': (320, 75),
+    'screen': (1920, 85),
+}
+
+
+class RenditionCache:
+    """On-disk cache of downscaled photos (admin thumbnails, slideshow screen size).
+
+    Renditions are built in a background worker right after a photo is saved,
+    or lazily on the first request. The cache key includes the original's
+    size and mtime, so a replaced original never serves a stale rendition, and
+    each rendition file never changes once written, which makes its ETag
+    strong. The least recently used files are evicted beyond ``max_bytes``.
+    The folder is shared by every worker process: a rendition another worker
+    wrote is picked up from disk instead of being rebuilt, and the limit
+    applies to all of them (see ``DiskLru``).
+    """
+
+    def __init__(self, folder, max_bytes=256 * 1024 * 1024, sizes=None, governor=None):
+        self.folder = os.path.abspath(folder)
+        self.max_bytes = max_bytes
+        self.sizes = dict(sizes or RENDITION_SIZES)
+        self.governor = governor
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = None
+        self._pending = set()
+        self._build_locks = {}
+        for size in self.sizes:
+            os.makedirs(os.path.join(self.folder, size), exist_ok=True)
+        self.index = DiskLru([os.path.join(self.folder, size) for size in self.sizes], max_bytes, '.jpg',
+                             gauge=RENDITION_CACHE_BYTES, evictions=RENDITION_EVICTIONS)
+
+    @staticmethod
+    def _key(source_path, stat):
+        return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+    def path_for(self, source_path, size, stat=None):
+        stat = stat or os.stat(source_path)
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        return os.path.join(self.folder, size, f"{stem}-{self._key(source_path, stat)}.jpg")
+
+    def etag(self, rendition_path, size):
+        return hashlib.sha1(f"{size}/{os.path.basename(rendition_path)}".encode()).hexdigest()[:20]
+
+    def get(self, source_path, size):
+        """Path of the ``size`` rendition of ``source_path``, built now if missing."""
+        path = self.path_for(source_path, size)
+        if (self.index.touch(path) and os.path.exists(path)) or self.index.adopt(path):
+            RENDITION_REQUESTS.labels(size, 'hit').inc()
+            return path
+        RENDITION_REQUESTS.labels(size, 'miss').inc()
+        return self._build(source_path, size, path)
+
+    def submit(self, source_path):
+        """Queue every rendition of a freshly saved photo for the background worker."""
+        with self.lock:
+            if source_path in self._pending:
+                return
+            self._pending.add(source_path)
+            if not self.thread or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._worker_loop, name='renditions')
+                self.thread.daemon = True
+                self.thread.start()
+        self.queue.put(source_path)
+
+    def _worker_loop(self):
+        while True:
+            source_path = self.queue.get()
+            try:
+                # Travail lourd : le gouverneur allège l'aperçu pendant ce temps
+                with self.governor.job('thumbnail') if self.governor else nullcontext():
+                    for size in self.sizes:
+                        path = self.path_for(source_path, size)
+                        if path not in self.index and not self.index.adopt(path):
+                            self._build(source_path, size, path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.info(f"[RENDITIONS] Erreur pour {source_path}: {e}")
+            finally:
+                with self.lock:
+                    self._pending.discard(source_path)
+                self.queue.task_done()
+
+    def _build(self, source_path, size, path):
+        with self.lock:
+            build_lock = self._build_locks.setdefault(path, threading.Lock())
+        # Une seule construction par rendition, même si le worker et une requête arrivent ensemble
+        with build_lock:
+            try:
+                if self.index.adopt(path):
+                    return path
+                started = time.perf_counter()
+                max_side, quality = self.sizes[size]
+                with Image.open(source_path) as image:
+                    # Décodage JPEG à échelle réduite : évite de décompresser l'original en entier
+                    image.draft('RGB', (max_side, max_side))
+                    image = ImageOps.exif_transpose(image).convert('RGB')
+                    image.thumbnail((max_side, max_side), Image.LANCZOS)
+                    temp_path = f"{path}.{threading.get_ident()}.tmp"
+                    image.save(temp_path, 'JPEG', quality=quality)
+                os.replace(temp_path, path)
+                RENDITION_SECONDS.labels(size).observe(time.perf_counter() - started)
+                self.index.add(path, os.path.getsize(path))
+                return path
+            finally:
+                with self.lock:
+                    self._build_locks.pop(path, None)
+
+    def discard(self, filename):
+        """Drop every rendition of a deleted photo."""
+        prefix = os.path.splitext(filename)[0] + '-'
+        self.index.discard(lambda path: os.path.basename(path).startswith(prefix)
+                           and os.path.basename(path)[len(prefix):].count('-') == 1)
+
+    def clear(self):
+        self.index.clear()
+
+    def get_stats(self):
+        stats = self.index.get_stats()
+        with self.lock:
+            stats['pending'] = len(self._pending)
+        return stats
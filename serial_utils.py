@@ -0,0 +1,107 @@
+import time
+import logging
+
+from metrics_utils import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+PRINT_SEND_BYTES = Counter('photobooth_print_send_bytes_total', 'Image bytes written to the printer')
+PRINT_SEND_SECONDS = Histogram('photobooth_print_send_seconds', 'Time to transmit one print image, until the port drained',
+                               buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120))
+PRINT_STALL_SECONDS = Histogram('photobooth_print_stall_seconds',
+                                'Transmission time beyond what the baud rate needs (flow control, full printer buffer)',
+                                buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60))
+PRINT_SEND_RATE = Gauge('photobooth_print_send_bytes_per_second', 'Throughput of the last print image')
+
+# dsrdtr : défaut d'escpos ; rtscts : contrôle matériel le plus courant sur les
+# imprimantes thermiques TTL ; xonxoff : logiciel, pour un câble à 3 fils
+FLOW_CONTROLS = ('dsrdtr', 'rtscts', 'xonxoff', 'none')
+
+# Vitesses essayées par la détection, de la plus rapide à la plus lente
+PROBE_BAUDRATES = (115200, 57600, 38400, 19200, 9600)
+
+# DLE EOT 4 : statut du capteur papier, un octet de la forme 0xx1xx10
+STATUS_REQUEST = b'\x10\x04\x04'
+
+
+def is_status_byte(value):
+    return value & 0x93 == 0x12
+
+
+def bits_per_byte(port):
+    """Bits on the wire per byte: start bit, data bits, parity and stop bits."""
+    try:
+        return 1 + port.bytesize + (0 if port.parity == 'N' else 1) + port.stopbits
+    except (AttributeError, TypeError):
+        return 10
+
+
+class SerialTransport:
+    """Stream print data to the printer in chunks and measure the transfer.
+
+    On a serial printer the chunks go straight to the pyserial port, whose
+    flow control (RTS/CTS, DSR/DTR or XON/XOFF) blocks the writes while the
+    printer is busy, and the transfer ends once the port has drained. Any
+    time beyond what the baud rate needs for the bytes is reported as stall
+    time: the printer holding the line, usually while the head heats. Each
+    chunk must get through within ``write_timeout`` seconds, so a printer
+    stuck mid-print fails the job instead of blocking the queue. Other
+    printer types (escpos Dummy, tests) receive the chunks through ``_raw``.
+    """
+
+    def __init__(self, chunk_size=1024, write_timeout=30.0):
+        self.chunk_size = max(int(chunk_size), 64)
+        self.write_timeout = write_timeout
+
+    def send(self, printer, data):
+        """Write ``data`` to ``printer``; returns the transfer statistics."""
+        port = getattr(printer, 'device', None)
+        if not hasattr(port, 'out_waiting'):
+            port = None
+        if port is not None:
+            port.write_timeout = self.write_timeout
+        started = time.perf_counter()
+        stalled_chunks = 0
+        for offset in range(0, len(data), self.chunk_size):
+            chunk = data[offset:offset + self.chunk_size]
+            chunk_started = time.perf_counter()
+            if port is None:
+                printer._raw(chunk)
+                continue
+            port.write(chunk)
+            # Écriture bloquée bien au-delà du temps de ligne : l'imprimante a suspendu l'envoi
+            if time.perf_counter() - chunk_started > 2 * len(chunk) * bits_per_byte(port) / port.baudrate + 0.01:
+                stalled_chunks += 1
+        if port is not None:
+            self._drain(port)
+        seconds = time.perf_counter() - started
+
+        stats = {
+            'bytes': len(data),
+            'chunks': -(-len(data) // self.chunk_size),
+            'seconds': round(seconds, 3),
+            'bytes_per_second': round(len(data) / seconds) if seconds > 0 else None,
+        }
+        if port is not None:
+            line_seconds = len(data) * bits_per_byte(port) / port.baudrate
+            stats.update(
+                baudrate=port.baudrate,
+                line_seconds=round(line_seconds, 3),
+                stall_seconds=round(max(seconds - line_seconds, 0.0), 3),
+                stalled_chunks=stalled_chunks,
+            )
+            PRINT_STALL_SECONDS.observe(stats['stall_seconds'])
+        PRINT_SEND_BYTES.inc(len(data))
+        PRINT_SEND_SECONDS.observe(seconds)
+        if stats['bytes_per_second']:
+            PRINT_SEND_RATE.set(stats['bytes_per_second'])
+        return stats
+
+    def _drain(self, port):
+        # Comme flush() (tcdrain), mais sans attendre indéfiniment un XOFF jamais levé
+        deadline = time.monotonic() + self.write_timeout
+        while port.out_waiting:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Imprimante bloquée: {port.out_waiting} octet(s) non envoyés "
+                                   f"après {self.write_timeout:.0f}s")
+            time.sleep(0.005)
@@ -0,0 +1,482 @@
+import os
+import signal
+import struct
+import threading
+import time
+import logging
+from multiprocessing import shared_memory, resource_tracker
+from multiprocessing.connection import Client, Listener
+
+from camera_utils import Frame, camera_source_from_config
+from config_utils import load_config
+from stream_utils import CameraHub
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAME = 'simplebooth_frames'
+DEFAULT_ADDRESS = '/tmp/simplebooth_camera.sock'
+
+# En-tête du segment : magic, nombre de slots, taille d'un slot, séquence, drapeau d'arrêt,
+# puis dernière lecture utile d'un worker (horloge monotone, commune aux processus)
+_MAGIC = b'SBFRAME2'
+_HEADER = struct.Struct('<8sIIQI')
+_HEADER_SIZE = 64
+_SEQ_OFFSET = 16
+_CLOSED_OFFSET = 24
+_READER_OFFSET = 32
+# Sans lecture depuis ce délai, le processus de capture cesse d'encoder l'aperçu
+READER_TIMEOUT = 2.0
+_READER_TOUCH_INTERVAL = 0.25
+# En-tête d'un slot : séquence (0 pendant l'écriture), horodatage, longueur
+_SLOT_HEADER = struct.Struct('<QdI')
+_SLOT_HEADER_SIZE = 32
+
+
+def _authkey():
+    return os.environ.get('SIMPLEBOOTH_CAMERA_KEY', 'simplebooth').encode()
+
+
+class FrameRing:
+    """Ring of JPEG frames in a ``multiprocessing.shared_memory`` segment.
+
+    One writer (the capture process) and any number of readers (the web
+    workers). The header holds the sequence number of the newest frame; each
+    slot carries its own sequence number, cleared while it is being written
+    and checked again after a read, so a reader never returns a torn frame.
+    Readers with viewers refresh a heartbeat in the header (``touch()``) so
+    the writer knows whether anyone still wants frames.
+    """
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf
+        magic, self.slots, self.slot_size, _, _ = _HEADER.unpack_from(self.buf, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Segment {shm.name} invalide")
+        self._skipped = 0
+
+    @classmethod
+    def create(cls, name=DEFAULT_NAME, slots=4, slot_size=2 * 1024 * 1024):
+        try:
+            # Segment laissé par un processus de capture précédent
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        size = _HEADER_SIZE + slots * (_SLOT_HEADER_SIZE + slot_size)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _HEADER.pack_into(shm.buf, 0, _MAGIC, slots, slot_size, 0, 0)
+        for index in range(slots):
+            _SLOT_HEADER.pack_into(shm.buf, cls._slot_offset(index, slot_size), 0, 0.0, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME):
+        shm = shared_memory.SharedMemory(name=name)
+        # Le lecteur ne possède pas le segment : ne pas le supprimer à sa sortie
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm)
+
+    @staticmethod
+    def _slot_offset(index, slot_size):
+        return _HEADER_SIZE + index * (_SLOT_HEADER_SIZE + slot_size)
+
+    @property
+    def seq(self):
+        return struct.unpack_from('<Q', self.buf, _SEQ_OFFSET)[0]
+
+    @property
+    def closed(self):
+        return struct.unpack_from('<I', self.buf, _CLOSED_OFFSET)[0] != 0
+
+    def touch(self):
+        """Record that a reader wants frames (called by the workers)."""
+        struct.pack_into('<d', self.buf, _READER_OFFSET, time.monotonic())
+
+    def has_readers(self, timeout=READER_TIMEOUT):
+        """Tell whether a reader called ``touch()`` within the last ``timeout`` seconds."""
+        touched = struct.unpack_from('<d', self.buf, _READER_OFFSET)[0]
+        return touched > 0 and time.monotonic() - touched < timeout
+
+    def write(self, data, timestamp):
+        """Publish one JPEG frame; returns its sequence number, or None if it does not fit."""
+        length = len(data)
+        if length > self.slot_size:
+            self._skipped += 1
+            if self._skipped == 1:
+                logger.info(f"[SHM] Frame de {length} octets trop grande pour un slot ({self.slot_size}), ignorée")
+            return None
+        seq = self.seq + 1
+        offset = self._slot_offset(seq % self.slots, self.slot_size)
+        _SLOT_HEADER.pack_into(self.buf, offset, 0, 0.0, 0)
+        start = offset + _SLOT_HEADER_SIZE
+        self.buf[start:start + length] = data
+        _SLOT_HEADER.pack_into(self.buf, offset, seq, timestamp, length)
+        struct.pack_into('<Q', self.buf, _SEQ_OFFSET, seq)
+        return seq
+
+    def read(self, seq=None):
+        """Return ``(seq, timestamp, jpeg_bytes)`` for ``seq`` (default: newest), or None.
+
+        The JPEG is copied once out of the segment, since the writer reuses
+        the slot once the ring wraps around.
+        """
+        for _ in range(3):
+            wanted = self.seq if seq is None else seq
+            if not wanted:
+                return None
+            offset = self._slot_offset(wanted % self.slots, self.slot_size)
+            slot_seq, timestamp, length = _SLOT_HEADER.unpack_from(self.buf, offset)
+            if slot_seq != wanted:
+                if seq is not None:
+                    return None
+                continue
+            start = offset + _SLOT_HEADER_SIZE
+            data = bytes(self.buf[start:start + length])
+            if _SLOT_HEADER.unpack_from(self.buf, offset)[0] == wanted:
+                return wanted, timestamp, data
+        return None
+
+    def close(self):
+        if self.owner:
+            struct.pack_into('<I', self.buf, _CLOSED_OFFSET, 1)
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class CaptureServer:
+    """Owns the camera in a dedicated process and feeds a FrameRing.
+
+    The preview JPEG is encoded here, outside the web workers, and only
+    while a worker with viewers refreshes the ring's reader heartbeat and no
+    pause is requested: the camera is then released after the hub's idle
+    timeout, as in single-process mode. Workers send commands
+    (full-resolution still, pause, resume, throttle, restart, stats) over a
+    ``multiprocessing.connection`` socket. Each worker's CPU governor sends
+    its preview profile; the strictest one applies to the encoder here.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, address=DEFAULT_ADDRESS, slots=4, slot_size=2 * 1024 * 1024):
+        self.name = name
+        self.address = address
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ring = None
+        self.hub = None
+        self.listener = None
+        self.is_running = False
+        # Pause demandée par un worker (diaporama) : conservée au redémarrage du hub
+        self.paused = False
+        self.streaming = False
+        # Profil (fps, hauteur, qualité) demandé par chaque worker connecté
+        self.throttles = {}
+        self.throttle = (None, None, None)
+        self._throttle_lock = threading.Lock()
+        self._restart = threading.Event()
+        self._frame_ready = threading.Event()
+
+    def serve_forever(self):
+        self.ring = FrameRing.create(self.name, self.slots, self.slot_size)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self.listener = Listener(self.address, family='AF_UNIX', authkey=_authkey())
+        self.is_running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        logger.info(f"[SHM] Processus de capture prêt ({self.name}, {self.address})")
+        try:
+            while self.is_running:
+                self._run_hub()
+                if self.is_running and not self._restart.is_set():
+                    time.sleep(2.0)
+                self._restart.clear()
+        finally:
+            self.shutdown()
+
+    def _run_hub(self):
+        config = load_config()
+        hub = CameraHub(lambda: camera_source_from_config(config),
+                        history_frames=config.get('frame_buffer_frames', 30),
+                        history_bytes=int(config.get('frame_buffer_mb', 64) * 1024 * 1024))
+        hub.add_listener(self._frame_ready.set)
+        hub.set_throttle(*self.throttle)
+        self.hub = hub
+        subscriber = None
+        try:
+            while self.is_running and not self._restart.is_set():
+                wanted = not self.paused and self.ring.has_readers()
+                if wanted and subscriber is None:
+                    try:
+                        subscriber = hub.subscribe(name='shared-memory')
+                    except RuntimeError as e:
+                        logger.info(f"[SHM] Caméra indisponible: {e}")
+                        return
+                    self.streaming = True
+                elif not wanted and subscriber is not None:
+                    # Plus aucun spectateur (ou pause) : ne plus encoder, le hub coupe la caméra après son délai
+                    subscriber.close()
+                    subscriber = None
+                    self.streaming = False
+                if subscriber is not None and not hub.is_running:
+                    # La source s'est arrêtée en cours de diffusion
+                    return
+                self._frame_ready.wait(1.0 if subscriber is not None else 0.2)
+                self._frame_ready.clear()
+                item = subscriber.claim_frame() if subscriber is not None else None
+                if item is not None:
+                    _, frame = item
+                    self.ring.write(subscriber.encode(frame), frame.timestamp)
+        finally:
+            self.streaming = False
+            if subscriber is not None:
+                subscriber.close()
+            hub.stop()
+
+    def _accept_loop(self):
+        while self.is_running:
+            try:
+                connection = self.listener.accept()
+            except Exception:
+                if self.is_running:
+                    continue
+                return
+            threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+    def _serve_connection(self, connection):
+        try:
+            with connection:
+                while self.is_running:
+                    try:
+                        command, args = connection.recv()
+                    except (EOFError, OSError):
+                        return
+                    try:
+                        result = ('ok', self._handle(connection, command, *args))
+                    except Exception as e:
+                        result = ('error', str(e))
+                    try:
+                        connection.send(result)
+                    except (EOFError, OSError):
+                        return
+        finally:
+            # Worker arrêté : son profil ne limite plus l'aperçu
+            self._set_throttle(connection, None)
+
+    def _set_throttle(self, client, profile):
+        with self._throttle_lock:
+            if profile is None:
+                self.throttles.pop(client, None)
+            else:
+                self.throttles[client] = tuple(profile)
+            # Le plus restrictif des profils demandés, limite par limite
+            self.throttle = tuple(min((value for value in values if value), default=None)
+                                  for values in zip((None, None, None), *self.throttles.values()))
+            if self.hub:
+                self.hub.set_throttle(*self.throttle)
+
+    def _handle(self, client, command, *args):
+        hub = self.hub
+        if command == 'still':
+            return self._capture_still(hub, *args) if hub else None
+        if command == 'pause':
+            self.paused = True
+            self._frame_ready.set()
+        elif command == 'resume':
+            self.paused = False
+            self._frame_ready.set()
+        elif command == 'throttle':
+            self._set_throttle(client, args)
+        elif command == 'restart':
+            # Recharger config.json (type de caméra modifié depuis l'admin)
+            self._restart.set()
+            self._frame_ready.set()
+        elif command == 'stats':
+            stats = hub.get_stats() if hub else {'running': False}
+            stats.update(shared_paused=self.paused, streaming=self.streaming)
+            return stats
+        else:
+            raise ValueError(f"Commande inconnue: {command}")
+        return None
+
+    def _capture_still(self, hub, budget=3.0, timestamp=None):
+        # Aucun worker ne regarde l'aperçu : démarrer la caméra le temps de la photo
+        with hub.subscribe(name='still'):
+            with hub.condition:
+                hub.condition.wait_for(lambda: hub.frame is not None or not hub.is_running, budget)
+            return hub.capture_still(budget, timestamp)
+
+    def shutdown(self):
+        self.is_running = False
+        self._frame_ready.set()
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+
+
+class CameraClient:
+    """Command channel from a web worker to the capture process."""
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=5.0):
+        self.address = address
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self._connection = None
+
+    def call(self, command, *args, timeout=None):
+        with self.lock:
+            try:
+                if self._connection is None:
+                    self._connection = Client(self.address, family='AF_UNIX', authkey=_authkey())
+                self._connection.send((command, args))
+                if not self._connection.poll(timeout or self.timeout):
+                    raise TimeoutError(f"Pas de réponse du processus de capture ({command})")
+                status, result = self._connection.recv()
+            except Exception:
+                self._close()
+                raise
+        if status != 'ok':
+            raise RuntimeError(result)
+        return result
+
+    def capture_still(self, budget=3.0, timestamp=None):
+        return self.call('still', budget, timestamp, timeout=budget + 2.0)
+
+    def pause(self):
+        self.call('pause')
+
+    def resume(self):
+        self.call('resume')
+
+    def set_throttle(self, max_fps=None, max_height=None, quality=None):
+        self.call('throttle', max_fps, max_height, quality)
+
+    def restart(self):
+        self.call('restart')
+
+    def get_stats(self):
+        return self.call('stats', timeout=1.0)
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except OSError:
+                pass
+            self._connection = None
+
+
+class SharedMemorySource:
+    """Camera source reading the capture process's FrameRing (one per worker).
+
+    There is no cross-process condition variable: the hub's pump thread polls
+    the ring header, which costs one struct read per ``poll_interval``. While
+    ``wanted()`` is true (the worker has unpaused viewers) the reader
+    heartbeat is refreshed, which keeps the capture process encoding.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, client=None, poll_interval=0.005, wanted=None):
+        self.name = name
+        self.client = client or CameraClient()
+        self.poll_interval = poll_interval
+        self.wanted = wanted
+        self._touched = 0.0
+        self.ring = None
+        self.is_running = False
+        self.error = None
+        self._frame = None
+
+    def start(self):
+        try:
+            self.ring = FrameRing.attach(self.name)
+        except (FileNotFoundError, ValueError) as e:
+            self.error = f"Processus de capture indisponible ({self.name}): {e}"
+            logger.info(f"[SHM] {self.error}")
+            return False
+        self.is_running = True
+        return True
+
+    def get_frame(self):
+        return self._frame
+
+    def wait_frame(self, after_seq=0, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.is_running:
+            if self.ring.closed:
+                self.error = "Le processus de capture s'est arrêté"
+                self.is_running = False
+                return None
+            now = time.monotonic()
+            if now - self._touched >= _READER_TOUCH_INTERVAL and (self.wanted is None or self.wanted()):
+                self.ring.touch()
+                self._touched = now
+            seq = self.ring.seq
+            if seq and seq != after_seq:
+                item = self.ring.read()
+                if item is not None:
+                    seq, timestamp, data = item
+                    frame = Frame(jpeg=data)
+                    # Horodatage d'origine : sert à retrouver la frame côté capture
+                    frame.timestamp = timestamp
+                    self._frame = (seq, frame)
+                    return self._frame
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+        return None
+
+    def capture_still(self, frame=None, timeout=3.0):
+        return self.client.capture_still(timeout, frame.timestamp if frame else None)
+
+    def get_stats(self):
+        stats = {'source': 'shared_memory', 'name': self.name, 'seq': self.ring.seq if self.ring else 0}
+        try:
+            stats['capture'] = self.client.get_stats()
+        except Exception as e:
+            stats['capture_error'] = str(e)
+        return stats
+
+    def stop(self):
+        self.is_running = False
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+
+
+def _exit_on_sigterm(sig, frame):
+    # Passer par le finally de serve_forever : caméra libérée, segment marqué fermé
+    raise SystemExit(0)
+
+
+def _run_capture_server(config):
+    logging.basicConfig(level=logging.INFO)
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    CaptureServer(name=config.get('shared_camera_name', DEFAULT_NAME),
+                  address=config.get('shared_camera_socket', DEFAULT_ADDRESS),
+                  slots=config.get('shared_camera_slots', 4),
+                  slot_size=int(config.get('shared_camera_slot_mb', 2) * 1024 * 1024)).serve_forever()
+
+
+def start_capture_process(config):
+    """Start the capture server in a child process (gunicorn master, before forking workers)."""
+    import multiprocessing
+
+    process = multiprocessing.Process(target=_run_capture_server, args=(config,),
+                                      name='simplebooth-capture', daemon=True)
+    process.start()
+    logger.info(f"[SHM] Processus de capture lancé (pid {process.pid})")
+    return process
+
+
+if __name__ == '__main__':
+    _run_capture_server(load_config())
@@ -0,0 +1,153 @@
+import os
+import queue
+import threading
+import time
+import logging
+
+from metrics_utils import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+STORAGE_WRITE_SECONDS = Histogram('photobooth_storage_write_seconds', 'Time to persist one photo, fsync included')
+STORAGE_QUEUE = Gauge('photobooth_storage_queue_depth', 'Photos waiting to be written to disk')
+STORAGE_RETRIES = Counter('photobooth_storage_retries_total', 'Photo writes retried after an I/O error')
+STORAGE_FAILURES = Counter('photobooth_storage_failures_total', 'Photo writes abandoned after every retry')
+
+# always : fsync de chaque photo (sûr en cas de coupure) ; batch : un fsync
+# groupé quand la file se vide ; never : laisser le système décider
+FSYNC_POLICIES = ('always', 'batch', 'never')
+
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class PhotoWriter:
+    """Bounded background writer for captured and effect photos.
+
+    ``submit()`` hands the bytes over and returns at once, so the capture
+    request never waits for the SD card. Files are written to a temporary
+    name then renamed, so readers never see a partial JPEG. I/O errors are
+    retried with a growing delay. When ``max_pending`` photos are already
+    queued, ``submit()`` waits up to ``put_timeout`` then raises TimeoutError.
+    Routes that read a photo call ``wait_for()`` first.
+    """
+
+    def __init__(self, max_pending=16, fsync='always', retries=3, retry_delay=0.2, put_timeout=2.0):
+        if fsync not in FSYNC_POLICIES:
+            logger.info(f"[STORAGE] Politique fsync inconnue '{fsync}', utilisation de 'always'")
+            fsync = 'always'
+        self.fsync = fsync
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.lock = threading.Lock()
+        self.done = threading.Condition(self.lock)
+        self.thread = None
+        self._pending = {}
+        self._unsynced = []
+
+    def submit(self, path, data, on_saved=None):
+        """Queue ``data`` for ``path``; ``on_saved(path)`` runs in the writer thread once it is on disk."""
+        name = os.path.basename(path)
+        with self.lock:
+            self._pending[name] = self._pending.get(name, 0) + 1
+            if not self.thread or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._worker_loop, name='photo-writer')
+                self.thread.daemon = True
+                self.thread.start()
+        try:
+            self.queue.put((path, data, on_saved), timeout=self.put_timeout)
+        except queue.Full:
+            self._finish(name)
+            raise TimeoutError(f"File d'écriture pleine ({self.queue.maxsize} photos en attente)")
+        STORAGE_QUEUE.set(self.queue.qsize())
+
+    def wait_for(self, filename, timeout=5.0):
+        """Block until no write of ``filename`` is pending; False on timeout."""
+        with self.done:
+            return self.done.wait_for(lambda: filename not in self._pending, timeout)
+
+    def flush(self, timeout=10.0):
+        """Block until every queued photo is written; False on timeout."""
+        with self.done:
+            return self.done.wait_for(lambda: not self._pending, timeout)
+
+    def _finish(self, name):
+        with self.done:
+            count = self._pending.get(name, 0) - 1
+            if count > 0:
+                self._pending[name] = count
+            else:
+                self._pending.pop(name, None)
+            self.done.notify_all()
+
+    def _worker_loop(self):
+        while True:
+            path, data, on_saved = self.queue.get()
+            STORAGE_QUEUE.set(self.queue.qsize())
+            try:
+                saved = self._write(path, data)
+                if saved and self.fsync == 'batch':
+                    self._unsynced.append(path)
+                    if self.queue.empty():
+                        self._sync_batch()
+                # Index, miniatures, Telegram : avant de réveiller les routes qui attendent la photo
+                if saved and on_saved:
+                    on_saved(path)
+            except Exception as e:
+                logger.info(f"[STORAGE] Erreur après l'écriture de {path}: {e}")
+            finally:
+                self._finish(os.path.basename(path))
+                self.queue.task_done()
+
+    def _write(self, path, data):
+        started = time.perf_counter()
+        temp_path = f"{path}.tmp"
+        for attempt in range(self.retries + 1):
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                    if self.fsync == 'always':
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(temp_path, path)
+                if self.fsync == 'always':
+                    # Le renommage n'est durable qu'une fois le dossier synchronisé
+                    _fsync_path(os.path.dirname(path) or '.')
+                STORAGE_WRITE_SECONDS.observe(time.perf_counter() - started)
+                return True
+            except OSError as e:
+                if attempt == self.retries:
+                    STORAGE_FAILURES.inc()
+                    logger.info(f"[STORAGE] Abandon de l'écriture de {path} après {attempt + 1} essai(s): {e}")
+                    try:
+                        os.remove(temp_path)
+                    except OSError:
+                        pass
+                    return False
+                STORAGE_RETRIES.inc()
+                logger.info(f"[STORAGE] Erreur d'écriture de {path} ({e}), nouvel essai")
+                time.sleep(self.retry_delay * (2 ** attempt))
+
+    def _sync_batch(self):
+        paths, self._unsynced = self._unsynced, []
+        for path in paths + sorted({os.path.dirname(path) or '.' for path in paths}):
+            try:
+                _fsync_path(path)
+            except OSError as e:
+                logger.info(f"[STORAGE] fsync impossible pour {path}: {e}")
+
+    def get_stats(self):
+        with self.lock:
+            pending = sum(self._pending.values())
+        return {
+            'pending': pending,
+            'max_pending': self.queue.maxsize,
+            'fsync': self.fsync,
+        }
@@ -0,0 +1,510 @@
+import itertools
+import re
+import threading
+import time
+import logging
+from collections import deque
+from metrics_utils import BYTES_BUCKETS, Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+STREAM_SUBSCRIBERS = Gauge('photobooth_stream_subscribers', 'Active /video_stream viewers')
+STREAM_FRAMES_SENT = Counter('photobooth_stream_frames_sent_total', 'Frames delivered to stream viewers')
+STREAM_FRAMES_DROPPED = Counter('photobooth_stream_frames_dropped_total', 'Frames replaced before a slow viewer could take them')
+STREAM_FRAMES_SKIPPED = Counter('photobooth_stream_frames_skipped_total', "Frames skipped on purpose under a viewer's fps cap")
+STREAM_FRAME_BYTES = Histogram('photobooth_stream_frame_bytes', 'Size of the JPEG frames sent to viewers', buckets=BYTES_BUCKETS)
+STREAM_WAIT_SECONDS = Histogram('photobooth_stream_wait_seconds', 'Time a viewer waits for the next frame (hub lock included)')
+STREAM_SEND_SECONDS = Histogram('photobooth_stream_send_seconds', 'Time to hand a frame to the network (server write / client backpressure)')
+
+
+# Renditions nommées de l'aperçu : (hauteur maximale, qualité JPEG)
+RENDITIONS = {
+    'full': (None, None),
+    '1080p': (1080, None),
+    '720p': (720, None),
+    '480p': (480, 75),
+    '360p': (360, 70),
+    '240p': (240, 60),
+}
+
+_RENDITION_RE = re.compile(r'^(?P<name>full|\d+p)?(?:[-_]?q(?P<quality>\d{1,3}))?$')
+
+
+def parse_rendition(value):
+    """Parse a ``rendition`` query value such as ``360p``, ``full``, ``q50`` or ``720p-q60``.
+
+    Returns ``None`` for the default preview, a ``(max_height, quality)`` tuple
+    otherwise, and raises ``ValueError`` for unknown values.
+    """
+    if not value or value == 'preview':
+        return None
+    match = _RENDITION_RE.match(value.lower())
+    if not match:
+        raise ValueError(f"Rendition inconnue: {value}")
+    name, quality = match.group('name'), match.group('quality')
+    if name and name not in RENDITIONS:
+        raise ValueError(f"Rendition inconnue: {value}")
+    max_height, default_quality = RENDITIONS[name] if name else (None, None)
+    if quality is not None:
+        quality = min(max(int(quality), 10), 100)
+    else:
+        quality = default_quality
+    if not name and quality is None:
+        return None
+    return max_height, quality
+
+
+def mjpeg_part(frame):
+    """Wrap a JPEG frame as one part of a multipart/x-mixed-replace response."""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: ' + str(len(frame)).encode() + b'\r\n\r\n' +
+            frame + b'\r\n')
+
+
+class StreamSubscriber:
+    """Cursor over the frames published by a CameraHub.
+
+    The cursor acts as a one-slot "latest frame" mailbox: a reader that falls
+    behind jumps straight to the newest frame, and the frames it missed are
+    counted in ``frames_dropped`` instead of piling up in a queue. Frames
+    published before the next one is due under the fps cap are not a sign of
+    a slow client; they are counted in ``frames_skipped``.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, hub, name=None, max_fps=None, rendition=None):
+        self.hub = hub
+        self.id = next(self._ids)
+        self.name = name
+        self.max_fps = max_fps
+        self.rendition = rendition
+        self.last_seq = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_skipped = 0
+        self._claimed_at = 0.0
+        self.connected_at = time.time()
+        self._next_due = 0.0
+
+    def next_frame(self, timeout=None):
+        """Block until the hub publishes a frame newer than the cursor.
+
+        Returns ``(seq, jpeg_bytes)``, or ``None`` on timeout or when the hub
+        stops. Nothing is delivered while the hub is paused. The JPEG encoding
+        happens here, on demand, once per rendition, and is shared by every
+        subscriber asking for the same rendition.
+        """
+        hub = self.hub
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Limite de débit du client : attendre l'échéance puis prendre la frame la plus récente
+        delay = self.delay()
+        if deadline is not None:
+            delay = min(delay, deadline - time.monotonic())
+        if delay > 0:
+            time.sleep(delay)
+        started = time.perf_counter()
+        with hub.condition:
+            while hub.is_running and (hub.paused or hub.seq <= self.last_seq):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                hub.condition.wait(remaining)
+            item = self._claim()
+        if item is None:
+            return None
+        STREAM_WAIT_SECONDS.observe(time.perf_counter() - started)
+        seq, frame = item
+        return seq, self.encode(frame)
+
+    def delay(self):
+        """Seconds to wait before the next frame is due under the fps cap."""
+        if not self._max_fps():
+            return 0.0
+        return max(self._next_due - time.monotonic(), 0.0)
+
+    def _max_fps(self):
+        # Limite du client, abaissée par le gouverneur CPU pendant les travaux lourds
+        throttle_fps = self.hub.throttle[0]
+        if self.max_fps and throttle_fps:
+            return min(self.max_fps, throttle_fps)
+        return self.max_fps or throttle_fps
+
+    def claim_frame(self):
+        """Non-blocking: take the newest frame if there is one, as ``(seq, Frame)``."""
+        with self.hub.condition:
+            return self._claim()
+
+    def _claim(self):
+        # Appelé avec hub.condition verrouillé
+        hub = self.hub
+        if not hub.is_running or hub.paused or hub.seq <= self.last_seq:
+            return None
+        missed = hub.seq - self.last_seq - 1 if self.last_seq else 0
+        if missed > 0:
+            skipped, dropped = self._split_missed(missed)
+            if skipped:
+                self.frames_skipped += skipped
+                STREAM_FRAMES_SKIPPED.inc(skipped)
+            if dropped:
+                self.frames_dropped += dropped
+                STREAM_FRAMES_DROPPED.inc(dropped)
+        self.last_seq = hub.seq
+        self.frames_sent += 1
+        self._claimed_at = time.monotonic()
+        max_fps = self._max_fps()
+        self._next_due = self._claimed_at + 1.0 / max_fps if max_fps else 0.0
+        return self.last_seq, hub.frame
+
+    def _split_missed(self, missed):
+        """(skipped, dropped): the frames missed since the last claim, split at the fps-cap due time."""
+        # Appelé avec hub.condition verrouillé
+        if self._next_due <= self._claimed_at:
+            # Pas de limite de débit : toute frame manquée l'a été par lenteur
+            return 0, missed
+        hub = self.hub
+        late = in_history = 0
+        oldest = None
+        for frame in hub.history:
+            if frame is hub.frame or frame.published is None or frame.published <= self._claimed_at:
+                continue
+            in_history += 1
+            if oldest is None:
+                oldest = frame.published
+            if frame.published > self._next_due:
+                late += 1
+        # Frames déjà sorties du tampon : plus anciennes que celles qui y restent
+        evicted = missed - in_history
+        if evicted > 0 and (oldest is None or oldest > self._next_due):
+            late += evicted
+        dropped = min(late, missed)
+        return missed - dropped, dropped
+
+    def _rendition_for(self, frame):
+        """Rendition to send, capped by the hub throttle when the frame must be encoded anyway."""
+        _, max_height, quality = self.hub.throttle
+        if frame.image is None or frame.encoded or not (max_height or quality):
+            # Un JPEG déjà encodé (passthrough, libcamera) coûte moins cher tel quel
+            return self.rendition
+        height, own_quality = self.rendition or (None, None)
+        if height is None and frame.preview_size:
+            # Pas de hauteur imposée : rester à la taille de l'aperçu, pas à celle du capteur
+            height = frame.preview_size[1]
+        if max_height:
+            height = min(height or max_height, max_height)
+        if quality:
+            quality = min(own_quality or quality, quality)
+        return height, quality or own_quality
+
+    def needs_encoding(self, frame):
+        """Tell whether ``encode(frame)`` would run the JPEG encoder (not yet cached)."""
+        rendition = self._rendition_for(frame)
+        if rendition is None:
+            return not frame.encoded
+        return not frame.has_rendition(*rendition)
+
+    def encode(self, frame):
+        """JPEG bytes of ``frame`` for this subscriber's rendition."""
+        rendition = self._rendition_for(frame)
+        if rendition is None:
+            data = frame.jpeg()
+        else:
+            data = frame.rendition(*rendition)
+        STREAM_FRAMES_SENT.inc()
+        STREAM_FRAME_BYTES.observe(len(data))
+        return data
+
+    def get_stats(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'max_fps': self.max_fps,
+            'rendition': self.rendition,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'frames_skipped': self.frames_skipped,
+            'connected_for': round(time.time() - self.connected_at, 1),
+        }
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CameraHub:
+    """Own a single camera source and fan its frames out to any number of subscribers.
+
+    The source is started by the first subscriber and kept warm for
+    ``idle_timeout`` seconds after the last one leaves, so page reloads and
+    extra viewers never restart the camera. While paused (slideshow,
+    ``/stop_camera``) frames are still captured but never encoded or sent.
+
+    The most recent frames are kept in a time-indexed ring buffer bounded by
+    ``history_frames`` and ``history_bytes`` so a photo can be taken at the
+    exact moment of the shutter rather than when the request arrives.
+    """
+
+    def __init__(self, source_factory, idle_timeout=10.0, history_frames=30, history_bytes=64 * 1024 * 1024):
+        self.source_factory = source_factory
+        self.idle_timeout = idle_timeout
+        self.history_frames = history_frames
+        self.history_bytes = history_bytes
+        self.history = deque()
+        self.history_size = 0
+        self.source = None
+        self.error = None
+        self.frame = None
+        self.seq = 0
+        self.timestamp = 0.0
+        self.condition = threading.Condition()
+        self.subscribers = set()
+        self.listeners = []
+        self.is_running = False
+        self.paused = False
+        # (fps max, hauteur max, qualité) imposés à tous les spectateurs, voir CpuGovernor
+        self.throttle = (None, None, None)
+        self.thread = None
+        self._start_lock = threading.Lock()
+        self._idle_since = None
+
+    def start(self):
+        with self._start_lock:
+            if self.is_running:
+                return True
+            if self.thread and self.thread is not threading.current_thread():
+                # Laisser l'ancienne source libérer le périphérique
+                self.thread.join(timeout=2.0)
+            logger.info("[HUB] Démarrage de la source caméra partagée...")
+            source = self.source_factory()
+            if not source.start():
+                self.error = source.error or "Impossible de démarrer la caméra"
+                logger.info(f"[HUB] Erreur: {self.error}")
+                source.stop()
+                return False
+            self.source = source
+            self.error = None
+            self._idle_since = time.monotonic()
+            self.is_running = True
+            self.thread = threading.Thread(target=self._pump_loop)
+            self.thread.daemon = True
+            self.thread.start()
+            return True
+
+    def _pump_loop(self):
+        source_seq = 0
+        while self.is_running:
+            # Attendre la frame suivante de la source (pas de polling)
+            item = self.source.wait_frame(source_seq, timeout=1.0)
+            if item is not None:
+                source_seq, frame = item
+                self._publish(frame)
+            elif not self.source.is_running:
+                self.error = self.source.error or "La source caméra s'est arrêtée"
+                logger.info(f"[HUB] {self.error}")
+                break
+            if self._idle_expired():
+                logger.info("[HUB] Aucun spectateur, arrêt de la caméra")
+                break
+        self._shutdown()
+
+    def _publish(self, frame):
+        with self.condition:
+            self.seq += 1
+            frame.published = time.monotonic()
+            self.frame = frame
+            self.timestamp = frame.timestamp
+            self._remember(frame)
+            self.condition.notify_all()
+        self._notify_listeners()
+
+    def add_listener(self, callback):
+        """Call ``callback()`` (from the capture thread) on every state change.
+
+        Used by the asyncio server to wake its viewers without a thread each.
+        """
+        with self.condition:
+            self.listeners = self.listeners + [callback]
+
+    def remove_listener(self, callback):
+        with self.condition:
+            self.listeners = [listener for listener in self.listeners if listener is not callback]
+
+    def _notify_listeners(self):
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.info(f"[HUB] Erreur dans un écouteur: {e}")
+
+    def _remember(self, frame):
+        """Append to the ring buffer, evicting the oldest frames beyond the limits."""
+        # Les JPEG et renditions encodés plus tard sont ajoutés au compte via on_grow
+        frame.history_bytes = frame.nbytes
+        frame.on_grow = self._frame_grew
+        self.history.append(frame)
+        self.history_size += frame.history_bytes
+        self._evict()
+
+    def _frame_grew(self, frame, nbytes):
+        with self.condition:
+            if frame.on_grow is None:
+                # Déjà sortie du tampon
+                return
+            frame.history_bytes += nbytes
+            self.history_size += nbytes
+            self._evict()
+
+    def _evict(self):
+        while self.history and (len(self.history) > self.history_frames or
+                                self.history_size > self.history_bytes):
+            frame = self.history.popleft()
+            frame.on_grow = None
+            self.history_size -= frame.history_bytes
+
+    def _idle_expired(self):
+        with self.condition:
+            if self.subscribers:
+                return False
+            return time.monotonic() - self._idle_since >= self.idle_timeout
+
+    def subscribe(self, name=None, max_fps=None, rendition=None):
+        """Register a new viewer and make sure the source is running."""
+        subscriber = StreamSubscriber(self, name=name, max_fps=max_fps, rendition=rendition)
+        with self.condition:
+            # Une pause (diaporama) dure jusqu'à resume() : un nouveau spectateur ne la lève pas
+            self.subscribers.add(subscriber)
+            STREAM_SUBSCRIBERS.inc()
+            # Le nouveau spectateur reçoit directement la frame courante
+            subscriber.last_seq = self.seq - 1 if self.frame is not None else self.seq
+        if not self.start():
+            self.unsubscribe(subscriber)
+            raise RuntimeError(self.error)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.condition:
+            if subscriber in self.subscribers:
+                self.subscribers.discard(subscriber)
+                STREAM_SUBSCRIBERS.dec()
+            if not self.subscribers:
+                self._idle_since = time.monotonic()
+
+    def subscriber_count(self):
+        with self.condition:
+            return len(self.subscribers)
+
+    def latest_frame(self):
+        """Return the latest Frame (call ``.jpeg()`` for the bytes), or ``None``."""
+        with self.condition:
+            return self.frame
+
+    def frame_at(self, timestamp):
+        """Return the buffered Frame closest to ``timestamp`` (epoch seconds)."""
+        with self.condition:
+            if not self.history:
+                return self.frame
+            frame = min(self.history, key=lambda entry: abs(entry.timestamp - timestamp))
+            return frame
+
+    def capture_still(self, budget=3.0, timestamp=None):
+        """Return full-resolution JPEG bytes for a photo, within ``budget`` seconds.
+
+        With ``timestamp``, the frame closest to that instant is taken from the
+        ring buffer. Falls back to the preview frame if the source cannot
+        produce a still in time.
+        """
+        frame = self.latest_frame() if timestamp is None else self.frame_at(timestamp)
+        source = self.source
+        if source is not None and hasattr(source, 'capture_still'):
+            try:
+                data = source.capture_still(frame, timeout=budget)
+                if data:
+                    return data
+            except Exception as e:
+                logger.info(f"[HUB] Erreur capture haute résolution: {e}")
+        return frame.jpeg() if frame else None
+
+    def set_throttle(self, max_fps=None, max_height=None, quality=None):
+        """Cap every viewer's frame rate, and the size/quality of frames that need encoding."""
+        throttle = (max_fps, max_height, quality)
+        with self.condition:
+            if throttle == self.throttle:
+                return
+            self.throttle = throttle
+        logger.info(f"[HUB] Limites de l'aperçu: fps={max_fps}, hauteur={max_height}, qualité={quality}")
+
+    def pause(self):
+        """Stop delivering (and therefore encoding) frames until resume(), whoever subscribes meanwhile."""
+        with self.condition:
+            self.paused = True
+
+    def resume(self):
+        with self.condition:
+            self.paused = False
+            # Les frames capturées pendant la pause ne comptent pas comme perdues
+            for subscriber in self.subscribers:
+                subscriber.last_seq = max(subscriber.last_seq, self.seq - 1)
+            self.condition.notify_all()
+        self._notify_listeners()
+
+    def get_stats(self):
+        """Hub and source statistics (capture mode, CPU per frame, fps)."""
+        source = self.source
+        with self.condition:
+            subscribers = [subscriber.get_stats() for subscriber in self.subscribers]
+        stats = {
+            'running': self.is_running,
+            'paused': self.paused,
+            'throttle': self.throttle,
+            'subscribers': len(subscribers),
+            'clients': subscribers,
+            'seq': self.seq,
+            'error': self.error,
+            'history_frames': len(self.history),
+            'history_bytes': self.history_size,
+        }
+        if source and hasattr(source, 'get_stats'):
+            stats['source'] = source.get_stats()
+        return stats
+
+    def release(self):
+        """Stop the source right away if nobody is watching."""
+        if self.subscriber_count() == 0:
+            self.stop()
+
+    def _shutdown(self):
+        with self.condition:
+            self.is_running = False
+            self.frame = None
+            # Les encodages tardifs de ces frames ne doivent plus compter dans le tampon
+            for frame in self.history:
+                frame.on_grow = None
+            self.history.clear()
+            self.history_size = 0
+            self.condition.notify_all()
+        self._notify_listeners()
+        source, self.source = self.source, None
+        if source:
+            try:
+                source.stop()
+            except Exception as e:
+                logger.info(f"[HUB] Erreur lors de l'arrêt de la source: {e}")
+
+    def stop(self):
+        with self._start_lock:
+            if not self.is_running:
+                return
+            with self.condition:
+                self.is_running = False
+                self.condition.notify_all()
+            self._notify_listeners()
+            thread = self.thread
+            if thread and thread is not threading.current_thread():
+                thread.join(timeout=2.0)
+            self.thread = None
@@ -1,10 +1,19 @@
 import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from telegram import Bot
 from telegram.error import TelegramError
 
 logger = logging.getLogger(__name__)
 
+# Envois en arrière-plan : pool borné plutôt qu'un thread par photo
+MAX_WORKERS = 2
+MAX_PENDING = 20
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='telegram')
+_pending_lock = threading.Lock()
+_pending = 0
+
 async def _send_telegram_photo(bot_token, chat_id, photo_path, caption):
     bot = Bot(token=bot_token)
     cleaned_chat_id = chat_id.strip()
@@ -49,3 +58,20 @@ def send_to_telegram(photo_path, config, photo_type="photo"):
     except Exception as e:
         logger.info(f"[TELEGRAM] Erreur lors de l'envoi: {e}")
 
+def _send_done(future):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+def submit_to_telegram(photo_path, config, photo_type="photo"):
+    global _pending
+    if not config.get('telegram_enabled', False):
+        return None
+    with _pending_lock:
+        if _pending >= MAX_PENDING:
+            logger.info(f"[TELEGRAM] {_pending} envois en attente, {photo_path} ignorée")
+            return None
+        _pending += 1
+    future = _executor.submit(send_to_telegram, photo_path, config, photo_type)
+    future.add_done_callback(_send_done)
+    return future